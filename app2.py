@@ -1,16 +1,72 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
+from flask import Flask, render_template, stream_template, stream_with_context, request, redirect, url_for, session, flash, abort, g, send_file, send_from_directory
+from flask import before_render_template, template_rendered
+from markupsafe import Markup
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, ModuleLoader, nodes
+from jinja2.ext import Extension
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import json
 import sqlite3
+import queue
+import threading
+import time
+import base64
+import zlib
+import functools
+import atexit
+import random
+import sys
+import io
+import bisect
+import itertools
+import re
+import glob
+import hashlib
+import tempfile
+import shutil
+import mimetypes
+import csv
+import codecs
+import posixpath
+import unicodedata
+import uuid
+import zipfile
+from types import MappingProxyType
+from importlib.metadata import version as package_version
+from collections import Counter, OrderedDict, deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from werkzeug.utils import secure_filename
 import logging
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlencode
+from datetime import datetime, timezone
+from werkzeug.http import is_resource_modified, parse_accept_header
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageOps
 except Exception:
     Image = None
+    ImageOps = None
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    import openpyxl
+except Exception:
+    openpyxl = None
 
 app = Flask(__name__)
 # permitir usar json (e quote_plus se quiser) dentro dos templates
@@ -48,247 +104,2856 @@ except Exception:
     pass
 
 
-@app.context_processor
-def inject_theme():
-    # provide theme dict to all templates
-    return dict(theme=THEME)
+@app.context_processor
+def inject_theme():
+    # provide theme dict to all templates
+    return dict(theme=THEME)
+
+
+def format_price(value):
+    try:
+        v = float(value)
+        # format with two decimals and comma as decimal separator
+        return f"{v:,.2f}".replace(',','X').replace('.',',').replace('X','.')
+    except Exception:
+        return value
+
+
+def build_whatsapp_url(phone, product_name, product_id):
+    if not phone:
+        return '#'
+    phone_digits = ''.join(c for c in str(phone) if c.isdigit())
+    try:
+        product_url = url_for('product_detail', id=product_id, _external=True)
+    except Exception:
+        product_url = url_for('index', _external=True) + f"#product-{product_id}"
+    msg = f"Olá, vim do site e gostaria de saber mais sobre o produto {product_name}. Link: {product_url}"
+    return f"https://api.whatsapp.com/send?phone={phone_digits}&text={quote_plus(msg)}"
+
+@app.context_processor
+def inject_helpers():
+    # format_price deve existir no seu código; mantém a função disponível nos templates
+    return dict(format_price=format_price, whatsapp_link=build_whatsapp_url, img_url=img_url,
+                image_attrs=image_attrs)
+
+UPLOAD_FOLDER_HERO = 'static/uploads/hero'
+UPLOAD_FOLDER_PROD = 'static/uploads/produtos'
+
+app.config['UPLOAD_FOLDER_HERO'] = UPLOAD_FOLDER_HERO
+app.config['UPLOAD_FOLDER_PROD'] = UPLOAD_FOLDER_PROD
+
+# ------------------ MÉTRICAS ------------------
+
+# histogramas de latência (requests, SQL, templates, etapas internas) em /metrics
+app.config['METRICS'] = os.getenv('SOSCOZINHAS_METRICS', '1') != '0'
+# vários workers: cada processo grava os seus números aqui e o /metrics soma todos
+# (limpe o diretório a cada deploy, como o PROMETHEUS_MULTIPROC_DIR)
+app.config['METRICS_DIR'] = os.getenv('SOSCOZINHAS_METRICS_DIR') or None
+app.config['METRICS_FLUSH_SECONDS'] = 5
+# /metrics exige o Bearer token ou admin logado
+app.config['METRICS_TOKEN'] = os.getenv('SOSCOZINHAS_METRICS_TOKEN') or None
+# libera também requests de localhost (scraper na mesma máquina, sem token). Só ligue
+# sem proxy reverso na frente: atrás dele toda request vem de 127.0.0.1
+app.config['METRICS_ALLOW_LOCALHOST'] = os.getenv('SOSCOZINHAS_METRICS_ALLOW_LOCALHOST', '0') == '1'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+# nome -> (tipo, ajuda, buckets)
+METRIC_TYPES = {
+    'http_request_duration_seconds': ('histogram', 'Duração da request até o último byte da resposta.', LATENCY_BUCKETS),
+    'sql_query_duration_seconds': ('histogram', 'Duração de cada statement SQL (execute + leitura das linhas).', SQL_BUCKETS),
+    'sql_rows_total': ('counter', 'Linhas lidas (SELECT) ou alteradas pelos statements.', None),
+    'template_render_seconds': ('histogram', 'Renderização de cada template (em streaming, até o último pedaço).', LATENCY_BUCKETS),
+    'step_duration_seconds': ('histogram', 'Etapas internas: snapshot do catálogo, variantes/srcset, miniaturas.', SQL_BUCKETS + (2.5, 5.0)),
+    'image_job_duration_seconds': ('histogram', 'Job de variantes de imagem, da submissão ao resultado gravado.', LATENCY_BUCKETS + (30.0, 60.0)),
+}
+
+
+class Metrics:
+    """Histogramas e contadores em memória: um lock e um bisect por observação,
+    barato para ficar ligado em produção. Com METRICS_DIR cada processo grava os
+    seus a cada METRICS_FLUSH_SECONDS num arquivo próprio e o /metrics de
+    qualquer worker soma todos (arquivos de processos encerrados continuam
+    contando: contadores do Prometheus não podem diminuir)."""
+
+    def __init__(self):
+        # reentrante: o __del__ de um cursor (observe) pode rodar no meio de um `with self._lock`
+        self._lock = threading.RLock()
+        self._series = {}
+        self._pid = os.getpid()
+        self._path = None
+        self._flushed_at = 0.0
+
+    def observe(self, name, value, **labels):
+        buckets = METRIC_TYPES[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect.bisect_left(buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def _local(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # gunicorn --preload: o worker não herda os números do master
+                self._series, self._path, self._pid = {}, None, os.getpid()
+            return {k: ([list(v[0]), v[1], v[2]] if isinstance(v, list) else v) for k, v in self._series.items()}
+
+    def flush(self, force=False):
+        metrics_dir = app.config['METRICS_DIR']
+        now = time.monotonic()
+        if not metrics_dir or (not force and now - self._flushed_at < app.config['METRICS_FLUSH_SECONDS']):
+            return
+        self._flushed_at = now
+        series = self._local()
+        if self._path is None:
+            os.makedirs(metrics_dir, exist_ok=True)
+            self._path = os.path.join(metrics_dir, f'{os.getpid()}-{int(time.time())}.json')
+        tmp_path = f'{self._path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump([[name, labels, value] for (name, labels), value in series.items()], f)
+        os.replace(tmp_path, self._path)
+
+    def collect(self):
+        """Séries deste processo somadas às gravadas pelos outros."""
+        total = self._local()
+        metrics_dir = app.config['METRICS_DIR']
+        if not metrics_dir:
+            return total
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            if path == self._path:
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in entries:
+                if name not in METRIC_TYPES:
+                    continue
+                key = (name, tuple(tuple(kv) for kv in labels))
+                mine = total.get(key)
+                if mine is None:
+                    total[key] = value
+                elif isinstance(mine, list):
+                    if len(mine[0]) == len(value[0]):  # buckets de outra versão do código: ignora
+                        total[key] = [[a + b for a, b in zip(mine[0], value[0])], mine[1] + value[1], mine[2] + value[2]]
+                else:
+                    total[key] = mine + value
+        return total
+
+    def summary(self, name, group_by):
+        """Histograma `name` somado por alguns labels: [{label..., count, total,
+        mean, p95}]. O p95 é o limite do bucket onde cai (None: acima do último)."""
+        buckets = METRIC_TYPES[name][2] + (None,)
+        groups = {}
+        for (series_name, labels), value in self.collect().items():
+            if series_name != name:
+                continue
+            key = tuple(dict(labels).get(k, '') for k in group_by)
+            acc = groups.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            acc[0] = [a + b for a, b in zip(acc[0], value[0])]
+            acc[1] += value[1]
+            acc[2] += value[2]
+        out = []
+        for key, (counts, total, count) in groups.items():
+            cumulative, p95 = 0, buckets[-1]
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                if cumulative >= 0.95 * count:
+                    p95 = bound
+                    break
+            out.append(dict(zip(group_by, key), count=count, total=total, mean=total / count if count else 0.0, p95=p95))
+        return out
+
+    def render(self):
+        """Formato texto do Prometheus (exposition format 0.0.4)."""
+        by_name = {}
+        for (name, labels), value in self.collect().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text, buckets = METRIC_TYPES[name]
+            full = f'soscozinhas_{name}'
+            lines += [f'# HELP {full} {help_text}', f'# TYPE {full} {kind}']
+            for labels, value in sorted(by_name[name]):
+                if kind == 'counter':
+                    lines.append(f'{full}{_prom_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), value[0]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{full}_bucket{_prom_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{full}_sum{_prom_labels(labels)} {value[1]}')
+                lines.append(f'{full}_count{_prom_labels(labels)} {value[2]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+metrics = Metrics()
+# o que ainda não foi gravado pelo flush periódico
+atexit.register(lambda: metrics.flush(force=True))
+
+
+class StepTimer:
+    """Context manager ou decorador: observa a duração em
+    step_duration_seconds{step=...}."""
+    __slots__ = ('step', 'started')
+
+    def __init__(self, step):
+        self.step = step
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if app.config['METRICS']:
+            metrics.observe('step_duration_seconds', time.perf_counter() - self.started, step=self.step)
+
+    def __call__(self, fn):
+        step = self.step
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if app.config['METRICS']:
+                    metrics.observe('step_duration_seconds', time.perf_counter() - started, step=step)
+        return wrapper
+
+
+_SQL_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+["\[`]?(\w+)', re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def _sql_labels(sql):
+    # (operação, primeira tabela): cardinalidade limitada, ao contrário do SQL inteiro
+    words = sql.split(None, 1)
+    op = words[0].upper() if words else ''
+    m = _SQL_TABLE_RE.search(sql) if op in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH') else None
+    return op, (m.group(1) if m else '')
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mede cada statement: o execute mais as leituras das linhas, até
+    esgotar, fechar, ser descartado ou receber o próximo execute (o SQLite
+    executa a query aos poucos, conforme as linhas são lidas)."""
+    _sql = None
+    _elapsed = 0.0
+    _rows = 0
+
+    def _done(self):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        op, table = _sql_labels(sql)
+        metrics.observe('sql_query_duration_seconds', self._elapsed, op=op, table=table)
+        if app.config['PROFILER']:
+            profiler.note_query(sql, self._elapsed)
+        rows = self._rows if self.description is not None else max(self.rowcount, 0)
+        if rows:
+            metrics.inc('sql_rows_total', rows, op=op, table=table)
+
+    def _timed_execute(self, method, sql, parameters):
+        self._done()
+        started = time.perf_counter()
+        try:
+            method(sql, parameters)
+        finally:
+            self._sql, self._rows, self._elapsed = sql, 0, time.perf_counter() - started
+        if self.description is None:
+            # INSERT/UPDATE/DDL: nada para ler, o statement termina aqui
+            self._done()
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._timed_execute(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed_execute(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - started
+        if row is None:
+            self._done()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        if not rows:
+            self._done()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        self._done()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - started
+            self._done()
+            raise
+        self._elapsed += time.perf_counter() - started
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._done()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._done()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # os atalhos do sqlite3 criam um Cursor comum direto em C: refeitos via cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+@app.before_request
+def _metrics_request_started():
+    g.metrics_started = time.perf_counter()
+
+
+@app.after_request
+def _metrics_request_finished(response):
+    started = g.pop('metrics_started', None)
+    if started is None or not app.config['METRICS']:
+        return response
+    labels = dict(endpoint=request.endpoint or 'none', method=request.method, status=str(response.status_code))
+
+    def finished():
+        # no close da resposta: inclui o corpo em streaming (index, API) e a compressão
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started, **labels)
+        metrics.flush()
+    response.call_on_close(finished)
+    return response
+
+
+@before_render_template.connect_via(app)
+def _metrics_template_started(sender, template, context, **extra):
+    g.setdefault('metrics_templates', {})[template.name] = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def _metrics_template_finished(sender, template, context, **extra):
+    started = g.get('metrics_templates', {}).pop(template.name, None)
+    if started is not None and app.config['METRICS']:
+        metrics.observe('template_render_seconds', time.perf_counter() - started, template=template.name)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    allowed = (session.get('admin')
+               or (token and request.headers.get('Authorization', '') == f'Bearer {token}')
+               or (app.config['METRICS_ALLOW_LOCALHOST'] and request.remote_addr in ('127.0.0.1', '::1')))
+    if not allowed:
+        abort(404)
+    metrics.flush(force=True)
+    resp = app.response_class(metrics.render(), mimetype='text/plain')
+    resp.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    resp.cache_control.no_store = True
+    return resp
+
+
+# ------------------ PROFILER ------------------
+
+# amostragem das pilhas de requests lentas, vista em /admin/perf (desligada por padrão)
+app.config['PROFILER'] = os.getenv('SOSCOZINHAS_PROFILER', '0') == '1'
+# fração das requests acompanhadas (cada uma custa uma leitura de pilha por intervalo)
+app.config['PROFILER_SAMPLE_RATE'] = float(os.getenv('SOSCOZINHAS_PROFILER_SAMPLE_RATE', '0.1') or 0)
+app.config['PROFILER_INTERVAL_MS'] = float(os.getenv('SOSCOZINHAS_PROFILER_INTERVAL_MS', '5') or 5)
+# só guarda o perfil das requests acima disso
+app.config['PROFILER_SLOW_MS'] = float(os.getenv('SOSCOZINHAS_PROFILER_SLOW_MS', '250') or 0)
+app.config['PROFILER_MAX_PROFILES'] = 50
+# statements distintos acompanhados na lista de queries mais lentas
+app.config['PROFILER_MAX_QUERIES'] = 500
+app.config['PROFILER_TOP_N'] = 10
+
+
+def _short_path(filename):
+    # caminhos curtos nas pilhas: relativo ao projeto ou a partir do site-packages
+    if filename.startswith(app.root_path):
+        return os.path.relpath(filename, app.root_path)
+    head, sep, tail = filename.rpartition('site-packages' + os.sep)
+    return tail if sep else os.path.basename(filename)
+
+
+class SamplingProfiler:
+    """Uma thread acorda a cada PROFILER_INTERVAL_MS e lê (sys._current_frames)
+    a pilha das threads atendendo requests sorteadas. O perfil das que passam
+    de PROFILER_SLOW_MS vai para um buffer circular; o das demais é descartado.
+    Sem request acompanhada a thread fica parada. Também guarda, por statement,
+    as durações do SQL (ver InstrumentedCursor)."""
+
+    def __init__(self):
+        # reentrante: o __del__ de um cursor (note_query) pode rodar no meio de um `with self._lock`
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._active = {}
+        self._thread = None
+        self._ids = itertools.count(1)
+        self._frame_names = {}
+        self.profiles = deque(maxlen=app.config['PROFILER_MAX_PROFILES'])
+        self.queries = {}
+
+    def begin(self):
+        """Passa a amostrar a thread atual; None se a request não foi sorteada."""
+        if random.random() >= app.config['PROFILER_SAMPLE_RATE']:
+            return None
+        profile = {'thread': threading.get_ident(), 'samples': Counter(), 'started': time.perf_counter()}
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                # também depois de um fork (a thread do pai não existe no filho)
+                self._thread = threading.Thread(target=self._run, name='soscozinhas-profiler', daemon=True)
+                self._thread.start()
+            self._active[profile['thread']] = profile
+            self._wakeup.notify()
+        return profile
+
+    def end(self, profile, **info):
+        duration_ms = (time.perf_counter() - profile['started']) * 1000
+        with self._lock:
+            if self._active.get(profile['thread']) is profile:
+                del self._active[profile['thread']]
+            if duration_ms >= app.config['PROFILER_SLOW_MS'] and profile['samples']:
+                profile.update(info, id=next(self._ids), duration_ms=duration_ms, when=datetime.now(),
+                               interval_ms=app.config['PROFILER_INTERVAL_MS'])
+                self.profiles.append(profile)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+            time.sleep(app.config['PROFILER_INTERVAL_MS'] / 1000.0)
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.items())
+            # as pilhas são montadas fora do lock; as referências aos frames soltas logo depois
+            stacks = [(profile, self._stack(frames[ident])) for ident, profile in active if ident in frames]
+            del frames
+            with self._lock:
+                for profile, stack in stacks:
+                    profile['samples'][stack] += 1
+
+    def _stack(self, frame):
+        # da raiz para a folha, uma entrada por função (não por linha: agrupa melhor no flamegraph)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            name = self._frame_names.get(code)
+            if name is None:
+                name = self._frame_names[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+            names.append(name)
+            frame = frame.f_back
+        return tuple(reversed(names))
+
+    def note_query(self, sql, elapsed):
+        with self._lock:
+            stats = self.queries.get(sql)
+            if stats is None:
+                if len(self.queries) >= app.config['PROFILER_MAX_QUERIES']:
+                    return
+                stats = self.queries[sql] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+    def top_queries(self, n):
+        with self._lock:
+            items = [(' '.join(sql.split()), count, total, worst) for sql, (count, total, worst) in self.queries.items()]
+        items.sort(key=lambda q: q[3], reverse=True)
+        return [dict(sql=sql, count=count, total=total, mean=total / count, max=worst) for sql, count, total, worst in items[:n]]
+
+    def list(self):
+        with self._lock:
+            return [dict(p, samples=sum(p['samples'].values())) for p in reversed(self.profiles)]
+
+    def _selected(self, profile_id):
+        with self._lock:
+            return [dict(p, samples=Counter(p['samples'])) for p in self.profiles
+                    if profile_id is None or p['id'] == profile_id]
+
+    def collapsed(self, profile_id=None):
+        """Formato "pilha;separada;por;ponto-e-vírgula contagem" (flamegraph.pl, speedscope, inferno)."""
+        lines = Counter()
+        for p in self._selected(profile_id):
+            root = f"{p['method']} {p['endpoint']}"
+            for stack, n in p['samples'].items():
+                lines[';'.join((root,) + stack)] += n
+        return ''.join(f'{stack} {n}\n' for stack, n in lines.most_common())
+
+    def speedscope(self, profile_id=None):
+        """Arquivo do speedscope.app: um perfil "sampled" por request lenta."""
+        frames, index, profiles = [], {}, []
+        for p in self._selected(profile_id):
+            samples, weights = [], []
+            for stack, n in p['samples'].items():
+                ids = []
+                for name in stack:
+                    if name not in index:
+                        index[name] = len(frames)
+                        frames.append({'name': name})
+                    ids.append(index[name])
+                samples.append(ids)
+                weights.append(n * p['interval_ms'])
+            profiles.append({'type': 'sampled', 'name': f"{p['method']} {p['url']} ({p['duration_ms']:.0f} ms)",
+                             'unit': 'milliseconds', 'startValue': 0, 'endValue': sum(weights),
+                             'samples': samples, 'weights': weights})
+        return {'$schema': 'https://www.speedscope.app/file-format-schema.json', 'shared': {'frames': frames},
+                'profiles': profiles, 'name': 'soscozinhas', 'exporter': 'soscozinhas', 'activeProfileIndex': 0}
+
+
+profiler = SamplingProfiler()
+
+
+@app.before_request
+def _profiler_request_started():
+    if app.config['PROFILER']:
+        g.profile = profiler.begin()
+
+
+@app.after_request
+def _profiler_request_finished(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        info = dict(endpoint=request.endpoint or 'none', method=request.method, status=response.status_code,
+                    url=request.full_path.rstrip('?'))
+        # no close: o corpo em streaming ainda é gerado depois do after_request
+        response.call_on_close(lambda: profiler.end(profile, **info))
+    return response
+
+
+# ------------------ BANCO DE DADOS ------------------
+
+app.config['DATABASE'] = os.getenv('SOSCOZINHAS_DB', 'database.db')
+# conexões mantidas abertas no pool (por processo); acima disso get_db() espera
+app.config['DB_POOL_SIZE'] = int(os.getenv('SOSCOZINHAS_DB_POOL_SIZE', '8') or 8)
+# ms que uma conexão espera por um lock de escrita antes de SQLITE_BUSY
+app.config['DB_BUSY_TIMEOUT_MS'] = int(os.getenv('SOSCOZINHAS_DB_BUSY_TIMEOUT_MS', '5000') or 5000)
+
+DB_PRAGMAS = (
+    # WAL: leitores continuam lendo o catálogo enquanto o admin grava
+    'PRAGMA journal_mode=WAL',
+    # em WAL, NORMAL só faz fsync no checkpoint (seguro contra crash da app)
+    'PRAGMA synchronous=NORMAL',
+    # ~8MB de cache de páginas por conexão (valor negativo = KiB)
+    'PRAGMA cache_size=-8000',
+    'PRAGMA mmap_size=67108864',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+def connect_db(path=None):
+    """Abre uma conexão nova já configurada (pragmas + busy timeout).
+    Use get_db() dentro de requests; connect_db() é para scripts e init_db()."""
+    busy_ms = app.config['DB_BUSY_TIMEOUT_MS']
+    factory = InstrumentedConnection if app.config['METRICS'] else sqlite3.Connection
+    conn = sqlite3.connect(path or app.config['DATABASE'], timeout=busy_ms / 1000.0, check_same_thread=False,
+                           factory=factory)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout={int(busy_ms)}')
+    for pragma in DB_PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except sqlite3.OperationalError:
+            # ex.: mmap indisponível na plataforma; segue com o default
+            pass
+    return conn
+
+
+class ConnectionPool:
+    """Pool limitado de conexões SQLite reutilizadas entre requests.
+    Cada request pega uma conexão (get_db) e a devolve no teardown."""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _reset_after_fork(self):
+        # conexões sqlite não podem ser compartilhadas entre processos (gunicorn --preload)
+        if self._pid != os.getpid():
+            with self._lock:
+                self._idle = queue.LifoQueue()
+                self._created = 0
+                self._pid = os.getpid()
+
+    def acquire(self):
+        self._reset_after_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return connect_db(self.path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # pool cheio: espera alguém devolver uma conexão
+        timeout = app.config['DB_BUSY_TIMEOUT_MS'] / 1000.0
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('database pool exhausted')
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            # nunca devolver ao pool uma transação aberta (ex.: exceção no meio da rota)
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _db_pool
+    if _db_pool is None or _db_pool.path != app.config['DATABASE']:
+        with _db_pool_lock:
+            if _db_pool is None or _db_pool.path != app.config['DATABASE']:
+                if _db_pool is not None:
+                    _db_pool.close_all()
+                _db_pool = ConnectionPool(app.config['DATABASE'], app.config['DB_POOL_SIZE'])
+    return _db_pool
+
+
+def get_db():
+    """Conexão do request atual (uma por app context, vinda do pool).
+    É devolvida automaticamente ao pool no teardown; não chame close()."""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def _table_columns(cursor, table):
+    return [r[1] for r in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _add_column(cursor, table, column, decl):
+    # bancos antigos podem já ter a coluna (criada pelo init_db anterior às migrações)
+    if column not in _table_columns(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _migration_001_base_schema(cursor):
+    # schema original (o que o init_db antigo garantia a cada boot)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS admin (id INTEGER PRIMARY KEY, username TEXT, password TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS produtos (id INTEGER PRIMARY KEY, nome TEXT, descricao TEXT, preco REAL, imagem TEXT, ativo INTEGER DEFAULT 1)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS hero_banners (
+                        id INTEGER PRIMARY KEY, titulo TEXT, descricao1 TEXT, descricao2 TEXT, imagem TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS contato (id INTEGER PRIMARY KEY, whatsapp TEXT)''')
+    _add_column(cursor, 'contato', 'instagram', 'TEXT')
+    _add_column(cursor, 'contato', 'endereco', 'TEXT')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS classes (id INTEGER PRIMARY KEY, nome TEXT)''')
+    _add_column(cursor, 'produtos', 'class_id', 'INTEGER')
+    # JSON com as variantes de imagem
+    _add_column(cursor, 'produtos', 'imagem_variants', 'TEXT')
+    _add_column(cursor, 'hero_banners', 'imagem_variants', 'TEXT')
+    _add_column(cursor, 'hero_banners', 'show_overlay', 'INTEGER DEFAULT 1')
+    _add_column(cursor, 'hero_banners', 'show_button', 'INTEGER DEFAULT 1')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS faq (id INTEGER PRIMARY KEY, pergunta TEXT, resposta TEXT)''')
+    # Default admin (store hashed password). If an admin exists in plaintext, migrate it.
+    admin_row = cursor.execute("SELECT * FROM admin").fetchone()
+    if not admin_row:
+        hashed = generate_password_hash('admin123')  # trocar senha inicial em produção
+        cursor.execute("INSERT INTO admin (username, password) VALUES (?, ?)", ('admin', hashed))
+    else:
+        pwd = admin_row['password'] or ''
+        if pwd and not (pwd.startswith('pbkdf2:') or pwd.startswith('scrypt:') or pwd.startswith('$2b$') or pwd.startswith('$argon2')):
+            cursor.execute("UPDATE admin SET password=? WHERE id=?", (generate_password_hash(pwd), admin_row['id']))
+    # Default contato (insert a record if table empty)
+    if not cursor.execute("SELECT 1 FROM contato LIMIT 1").fetchone():
+        cursor.execute("INSERT INTO contato (whatsapp, instagram, endereco) VALUES (?,?,?)", ('5511999999999','',''))
+
+
+def _migration_002_catalog_indexes(cursor):
+    # vitrine: filtro por classe ordenado por id, e ordenação por preço
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_produtos_ativo_class_id ON produtos(ativo, class_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_produtos_ativo_preco ON produtos(ativo, preco)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_classes_nome ON classes(nome)')
+
+
+
+def _migration_003_catalog_version(cursor):
+    # contador incrementado por toda escrita do admin que afeta a vitrine;
+    # é assim que os outros processos (workers) sabem que o snapshot ficou velho
+    cursor.execute('''CREATE TABLE IF NOT EXISTS catalog_version (
+                        id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)''')
+    cursor.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)')
+
+
+
+def _migration_004_keyset_indexes(cursor):
+    # paginação keyset por preço dentro de uma classe; o id (rowid) já vai
+    # implícito no fim de todo índice, então cobre ORDER BY preco, id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_produtos_ativo_class_preco ON produtos(ativo, class_id, preco)')
+    # "mais recentes" sem filtro de classe: ativo=1 ORDER BY id DESC sem ordenar em memória
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_produtos_ativo_id ON produtos(ativo, id)')
+
+
+
+def _migration_005_produtos_fts(cursor):
+    # índice de busca (FTS5) sobre nome/descricao, sem acentos: "cacarola" acha "Caçarola".
+    # Tabela de conteúdo externo (não duplica o texto), mantida pelos triggers.
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+                            nome, descricao, content='produtos', content_rowid='id',
+                            tokenize='unicode61 remove_diacritics 2')''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sem FTS5: a busca continua usando LIKE
+        logging.warning('FTS5 indisponível, busca de produtos usará LIKE: %s', e)
+        return
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos BEGIN
+                        INSERT INTO produtos_fts (rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos BEGIN
+                        INSERT INTO produtos_fts (produtos_fts, rowid, nome, descricao) VALUES ('delete', old.id, old.nome, old.descricao);
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS produtos_fts_au AFTER UPDATE OF nome, descricao ON produtos BEGIN
+                        INSERT INTO produtos_fts (produtos_fts, rowid, nome, descricao) VALUES ('delete', old.id, old.nome, old.descricao);
+                        INSERT INTO produtos_fts (rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+                      END''')
+    cursor.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')")
+
+
+
+def _migration_006_image_jobs(cursor):
+    # fila persistente de geração de variantes (sobrevive a restart)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS image_jobs (
+                        id INTEGER PRIMARY KEY, kind TEXT NOT NULL, target_id INTEGER NOT NULL,
+                        src_path TEXT NOT NULL, dest_dir TEXT NOT NULL, base_name TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, error TEXT,
+                        created_at REAL, claimed_at REAL, finished_at REAL)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_status ON image_jobs(status, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_target ON image_jobs(kind, target_id, id)')
+    # NULL = imagem pronta; 'pending' enquanto a fila gera as variantes; 'error' se falhou
+    _add_column(cursor, 'produtos', 'imagem_status', 'TEXT')
+
+
+
+def _migration_007_image_store(cursor):
+    # store de imagens por hash do conteúdo; refcount mantido pelos triggers abaixo
+    cursor.execute('''CREATE TABLE IF NOT EXISTS images (
+                        hash TEXT PRIMARY KEY, path TEXT NOT NULL, variants TEXT, bytes INTEGER,
+                        refcount INTEGER NOT NULL DEFAULT 0, created_at REAL, last_used_at REAL)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_refcount ON images(refcount)')
+    _add_column(cursor, 'produtos', 'imagem_hash', 'TEXT')
+    _add_column(cursor, 'hero_banners', 'imagem_hash', 'TEXT')
+    _add_column(cursor, 'image_jobs', 'image_hash', 'TEXT')
+    for table in ('produtos', 'hero_banners'):
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS images_ref_{table}_ai AFTER INSERT ON {table} BEGIN
+                            UPDATE images SET refcount = refcount + 1 WHERE hash = new.imagem_hash;
+                          END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS images_ref_{table}_ad AFTER DELETE ON {table} BEGIN
+                            UPDATE images SET refcount = refcount - 1 WHERE hash = old.imagem_hash;
+                          END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS images_ref_{table}_au AFTER UPDATE OF imagem_hash ON {table}
+                          WHEN old.imagem_hash IS NOT new.imagem_hash BEGIN
+                            UPDATE images SET refcount = refcount - 1 WHERE hash = old.imagem_hash;
+                            UPDATE images SET refcount = refcount + 1 WHERE hash = new.imagem_hash;
+                          END''')
+
+
+
+def _migration_008_variant_profiles(cursor):
+    # images.variants passa a ser {perfil: variantes}; até aqui só existia o perfil de produto
+    cursor.execute("UPDATE images SET variants = json_object('produto', json(variants)) WHERE variants IS NOT NULL")
+    _add_column(cursor, 'hero_banners', 'imagem_status', 'TEXT')
+
+
+def _migration_009_image_meta(cursor):
+    # dimensões, placeholder (LQIP) e cor dominante: {"w", "h", "lqip", "cor"}
+    _add_column(cursor, 'images', 'meta', 'TEXT')
+    _add_column(cursor, 'produtos', 'imagem_meta', 'TEXT')
+    _add_column(cursor, 'hero_banners', 'imagem_meta', 'TEXT')
+
+
+def _migration_010_catalog_updated_at(cursor):
+    # quando a versão mudou pela última vez (Last-Modified das páginas públicas);
+    # o trigger cobre qualquer incremento, inclusive os da fila de imagens e scripts
+    _add_column(cursor, 'catalog_version', 'updated_at', 'REAL')
+    cursor.execute("UPDATE catalog_version SET updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE updated_at IS NULL")
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS catalog_version_touch AFTER UPDATE OF version ON catalog_version BEGIN
+                        UPDATE catalog_version SET updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = new.id;
+                      END''')
+
+
+def _migration_011_bulk_import(cursor):
+    # código do fornecedor: chave do upsert na importação em lote (NULL = produto sem sku)
+    _add_column(cursor, 'produtos', 'sku', 'TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_sku ON produtos(sku)')
+    # progresso gravado a cada lote, na mesma transação: permite retomar depois de uma falha
+    cursor.execute('''CREATE TABLE IF NOT EXISTS import_jobs (
+                        id INTEGER PRIMARY KEY, filename TEXT, file_hash TEXT, src_path TEXT NOT NULL, images_path TEXT,
+                        status TEXT NOT NULL DEFAULT 'pending', rows_done INTEGER NOT NULL DEFAULT 0,
+                        inserted INTEGER NOT NULL DEFAULT 0, updated INTEGER NOT NULL DEFAULT 0,
+                        error_count INTEGER NOT NULL DEFAULT 0, errors TEXT, message TEXT,
+                        created_at REAL, updated_at REAL, finished_at REAL)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_hash ON import_jobs(file_hash, id)')
+
+
+def _migration_012_image_job_dedup(cursor):
+    # um job por (imagem, perfil) na fila; o resultado é gravado em todos os registros com o hash
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_hash ON image_jobs(image_hash, kind, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_produtos_imagem_hash ON produtos(imagem_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_hero_banners_imagem_hash ON hero_banners(imagem_hash)')
+
+
+# Migrações versionadas por PRAGMA user_version: a migração N leva o banco
+# da versão N-1 para N. Só acrescente no final; nunca reordene nem edite
+# uma migração já publicada.
+MIGRATIONS = [
+    _migration_001_base_schema,
+    _migration_002_catalog_indexes,
+    _migration_003_catalog_version,
+    _migration_004_keyset_indexes,
+    _migration_005_produtos_fts,
+    _migration_006_image_jobs,
+    _migration_007_image_store,
+    _migration_008_variant_profiles,
+    _migration_009_image_meta,
+    _migration_010_catalog_updated_at,
+    _migration_011_bulk_import,
+    _migration_012_image_job_dedup,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def init_db():
+    """Aplica as migrações pendentes numa única transação.
+    Num banco já migrado custa só uma leitura de PRAGMA user_version."""
+    conn = connect_db()
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        cursor = conn.cursor()
+        # IMMEDIATE: se vários workers sobem juntos, só um migra; os outros esperam o lock
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            for step, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(cursor)
+                logging.info('database migrated to version %s (%s)', step, migration.__name__)
+            # user_version faz parte do cabeçalho do banco, então é transacional
+            cursor.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+
+
+VARIANT_WIDTHS = [480, 768, 1024, 1440, 1920, 2560]
+# teto de memória para decodificar a fonte (bytes de pixels já decodificados);
+# JPEGs maiores são reduzidos no próprio decode (draft), outros formatos são recusados
+app.config['IMAGE_MAX_DECODE_MB'] = int(os.getenv('SOSCOZINHAS_IMAGE_MAX_DECODE_MB', '256') or 256)
+
+# orientações EXIF que trocam largura e altura (rotação de 90/270 graus)
+_EXIF_TRANSPOSED = (5, 6, 7, 8)
+
+
+def _open_for_variants(src_path, max_width):
+    """Abre a fonte já reduzida o suficiente para a maior variante, respeitando a
+    orientação EXIF e o limite de memória. Retorna uma imagem RGB carregada."""
+    im = Image.open(src_path)
+    orientation = im.getexif().get(0x0112, 1)
+    # tamanho "de exibição" (após aplicar o EXIF)
+    disp_w, disp_h = (im.height, im.width) if orientation in _EXIF_TRANSPOSED else im.size
+    target_w = min(max_width, disp_w)
+    target_h = max(1, round(target_w * disp_h / disp_w))
+    if im.format == 'JPEG':
+        # decodifica na escala DCT (1/2, 1/4, 1/8) mais próxima que ainda cobre a maior variante
+        req = (target_h, target_w) if orientation in _EXIF_TRANSPOSED else (target_w, target_h)
+        im.draft('RGB', req)
+    bands = len(im.getbands())
+    decode_mb = im.width * im.height * max(bands, 3) / (1024 * 1024)
+    if decode_mb > app.config['IMAGE_MAX_DECODE_MB']:
+        im.close()
+        raise ValueError(f'imagem grande demais para processar ({im.width}x{im.height}, ~{decode_mb:.0f}MB decodificada)')
+    im = ImageOps.exif_transpose(im)
+    if im.mode != 'RGB':
+        im = im.convert('RGB')
+    return im
+
+
+def _downscale(im, width):
+    """Reduz para `width` mantendo a proporção: reduce() inteiro (barato) até
+    perto do alvo e LANCZOS só no restante."""
+    height = max(1, round(width * im.height / im.width))
+    factor = im.width // width
+    if factor >= 2:
+        im = im.reduce(factor)
+    if im.size != (width, height):
+        im = im.resize((width, height), Image.LANCZOS)
+    return im
+
+
+# perfil -> larguras e formatos gerados (formato -> parâmetros do encoder do Pillow).
+# A ordem dos formatos é a ordem de preferência nos <source> do <picture>.
+VARIANT_PROFILES = {
+    # grade do catálogo: AVIF primeiro, WebP e JPEG de fallback (JPEG é o <img src> universal)
+    'produto': {'widths': VARIANT_WIDTHS, 'formats': {'avif': {'quality': 55, 'speed': 6},
+                                                      'webp': {'quality': 85, 'method': 6},
+                                                      'jpeg': {'quality': 82, 'optimize': True, 'progressive': True}}},
+    # banner ocupa a tela inteira: qualidade maior e AVIF (bem menor que WebP nessa faixa)
+    'hero': {'widths': VARIANT_WIDTHS, 'formats': {'avif': {'quality': 60, 'speed': 6},
+                                                   'webp': {'quality': 90, 'method': 6}}},
+}
+IMAGE_FORMATS = {
+    # formato -> (formato do Pillow, extensão, content-type)
+    'avif': ('AVIF', 'avif', 'image/avif'),
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+# formatos aceitos por qualquer navegador, em ordem: usados no <img src>/srcset e
+# quando o cliente não anuncia suporte a nenhum formato melhor
+FALLBACK_FORMATS = ('jpeg', 'webp')
+
+
+def _encoder_available(fmt):
+    # Image.SAVE só fica completo depois de Image.init() (plugins carregados sob demanda)
+    try:
+        Image.init()
+        return IMAGE_FORMATS[fmt][0] in Image.SAVE
+    except Exception:
+        return False
+
+
+# placeholder embutido no HTML: lado maior em px (o navegador amplia e suaviza)
+LQIP_SIZE = 16
+
+
+def image_placeholder(im):
+    """LQIP (data URI WebP minúsculo, ~100-200 bytes) e cor dominante de `im`."""
+    small = im.copy()
+    small.thumbnail((64, 64))
+    # cor dominante: a mais frequente depois de reduzir para poucas cores
+    quant = small.quantize(colors=5)
+    palette = quant.getpalette()
+    count, index = max(quant.getcolors())
+    cor = '#{:02x}{:02x}{:02x}'.format(*palette[index * 3:index * 3 + 3])
+    small.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    buf = io.BytesIO()
+    small.save(buf, 'WEBP', quality=40)
+    return {'lqip': 'data:image/webp;base64,' + base64.b64encode(buf.getvalue()).decode('ascii'), 'cor': cor}
+
+
+def compute_image_meta(src_path, max_width=max(VARIANT_WIDTHS)):
+    """Só o meta ({w, h, lqip, cor}) de uma imagem, sem gerar variantes (ex.: backfill)."""
+    im = _open_for_variants(src_path, max_width)
+    if im.width > max_width:
+        im = _downscale(im, max_width)
+    return dict(w=im.width, h=im.height, **image_placeholder(im))
+
+
+def generate_image_variants(src_path, dest_dir, base_name, reuse_existing=False, profile='produto', with_meta=False):
+    """
+    Generate image variants for `profile` (see VARIANT_PROFILES), never upscaling.
+    Returns dict {format: {width: relative_path}} (ex.: {'webp': {'480': 'uploads/...-480.webp'}})
+    with_meta: returns (variants, meta) instead, meta = {'w', 'h' (maior variante), 'lqip', 'cor'}
+    dest_dir: absolute path to folder under static (e.g., static/uploads/produtos)
+    base_name: name without extension (e.g., 'copos')
+    Pipeline em cascata: decodifica uma vez (JPEG já reduzido via draft) e gera
+    da maior para a menor, cada variante a partir da anterior.
+    reuse_existing: não regrava variantes que já existem no disco (nomes do
+    store são o hash do conteúdo, então um arquivo existente já está correto).
+    """
+    if Image is None:
+        raise RuntimeError('Pillow is required to generate image variants. Install with pip install Pillow')
+    spec = VARIANT_PROFILES[profile]
+    formats = {fmt: params for fmt, params in spec['formats'].items() if _encoder_available(fmt)}
+    if not formats:
+        raise RuntimeError(f'Pillow sem encoder para nenhum formato do perfil {profile!r}')
+    variants = {fmt: {} for fmt in formats}
+    os.makedirs(dest_dir, exist_ok=True)
+    im = _open_for_variants(src_path, max(spec['widths']))
+    rel_dir = os.path.relpath(dest_dir, 'static')
+    current = im
+    done = set()
+    size = None
+    for w in sorted(spec['widths'], reverse=True):
+        # avoid upscaling: if desired width > original width, use original width
+        target_w = min(w, current.width)
+        if target_w in done:
+            continue
+        done.add(target_w)
+        if target_w != current.width:
+            current = _downscale(current, target_w)
+        size = size or current.size
+        for fmt, params in formats.items():
+            pil_format, ext, _ = IMAGE_FORMATS[fmt]
+            out_name = f"{base_name}-{target_w}.{ext}"
+            out_path = os.path.join(dest_dir, out_name)
+            if not (reuse_existing and os.path.exists(out_path)):
+                # grava num temporário e renomeia: um leitor nunca vê um arquivo pela metade
+                tmp_path = out_path + f'.{os.getpid()}.tmp'
+                current.save(tmp_path, pil_format, **params)
+                os.replace(tmp_path, out_path)
+            # store relative path from static/
+            variants[fmt][str(target_w)] = os.path.join(rel_dir, out_name).replace('\\', '/')
+    variants = {fmt: dict(sorted(v.items(), key=lambda kv: int(kv[0]))) for fmt, v in variants.items()}
+    if with_meta:
+        # placeholder a partir da menor variante (já está na memória)
+        return variants, dict(w=size[0], h=size[1], **image_placeholder(current))
+    return variants
+
+
+def variants_by_format(variants):
+    """Normaliza o JSON de imagem_variants para {formato: {largura: caminho}}.
+    Registros antigos guardam só {largura: caminho}, sempre WebP."""
+    if not variants:
+        return {}
+    if all(isinstance(v, str) for v in variants.values()):
+        return {'webp': variants}
+    return variants
+
+
+def fallback_format(by_format):
+    """Formato do <img> (fora do <picture>): o primeiro de FALLBACK_FORMATS gerado."""
+    for fmt in FALLBACK_FORMATS:
+        if by_format.get(fmt):
+            return fmt
+    return next(iter(by_format), None)
+
+
+def pick_variant(variants, prefer):
+    """Caminho da primeira largura de `prefer` disponível, no formato de fallback;
+    sem nenhuma delas (original menor que todas), a maior largura que existe."""
+    by_format = variants_by_format(variants)
+    if not by_format:
+        return None
+    sizes = {w: path for w, path in by_format[fallback_format(by_format)].items() if path}
+    for w in prefer:
+        if sizes.get(w):
+            return sizes[w]
+    if not sizes:
+        return None
+    # as variantes nunca passam da largura do original: a maior é a mais nítida
+    return sizes[max(sizes, key=lambda w: int(w) if str(w).isdigit() else 0)]
+
+
+@StepTimer('build_srcset_from_variants')
+def build_srcset_from_variants(variants):
+    # variants: dict width->relative_path
+    items = []
+    for w in sorted([int(k) for k in variants.keys()]):
+        items.append(f"{ url_for('static', filename=variants[str(w)]) } {w}w")
+    return ', '.join(items)
+
+# ------------------ ARMAZENAMENTO DE IMAGENS ------------------
+
+# uploads endereçados pelo conteúdo: static/uploads/img/ab/abcdef....jpg (+ variantes -480.webp ...)
+app.config['IMAGE_STORE_DIR'] = os.path.join('static', 'uploads', 'img')
+# imagens sem referência só são apagadas pelo GC depois desse tempo sem uso
+app.config['IMAGE_GC_GRACE_SECONDS'] = 3600
+
+
+def image_store_location(image_hash):
+    """(dest_dir, base_name) dos arquivos de uma imagem do store."""
+    return os.path.join(app.config['IMAGE_STORE_DIR'], image_hash[:2]), image_hash
+
+
+def store_upload(conn, file_storage):
+    """Grava o upload no store pelo hash do conteúdo. Bytes idênticos viram o
+    mesmo arquivo (e reaproveitam as variantes já geradas). Retorna a linha de images."""
+    return store_image(conn, file_storage.stream, file_storage.filename)
+
+
+def store_image(conn, stream, filename):
+    """Como store_upload, para qualquer arquivo binário aberto (ex.: backfill)."""
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower() or '.jpg'
+    store_dir = app.config['IMAGE_STORE_DIR']
+    os.makedirs(store_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        image_hash = digest.hexdigest()[:32]
+        dest_dir, base_name = image_store_location(image_hash)
+        rel_path = os.path.relpath(os.path.join(dest_dir, base_name + ext), 'static').replace('\\', '/')
+        now = time.time()
+        # a linha antes do arquivo: a escrita espera um GC em andamento (que apaga linha e
+        # arquivos na mesma transação), e o uso recente impede o próximo GC de coletá-la
+        conn.execute('INSERT OR IGNORE INTO images (hash, path, bytes, refcount, created_at, last_used_at) VALUES (?,?,?,0,?,?)',
+                     (image_hash, rel_path, size, now, now))
+        # "uso" recente protege a imagem do GC enquanto o request ainda não gravou a referência
+        conn.execute('UPDATE images SET last_used_at=? WHERE hash=?', (now, image_hash))
+        row = conn.execute('SELECT path FROM images WHERE hash=?', (image_hash,)).fetchone()
+        full_path = os.path.join(dest_dir, base_name + os.path.splitext(row['path'])[1])
+        if not os.path.exists(full_path):
+            os.makedirs(dest_dir, exist_ok=True)
+            os.replace(tmp_path, full_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return dict(conn.execute('SELECT * FROM images WHERE hash=?', (image_hash,)).fetchone())
+
+
+def collect_unreferenced_images(conn, grace_seconds=None, dry_run=False):
+    """Apaga do disco e do banco as imagens do store sem nenhuma referência
+    (refcount 0), sem job pendente e sem uso recente. Retorna [(hash, bytes_liberados)]."""
+    if grace_seconds is None:
+        grace_seconds = app.config['IMAGE_GC_GRACE_SECONDS']
+    rows = conn.execute('''SELECT * FROM images WHERE refcount <= 0 AND last_used_at < ?
+                           AND NOT EXISTS (SELECT 1 FROM image_jobs j WHERE j.image_hash = images.hash
+                                           AND j.status IN ('pending', 'processing'))''',
+                        (time.time() - grace_seconds,)).fetchall()
+    removed = []
+    for row in rows:
+        dest_dir, base_name = image_store_location(row['hash'])
+        if dry_run:
+            removed.append((row['hash'], sum(os.path.getsize(p) for p in
+                                             glob.glob(os.path.join(dest_dir, base_name + '*')))))
+            continue
+        # linha e arquivos na mesma transação de escrita: store_image grava a linha antes
+        # de olhar o arquivo, então espera o commit e recoloca o arquivo se ele sumiu
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # rechecado sob o lock: referência, upload ou job que chegou depois do SELECT
+            cur = conn.execute('''DELETE FROM images WHERE hash=? AND refcount <= 0 AND last_used_at < ?
+                                  AND NOT EXISTS (SELECT 1 FROM image_jobs j WHERE j.image_hash = images.hash
+                                                  AND j.status IN ('pending', 'processing'))''',
+                               (row['hash'], time.time() - grace_seconds))
+            freed = 0
+            if cur.rowcount:
+                for path in glob.glob(os.path.join(dest_dir, base_name + '*')):
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if cur.rowcount:
+            resize_cache.discard(row['hash'])
+            removed.append((row['hash'], freed))
+    return removed
+
+
+# ------------------ REDIMENSIONAMENTO SOB DEMANDA ------------------
+
+# /img/<hash>/<w>x<h>.<ext>: miniaturas geradas na primeira vez que alguém pede,
+# guardadas num cache em disco com teto de tamanho (some o menos usado)
+app.config['IMAGE_CACHE_DIR'] = os.path.join('static', 'uploads', 'cache')
+app.config['IMAGE_CACHE_MAX_MB'] = int(os.getenv('SOSCOZINHAS_IMAGE_CACHE_MAX_MB', '512') or 512)
+# só estes tamanhos (1x e 2x dos lugares que usam); qualquer outro é 404, para
+# ninguém encher o cache/CPU pedindo tamanhos arbitrários
+IMAGE_RESIZE_SIZES = {
+    (400, 160), (800, 320),  # cards do admin de produtos
+    (240, 112), (480, 224),  # últimos produtos no dashboard
+    (128, 80), (256, 160),   # últimos banners no dashboard
+    (144, 96), (288, 192),   # lista de banners do admin
+}
+IMAGE_EXTENSIONS = {ext: fmt for fmt, (_, ext, _) in IMAGE_FORMATS.items()}
+
+
+class ResizeCache:
+    """Cache em disco das miniaturas sob demanda. Requests simultâneos para o
+    mesmo arquivo esperam o primeiro gerar (um encode só por processo); a
+    gravação é atômica, então processos diferentes no máximo repetem o trabalho.
+    Evicção LRU pelo mtime, atualizado quando um arquivo é servido."""
+
+    # não reescreve o mtime a cada hit; precisão de LRU suficiente para um cache de miniaturas
+    TOUCH_INTERVAL = 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._size = None
+
+    def location(self, image_hash, width, height, fmt):
+        """Caminho relativo a static/ da miniatura."""
+        rel_dir = os.path.relpath(app.config['IMAGE_CACHE_DIR'], 'static')
+        name = f'{image_hash}-{width}x{height}.{IMAGE_FORMATS[fmt][1]}'
+        return os.path.join(rel_dir, image_hash[:2], name).replace('\\', '/')
+
+    def get(self, image_hash, src_path, width, height, fmt):
+        """Garante a miniatura no disco e retorna o caminho relativo a static/."""
+        rel_path = self.location(image_hash, width, height, fmt)
+        full_path = os.path.join('static', rel_path)
+        try:
+            mtime = os.stat(full_path).st_mtime
+        except FileNotFoundError:
+            pass
+        else:
+            if time.time() - mtime > self.TOUCH_INTERVAL:
+                os.utime(full_path)
+            return rel_path
+        with self._lock:
+            entry = self._inflight.setdefault(rel_path, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if not os.path.exists(full_path):
+                    with StepTimer('resize_thumbnail'):
+                        self._render(src_path, full_path, width, height, fmt)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[rel_path]
+        return rel_path
+
+    def _render(self, src_path, full_path, width, height, fmt):
+        with Image.open(src_path) as probe:
+            orientation = probe.getexif().get(0x0112, 1)
+            src_w, src_h = (probe.height, probe.width) if orientation in _EXIF_TRANSPOSED else probe.size
+        # recorte centralizado (como object-cover): decodifica só o necessário para cobrir a caixa
+        need_w = max(width, -(-height * src_w // src_h))
+        im = _open_for_variants(src_path, need_w)
+        im = ImageOps.fit(im, (width, height), Image.LANCZOS)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = full_path + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        im.save(tmp_path, IMAGE_FORMATS[fmt][0], **VARIANT_PROFILES['produto']['formats'][fmt])
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, full_path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += size
+            over = self._size > app.config['IMAGE_CACHE_MAX_MB'] * 1024 * 1024
+        if over:
+            self.evict(keep=full_path)
+
+    def _scan(self):
+        files, total = [], 0
+        for dirpath, _, names in os.walk(app.config['IMAGE_CACHE_DIR']):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return files, total
+
+    def evict(self, max_bytes=None, keep=None):
+        """Apaga os arquivos menos usados (exceto `keep`, que vai ser servido agora)
+        até o cache ficar em 90% do teto. Retorna bytes liberados."""
+        if max_bytes is None:
+            max_bytes = app.config['IMAGE_CACHE_MAX_MB'] * 1024 * 1024
+        # varre o disco de novo: outros processos também gravam no cache
+        files, total = self._scan()
+        freed = 0
+        for mtime, size, path in sorted(files):
+            if total - freed <= max_bytes * 0.9:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+        with self._lock:
+            self._size = total - freed
+        return freed
+
+    def discard(self, image_hash):
+        """Remove as miniaturas de uma imagem apagada do store."""
+        for path in glob.glob(os.path.join(app.config['IMAGE_CACHE_DIR'], image_hash[:2], image_hash + '-*')):
+            os.remove(path)
+
+
+resize_cache = ResizeCache()
+
+
+def img_url(image_hash, width, height, fmt='webp'):
+    """URL da miniatura /img/<hash>/<w>x<h>.<ext> (tamanho precisa estar em IMAGE_RESIZE_SIZES)."""
+    return url_for('img', image_hash=image_hash, width=width, height=height, ext=IMAGE_FORMATS[fmt][1])
+
+
+# ------------------ FILA DE IMAGENS ------------------
+
+# processos que geram as variantes em segundo plano; 0 = gera na hora, no próprio request
+app.config['IMAGE_WORKERS'] = int(os.getenv('SOSCOZINHAS_IMAGE_WORKERS', '2') or 0)
+# job em 'processing' há mais que isso é considerado perdido (processo morreu) e volta à fila
+app.config['IMAGE_JOB_STALE_SECONDS'] = 600
+
+
+def enqueue_image_job(conn, kind, target_id, image):
+    """Registra um job de variantes (para a linha `image` do store) na mesma
+    transação da escrita do admin. Depois do commit chame image_jobs.dispatch().
+    Se os mesmos bytes já estão na fila (outro upload ainda não processado), reaproveita
+    aquele job: o resultado vale para todos os registros com esse imagem_hash."""
+    row = conn.execute("SELECT id FROM image_jobs WHERE image_hash=? AND kind=? AND status IN ('pending', 'processing') "
+                       'ORDER BY id DESC LIMIT 1', (image['hash'], kind)).fetchone()
+    if row is not None:
+        return row['id']
+    dest_dir, base_name = image_store_location(image['hash'])
+    if kind != 'produto':
+        # cada perfil tem seus próprios arquivos (larguras/qualidade diferentes)
+        base_name = f'{base_name}-{kind}'
+    cur = conn.execute('INSERT INTO image_jobs (kind, target_id, src_path, dest_dir, base_name, image_hash, status, created_at) '
+                       "VALUES (?,?,?,?,?,?,'pending',?)",
+                       (kind, target_id, os.path.join('static', image['path']), dest_dir, base_name, image['hash'], time.time()))
+    return cur.lastrowid
+
+
+def produto_image_fields(image):
+    """(imagem, imagem_variants, imagem_meta, imagem_status) de um produto para a
+    imagem do store. Se os mesmos bytes já foram processados, as variantes valem na hora."""
+    if image is None:
+        return None, None, None, None
+    variants = json.loads(image['variants'] or '{}').get('produto')
+    if variants:
+        return pick_variant(variants, ('768',)), json.dumps(variants), image['meta'], None
+    # a vitrine usa o original até a fila gerar as variantes
+    return image['path'], None, None, 'pending'
+
+
+def _latest_job_clause(table):
+    # só aplica o resultado se não houver upload mais novo para o mesmo registro
+    return (f"NOT EXISTS (SELECT 1 FROM image_jobs j WHERE j.kind=? AND j.target_id={table}.id AND j.id>?)")
+
+
+def _job_targets(table, job):
+    # registros que ainda usam a imagem do job (um job por hash, compartilhado entre uploads);
+    # jobs de antes do store, sem hash, valem só para o próprio registro
+    if job['image_hash']:
+        return 'imagem_hash=?', (job['image_hash'],)
+    return f'id=? AND {_latest_job_clause(table)}', (job['target_id'], job['kind'], job['id'])
+
+
+def _apply_produto_variants(conn, job, variants, meta):
+    where, params = _job_targets('produtos', job)
+    if variants is None:
+        conn.execute(f"UPDATE produtos SET imagem_status='error' WHERE {where} AND imagem_status='pending'", params)
+        return
+    conn.execute(f'UPDATE produtos SET imagem=?, imagem_variants=?, imagem_meta=?, imagem_status=NULL WHERE {where}',
+                 (pick_variant(variants, ('768',)), json.dumps(variants), json.dumps(meta)) + params)
+
+
+def _apply_hero_variants(conn, job, variants, meta):
+    where, params = _job_targets('hero_banners', job)
+    if variants is None:
+        conn.execute(f"UPDATE hero_banners SET imagem_status='error' WHERE {where} AND imagem_status='pending'", params)
+        return
+    # <img src> de fallback: WebP grande; o navegador escolhe pelo srcset/sizes
+    conn.execute(f'UPDATE hero_banners SET imagem=?, imagem_variants=?, imagem_meta=?, imagem_status=NULL WHERE {where}',
+                 (pick_variant(variants, ('1920', '1440', '2560')), json.dumps(variants), json.dumps(meta)) + params)
+
+
+# kind do job -> função que grava o resultado (variants=None em caso de erro);
+# meta: dimensões/placeholder de generate_image_variants(with_meta=True);
+# o kind também é o perfil de VARIANT_PROFILES usado para gerar as variantes
+IMAGE_JOB_HANDLERS = {
+    'produto': _apply_produto_variants,
+    'hero': _apply_hero_variants,
+}
+
+
+def hero_image_fields(image):
+    """(imagem, imagem_variants, imagem_meta, imagem_status) de um banner para a imagem do store."""
+    if image is None:
+        return None, None, None, None
+    variants = json.loads(image['variants'] or '{}').get('hero')
+    if variants:
+        return pick_variant(variants, ('1920', '1440', '2560')), json.dumps(variants), image['meta'], None
+    # original até a fila gerar as variantes do banner
+    return image['path'], None, None, 'pending'
+
+
+class ImageJobQueue:
+    """Fila de geração de variantes persistida na tabela image_jobs e executada
+    num pool de processos. Jobs pendentes sobrevivem a restart: qualquer
+    processo que chamar dispatch() retoma os que estiverem na fila."""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn: o processo filho não herda threads nem conexões sqlite do pai
+                self._executor = ProcessPoolExecutor(max_workers=app.config['IMAGE_WORKERS'],
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def dispatch(self):
+        """Reivindica os jobs pendentes (UPDATE atômico, seguro entre workers) e os executa."""
+        db_path = app.config['DATABASE']
+        conn = connect_db(db_path)
+        try:
+            stale = time.time() - app.config['IMAGE_JOB_STALE_SECONDS']
+            conn.execute("UPDATE image_jobs SET status='pending' WHERE status='processing' AND claimed_at < ?", (stale,))
+            conn.commit()
+            jobs = conn.execute("SELECT * FROM image_jobs WHERE status='pending' ORDER BY id").fetchall()
+            claimed = []
+            for job in jobs:
+                cur = conn.execute("UPDATE image_jobs SET status='processing', claimed_at=?, attempts=attempts+1 "
+                                   "WHERE id=? AND status='pending'", (time.time(), job['id']))
+                conn.commit()
+                if cur.rowcount:
+                    claimed.append(dict(job))
+        finally:
+            conn.close()
+        for job in claimed:
+            self._submit(db_path, job)
+        return len(claimed)
+
+    def _submit(self, db_path, job):
+        job['submitted_at'] = time.perf_counter()
+        # with_meta: o mesmo decode também gera dimensões e placeholder
+        args = (job['src_path'], job['dest_dir'], job['base_name'], job['image_hash'] is not None, job['kind'], True)
+        if app.config['IMAGE_WORKERS'] <= 0:
+            try:
+                result = generate_image_variants(*args)
+            except Exception as e:
+                self._finish(db_path, job, None, e)
+            else:
+                self._finish(db_path, job, result, None)
+            return
+        try:
+            future = self._get_executor().submit(generate_image_variants, *args)
+        except Exception as e:
+            self._finish(db_path, job, None, e)
+            return
+        future.add_done_callback(lambda f: self._finish(db_path, job, None if f.exception() else f.result(), f.exception()))
+
+    def _finish(self, db_path, job, result, error):
+        variants, meta = result if error is None else (None, None)
+        if error is not None:
+            logging.warning('image job %s (%s %s) falhou: %s', job['id'], job['kind'], job['target_id'], error)
+        conn = connect_db(db_path)
+        try:
+            conn.execute('UPDATE image_jobs SET status=?, error=?, finished_at=? WHERE id=?',
+                         ('error' if error is not None else 'done', str(error) if error is not None else None,
+                          time.time(), job['id']))
+            if error is None and job['image_hash']:
+                # próximos uploads com os mesmos bytes usam estas variantes direto
+                conn.execute("UPDATE images SET variants=json_set(COALESCE(variants, '{}'), '$.' || ?, json(?)), meta=? WHERE hash=?",
+                             (job['kind'], json.dumps(variants), json.dumps(meta), job['image_hash']))
+            IMAGE_JOB_HANDLERS[job['kind']](conn, job, variants, meta)
+            conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id=1')
+            conn.commit()
+        except Exception:
+            logging.exception('erro ao gravar o resultado do image job %s', job['id'])
+        finally:
+            conn.close()
+        drop_catalog_snapshot()
+        if app.config['METRICS']:
+            metrics.observe('image_job_duration_seconds', time.perf_counter() - job['submitted_at'],
+                            kind=job['kind'], status='error' if error is not None else 'done')
+
+    def counts(self, conn):
+        return dict(conn.execute('SELECT status, COUNT(*) FROM image_jobs GROUP BY status').fetchall())
+
+    def wait(self):
+        """Espera os jobs já submetidos ao pool terminarem (scripts que saem logo depois)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+image_jobs = ImageJobQueue()
+_image_jobs_started = set()
+
+
+@app.before_request
+def resume_image_jobs():
+    # primeira request de cada processo: retoma jobs que ficaram na fila (ex.: após restart)
+    if os.getpid() not in _image_jobs_started:
+        _image_jobs_started.add(os.getpid())
+        try:
+            image_jobs.dispatch()
+        except sqlite3.Error:
+            logging.exception('não foi possível retomar a fila de imagens')
+
+
+# ------------------ SNAPSHOT DO CATÁLOGO ------------------
+
+# segundos entre consultas ao catalog_version (invalidação vinda de outros workers);
+# dentro desse intervalo a vitrine não faz nenhum SQL
+app.config['CATALOG_VERSION_CHECK_SECONDS'] = float(os.getenv('SOSCOZINHAS_CATALOG_CHECK_SECONDS', '1') or 1)
+
+CATALOG_SORTS = ('newest', 'price_asc', 'price_desc')
+# acima disso o snapshot não guarda os produtos em memória (só contagens, hero,
+# contato etc.) e a vitrine pagina direto no SQLite por keyset
+app.config['CATALOG_SNAPSHOT_MAX_PRODUCTS'] = int(os.getenv('SOSCOZINHAS_CATALOG_SNAPSHOT_MAX_PRODUCTS', '5000') or 5000)
+app.config['CATALOG_MAX_PER_PAGE'] = 48
+
+
+@StepTimer('apply_image_variants')
+def apply_image_variants(d, prefer):
+    """Decodifica d['imagem_variants'] (JSON) e preenche imagem (primeira largura
+    disponível de `prefer`), imagem_srcset (formato de fallback) e imagem_sources:
+    lista de (content-type, srcset) dos demais formatos, para os <source> de um <picture>.
+    Com imagem_meta, também imagem_info: {w, h, lqip, cor} (ver image_attrs)."""
+    if d.get('imagem_meta'):
+        try:
+            d['imagem_info'] = json.loads(d['imagem_meta'])
+        except ValueError:
+            pass
+    if not d.get('imagem_variants'):
+        return d
+    try:
+        by_format = variants_by_format(json.loads(d['imagem_variants']))
+        fallback = fallback_format(by_format)
+        d['imagem_srcset'] = build_srcset_from_variants(by_format[fallback])
+        d['imagem_sources'] = tuple((IMAGE_FORMATS[fmt][2], build_srcset_from_variants(sizes))
+                                    for fmt, sizes in by_format.items() if fmt in IMAGE_FORMATS and fmt != fallback)
+        d['imagem'] = pick_variant(by_format, prefer)
+    except Exception:
+        pass
+    return d
+
+
+def image_attrs(d, fit='cover'):
+    """width/height intrínsecos (o navegador reserva o espaço: sem layout shift) e,
+    como fundo do próprio <img>, a cor dominante e o LQIP até a imagem chegar.
+    `fit` deve ser o mesmo object-fit da imagem, para o placeholder ocupar o mesmo lugar."""
+    info = d.get('imagem_info')
+    if not info:
+        return ''
+    return Markup(' width="{}" height="{}" style="background:{} url({}) center/{} no-repeat"').format(
+        info['w'], info['h'], info['cor'], info['lqip'], fit)
+
+
+def catalog_product(row):
+    """Linha de produtos -> mapping imutável pronto para os templates da vitrine."""
+    rd = dict(row)
+    variants_json = rd.get('imagem_variants')
+    apply_image_variants(rd, ('768',))
+    grid_img = rd['imagem']
+    # detalhe do produto usa uma variante maior
+    rd['imagem_grande'] = apply_image_variants({'imagem': grid_img, 'imagem_variants': variants_json}, ('1024', '768'))['imagem']
+    rd['imagem'] = grid_img
+    return MappingProxyType(rd)
+
+
+def _sort_value(preco):
+    # mesma ordem do SQLite: NULL < números < texto (ex.: preço salvo como '10,50')
+    if preco is None:
+        return (0, 0)
+    if isinstance(preco, (int, float)):
+        return (1, preco)
+    return (2, str(preco))
+
+
+def _sort_key(sort, preco, id):
+    """Chave crescente equivalente à ordem SQL de cada sort (usada no bisect)."""
+    if sort == 'newest':
+        return (-id,)
+    rank, value = _sort_value(preco)
+    if sort == 'price_asc':
+        return (rank, value, id)
+    # price_desc é exatamente o inverso de price_asc
+    return (-rank, _Reversed(value), -id)
+
+
+class _Reversed:
+    # inverte a comparação de um valor qualquer (número ou texto)
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def encode_cursor(direction, produto):
+    """Cursor opaco: direção ('n' = depois de, 'p' = antes de) + chave (preco, id)."""
+    raw = json.dumps([direction, produto['preco'], produto['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, preco, id = json.loads(raw)
+        if direction not in ('n', 'p') or not isinstance(id, int) or not isinstance(preco, (int, float, str, type(None))):
+            return None
+        return direction, preco, id
+    except Exception:
+        return None
+
+
+class CatalogSnapshot:
+    """Foto imutável de tudo que a vitrine exibe, já decodificado.
+    Trocada inteira (nunca alterada) quando o catálogo muda.
+    Com produtos=None (catálogo grande) só guarda contagens e o resto."""
+
+    def __init__(self, version, produtos, hero_banners, contato, classes, faqs, class_counts=None, total_ativos=None,
+                 updated_at=None):
+        self.version = version
+        self.updated_at = updated_at
+        self.hero_banners = tuple(hero_banners)
+        self.contato = contato
+        self.classes = tuple(classes)
+        self.faqs = tuple(faqs)
+        if produtos is None:
+            self.produtos = None
+            self._listings = None
+            self.class_counts = MappingProxyType(dict(class_counts or {}))
+            self.total_ativos = total_ativos or 0
+            return
+        self.produtos = MappingProxyType({p['id']: p for p in produtos})
+        ativos = [p for p in produtos if p['ativo'] == 1]
+        grouped = {None: ativos}
+        for p in ativos:
+            if p['class_id'] is not None:
+                grouped.setdefault(p['class_id'], []).append(p)
+        # para cada (classe, sort): produtos ordenados + chaves para o bisect dos cursores
+        self._listings = {}
+        for class_id, items in grouped.items():
+            listings = {}
+            for sort in CATALOG_SORTS:
+                ordered = tuple(sorted(items, key=lambda p: _sort_key(sort, p['preco'], p['id'])))
+                listings[sort] = (ordered, [_sort_key(sort, p['preco'], p['id']) for p in ordered])
+            self._listings[class_id] = listings
+        self.class_counts = MappingProxyType({cid: len(items) for cid, items in grouped.items() if cid is not None})
+        self.total_ativos = len(ativos)
+
+    def count(self, class_id=None):
+        return self.total_ativos if class_id is None else self.class_counts.get(class_id, 0)
+
+    def page(self, class_id, sort, cursor, per_page):
+        """Página a partir do cursor: (produtos, next_cursor, prev_cursor)."""
+        listings = self._listings.get(class_id)
+        if not listings:
+            return (), None, None
+        ordered, keys = listings[sort]
+        if cursor is None:
+            start = 0
+        else:
+            direction, preco, id = cursor
+            key = _sort_key(sort, preco, id)
+            if direction == 'n':
+                start = bisect.bisect_right(keys, key)
+            else:
+                start = max(0, bisect.bisect_left(keys, key) - per_page)
+        items = ordered[start:start + per_page]
+        next_cursor = encode_cursor('n', items[-1]) if items and start + per_page < len(ordered) else None
+        prev_cursor = encode_cursor('p', items[0]) if items and start > 0 else None
+        return items, next_cursor, prev_cursor
+
+
+# ordem SQL de cada sort e a ordem inversa (usada para voltar uma página)
+_SQL_ORDER = {
+    'newest': ('id DESC', 'id ASC'),
+    'price_asc': ('preco ASC, id ASC', 'preco DESC, id DESC'),
+    'price_desc': ('preco DESC, id DESC', 'preco ASC, id ASC'),
+}
+
+
+def _keyset_segments(ascending, cursor, by_price):
+    """Trechos (WHERE, params) que vêm depois do cursor na ordem dada, em sequência.
+    Cada trecho é uma faixa contínua do índice, então o custo não depende da
+    profundidade da página. NULL vem antes de qualquer preço no ASC e por último
+    no DESC, como no SQLite; por isso os NULL ficam num trecho separado."""
+    if cursor is None:
+        return [(None, [])]
+    preco, id = cursor[1], cursor[2]
+    op = '>' if ascending else '<'
+    if not by_price:
+        return [(f'id {op} ?', [id])]
+    if preco is None:
+        if ascending:
+            return [('preco IS NULL AND id > ?', [id]), ('preco IS NOT NULL', [])]
+        return [('preco IS NULL AND id < ?', [id])]
+    segment = (f'preco {op}= ? AND (preco {op} ? OR id {op} ?)', [preco, preco, id])
+    return [segment] if ascending else [segment, ('preco IS NULL', [])]
+
+
+class CatalogPage:
+    """Produtos de uma página da vitrine, iterados uma vez e em ordem. No modo
+    SQL é um gerador sobre o cursor do SQLite (nada materializado) e
+    next_cursor/prev_cursor só ficam prontos no fim da iteração: o template
+    os usa depois do grid."""
+
+    def __init__(self, produtos, next_cursor=None, prev_cursor=None):
+        self._produtos = produtos
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self._produtos)
+
+
+def sql_catalog_page(conn, class_id, sort, cursor, per_page):
+    """Paginação keyset direto no SQLite (catálogos que não cabem no snapshot).
+    Usa os índices (ativo, id), (ativo, class_id, id), (ativo, preco) e
+    (ativo, class_id, preco);
+    o id entra implícito no fim de cada índice como rowid. Retorna CatalogPage."""
+    where = ['ativo=1']
+    params = []
+    if class_id is not None:
+        where.append('class_id=?')
+        params.append(class_id)
+    backwards = cursor is not None and cursor[0] == 'p'
+    order = _SQL_ORDER[sort][1 if backwards else 0]
+    ascending = order.startswith('id ASC') or order.startswith('preco ASC')
+
+    def rows():
+        # até per_page + 1 linhas (a extra só diz se há próxima página), segmento a segmento
+        remaining = per_page + 1
+        for clause, extra in _keyset_segments(ascending, cursor, sort != 'newest'):
+            seg_where = where + [clause] if clause else where
+            sql = 'SELECT * FROM produtos WHERE ' + ' AND '.join(seg_where) + f' ORDER BY {order} LIMIT ?'
+            for row in conn.execute(sql, params + extra + [remaining]):
+                remaining -= 1
+                yield row
+            if not remaining:
+                return
+
+    def produtos():
+        first = last = None
+        more = False
+        if backwards:
+            # voltando a página o SQL lê na ordem inversa: essa (no máximo per_page) precisa da lista
+            fetched = list(rows())
+            more = len(fetched) > per_page
+            items = [catalog_product(r) for r in fetched[:per_page]][::-1]
+            if items:
+                first, last = items[0], items[-1]
+            yield from items
+            has_prev, has_next = more, True
+        else:
+            for n, row in enumerate(rows()):
+                if n == per_page:
+                    more = True
+                    break
+                last = catalog_product(row)
+                first = first or last
+                yield last
+            has_prev, has_next = cursor is not None, more
+        page.next_cursor = encode_cursor('n', last) if last and has_next else None
+        page.prev_cursor = encode_cursor('p', first) if first and has_prev else None
+
+    page = CatalogPage(produtos())
+    return page
+
+
+def catalog_listing_args(max_per_page, default_per_page=12):
+    """Parâmetros de listagem comuns à vitrine e à API: (per_page, class_filter,
+    sort, cursor). class_filter é None (todas), o id da classe ou -1 (class_id
+    inválido: nenhum produto)."""
+    per_page = request.args.get('per_page', default_per_page, type=int) or default_per_page
+    per_page = max(1, min(per_page, max_per_page))
+    class_id = request.args.get('class_id')
+    try:
+        class_filter = int(class_id) if class_id else None
+    except ValueError:
+        class_filter = -1  # classe inexistente: nenhum produto
+    sort = request.args.get('sort', 'newest')  # newest, price_asc, price_desc
+    if sort not in CATALOG_SORTS:
+        sort = 'newest'
+    return per_page, class_filter, sort, decode_cursor(request.args.get('cursor'))
+
+
+def catalog_listing(catalog, class_filter, sort, cursor, per_page):
+    # do snapshot quando o catálogo cabe nele; senão keyset direto no SQLite
+    if catalog.produtos is not None:
+        return CatalogPage(*catalog.page(class_filter, sort, cursor, per_page))
+    return sql_catalog_page(get_db(), class_filter, sort, cursor, per_page)
+
+
+# ------------------ BUSCA ------------------
+
+# peso do nome vs descrição no ranking BM25
+SEARCH_BM25_WEIGHTS = (10.0, 1.0)
+SEARCH_MAX_PAGES = 50
+_fts_available = {}
+
+
+def fts_available(conn):
+    """True se a migração conseguiu criar produtos_fts (SQLite com FTS5)."""
+    path = app.config['DATABASE']
+    if path not in _fts_available:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE name='produtos_fts'").fetchone()
+        _fts_available[path] = row is not None
+    return _fts_available[path]
+
+
+def fts_query(q):
+    """Texto digitado -> consulta FTS5 segura: cada palavra vira prefixo ("pan"*),
+    todas obrigatórias. Operadores/aspas do usuário são descartados."""
+    terms = re.findall(r'\w+', q or '')
+    return ' '.join(f'"{t}"*' for t in terms[:16])
+
+
+def _search_base(conn, q, where, params):
+    # (FROM ... WHERE ..., params, ORDER BY) da busca; None quando q não vira consulta
+    where = list(where)
+    params = list(params)
+    if fts_available(conn):
+        match = fts_query(q)
+        if not match:
+            return None
+        # CROSS JOIN fixa o FTS como laço externo: com o filtro em p (ex.: ativo=1) o
+        # planejador preferia varrer produtos e consultar o FTS linha a linha no COUNT
+        base = ('FROM produtos_fts CROSS JOIN produtos p ON p.id = produtos_fts.rowid '
+                'WHERE produtos_fts MATCH ?' + ''.join(' AND ' + w for w in where))
+        order = f'bm25(produtos_fts, {SEARCH_BM25_WEIGHTS[0]}, {SEARCH_BM25_WEIGHTS[1]}), p.id DESC'
+        return base, [match] + params, order
+    like = f'%{q}%'
+    base = 'FROM produtos p WHERE (p.nome LIKE ? OR p.descricao LIKE ?)' + ''.join(' AND ' + w for w in where)
+    return base, [like, like] + params, 'p.id DESC'
+
+
+def search_produtos(conn, q, where=(), params=(), limit=None, offset=0, columns='p.*'):
+    """Produtos que casam com `q`, mais relevantes primeiro (BM25 quando há FTS5).
+    `where`/`params` filtram colunas de produtos (alias p). Retorna (rows, total)."""
+    search = _search_base(conn, q, where, params)
+    if search is None:
+        return [], 0
+    base, base_params, order = search
+    sql = f'SELECT {columns} {base} ORDER BY {order}'
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        rows = conn.execute(sql, base_params + [limit, offset]).fetchall()
+        total = conn.execute(f'SELECT COUNT(*) {base}', base_params).fetchone()[0]
+    else:
+        rows = conn.execute(sql, base_params).fetchall()
+        total = len(rows)
+    return rows, total
+
+
+def search_counts_by_ativo(conn, q):
+    """{ativo: quantidade} dos produtos que casam com `q` (abas do admin)."""
+    search = _search_base(conn, q, (), ())
+    if search is None:
+        return {}
+    base, base_params, _ = search
+    return dict(conn.execute(f'SELECT p.ativo, COUNT(*) {base} GROUP BY p.ativo', base_params).fetchall())
+
+
+def _read_catalog_version(conn):
+    return _read_catalog_state(conn)[0]
+
+
+def _read_catalog_state(conn):
+    # (versão, updated_at em epoch)
+    row = conn.execute('SELECT version, updated_at FROM catalog_version WHERE id=1').fetchone()
+    return (row[0], row[1]) if row else (0, None)
+
+
+@StepTimer('catalog_snapshot')
+def build_catalog_snapshot(conn):
+    # lê versão e dados na mesma transação de leitura (snapshot consistente no WAL)
+    started = not conn.in_transaction
+    if started:
+        conn.execute('BEGIN')
+    try:
+        version, updated_at = _read_catalog_state(conn)
+        total = conn.execute('SELECT COUNT(*) FROM produtos').fetchone()[0]
+        produtos = class_counts = total_ativos = None
+        if total <= app.config['CATALOG_SNAPSHOT_MAX_PRODUCTS']:
+            produtos = [catalog_product(r) for r in conn.execute('SELECT * FROM produtos').fetchall()]
+        else:
+            # total aproximado: fica em cache até a próxima mudança de versão
+            class_counts = dict(conn.execute('SELECT class_id, COUNT(*) FROM produtos WHERE ativo=1 GROUP BY class_id').fetchall())
+            total_ativos = sum(class_counts.values())
+            class_counts.pop(None, None)
+        hero_banners = [MappingProxyType(apply_image_variants(dict(h), ('2560', '1920', '1440', '1024', '768', '480')))
+                        for h in conn.execute('SELECT * FROM hero_banners ORDER BY id DESC').fetchall()]
+        contato_row = conn.execute('SELECT * FROM contato ORDER BY id DESC LIMIT 1').fetchone()
+        contato = MappingProxyType(dict(contato_row)) if contato_row else None
+        classes = [MappingProxyType(dict(c)) for c in conn.execute('SELECT * FROM classes ORDER BY nome').fetchall()]
+        faqs = [MappingProxyType(dict(f)) for f in conn.execute('SELECT * FROM faq ORDER BY id DESC').fetchall()]
+    finally:
+        if started:
+            conn.rollback()
+    return CatalogSnapshot(version, produtos, hero_banners, contato, classes, faqs,
+                           class_counts=class_counts, total_ativos=total_ativos, updated_at=updated_at)
+
+
+_catalog = None
+_catalog_checked_at = 0.0
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Snapshot atual do catálogo. Reconstrói só quando o catalog_version do banco
+    mudou (consultado no máximo a cada CATALOG_VERSION_CHECK_SECONDS)."""
+    global _catalog, _catalog_checked_at
+    snap = _catalog
+    now = time.monotonic()
+    if snap is not None and now - _catalog_checked_at < app.config['CATALOG_VERSION_CHECK_SECONDS']:
+        return snap
+    conn = get_db()
+    if snap is not None and _read_catalog_version(conn) == snap.version:
+        _catalog_checked_at = now
+        return snap
+    with _catalog_lock:
+        # outra thread pode ter reconstruído enquanto esperávamos o lock
+        if _catalog is not None and _catalog is not snap and _catalog.version == _read_catalog_version(conn):
+            return _catalog
+        _catalog = build_catalog_snapshot(conn)
+        _catalog_checked_at = time.monotonic()
+        return _catalog
+
+
+def commit_catalog(conn):
+    """Commit de uma escrita do admin que altera a vitrine: incrementa o
+    catalog_version na mesma transação e já reconstrói o snapshot local."""
+    global _catalog, _catalog_checked_at
+    conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id=1')
+    conn.commit()
+    with _catalog_lock:
+        _catalog = build_catalog_snapshot(conn)
+        _catalog_checked_at = time.monotonic()
+
+
+def drop_catalog_snapshot():
+    # fora de um request (ex.: fila de imagens) não dá para montar srcsets com url_for;
+    # descarta o snapshot e o próximo request reconstrói
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def catalog_state():
+    """(versão, updated_at) do catálogo sem montar o snapshot. Sem nenhum SQL
+    enquanto o snapshot atual foi conferido há menos de CATALOG_VERSION_CHECK_SECONDS."""
+    snap = _catalog
+    if snap is not None and time.monotonic() - _catalog_checked_at < app.config['CATALOG_VERSION_CHECK_SECONDS']:
+        return snap.version, snap.updated_at
+    return _read_catalog_state(get_db())
+
+
+# ------------------ ARQUIVOS ESTÁTICOS ------------------
+
+# gerado por collect_static.py: {caminho: caminho com hash do conteúdo no nome}
+app.config['STATIC_MANIFEST'] = os.path.join(app.root_path, 'static', 'manifest.json')
+# extensões que valem a pena comprimir (imagens/fontes já vêm comprimidas)
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico', '.webmanifest')
+# .br/.gz gerados no collect, em ordem de preferência
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+_static_manifest = None
+
+
+def static_manifest():
+    """(original -> com hash, com hash -> original). Lido uma vez por processo:
+    rode collect_static.py antes de subir (ou reiniciar) o app."""
+    global _static_manifest
+    if _static_manifest is None:
+        try:
+            with open(app.config['STATIC_MANIFEST'], encoding='utf-8') as f:
+                forward = json.load(f)
+        except (OSError, ValueError):
+            forward = {}
+        _static_manifest = (forward, {v: k for k, v in forward.items()})
+    return _static_manifest
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    # url_for('static', filename='x.css') -> /static/x.<hash>.css quando o arquivo está no manifest
+    if endpoint == 'static':
+        hashed = static_manifest()[0].get(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+
+
+def _immutable_static(path):
+    # nomes que já carregam o hash do conteúdo: store de imagens e miniaturas sob demanda
+    return any(path.startswith(os.path.relpath(app.config[k], 'static').replace('\\', '/') + '/')
+               for k in ('IMAGE_STORE_DIR', 'IMAGE_CACHE_DIR'))
+
+
+def _fresh_precompressed(path, ext):
+    # .br/.gz mais velho que o original (arquivo editado sem rodar o collect_static.py): ignora
+    try:
+        return (os.stat(os.path.join(app.static_folder, path + ext)).st_mtime
+                >= os.stat(os.path.join(app.static_folder, path)).st_mtime)
+    except (OSError, ValueError):
+        return False
+
+
+def serve_static(filename):
+    """Substitui o handler padrão de /static: nomes com hash (manifest, store)
+    saem com cache imutável de um ano, e .br/.gz pré-comprimidos são servidos
+    conforme o Accept-Encoding."""
+    real = static_manifest()[1].get(filename)
+    path = real or filename
+    immutable = real is not None or _immutable_static(path)
+    # sem hash no nome: padrão do Flask (revalida sempre)
+    max_age = 31536000 if immutable else None
+    resp = None
+    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+        for encoding, ext in STATIC_ENCODINGS:
+            if request.accept_encodings[encoding] and _fresh_precompressed(path, ext):
+                resp = send_from_directory(app.static_folder, path + ext, max_age=max_age,
+                                           mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+                resp.content_encoding = encoding
+                break
+    if resp is None:
+        resp = send_from_directory(app.static_folder, path, max_age=max_age)
+    if path.endswith(COMPRESSIBLE_EXTENSIONS):
+        resp.vary.add('Accept-Encoding')
+    if immutable:
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+    return resp
+
+
+app.view_functions['static'] = serve_static
+
+
+# ------------------ COMPRESSÃO ------------------
+
+# respostas menores que isso não compensam o custo (e podem até crescer)
+app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('SOSCOZINHAS_COMPRESS_MIN_BYTES', '500') or 0)
+# níveis para conteúdo dinâmico: compressão boa sem gastar muita CPU por request
+app.config['COMPRESS_LEVELS'] = {'br': 4, 'zstd': 3, 'gzip': 6}
+# só tipos de texto: imagens (WebP/AVIF/JPEG), fontes e zips já vêm comprimidos
+COMPRESSIBLE_MIMETYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                          'application/manifest+json', 'image/svg+xml')
+
+
+class _Compressor:
+    """Interface única para gzip/brotli/zstd: process(chunk, flush) e finish()."""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=level)
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: cabeçalho gzip
+
+    def process(self, chunk, flush=False):
+        if self.encoding == 'br':
+            return self._obj.process(chunk) + (self._obj.flush() if flush else b'')
+        if self.encoding == 'zstd':
+            return self._obj.compress(chunk) + (self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else b'')
+        return self._obj.compress(chunk) + (self._obj.flush(zlib.Z_SYNC_FLUSH) if flush else b'')
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def _weak_etag(etag):
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+class CompressionMiddleware:
+    """WSGI: comprime HTML/JSON/texto com br, zstd ou gzip conforme o
+    Accept-Encoding. Resposta com Content-Length é comprimida inteira (e ganha o
+    novo Content-Length); resposta em streaming é comprimida pedaço a pedaço,
+    com flush a cada pedaço para o navegador continuar recebendo aos poucos."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        # preferência do servidor em caso de empate no q do cliente
+        self.encodings = [e for e, ok in (('br', brotli), ('zstd', zstandard), ('gzip', True)) if ok]
+
+    def negotiate(self, header):
+        accept = parse_accept_header(header)
+        best, best_q = None, 0
+        for encoding in self.encodings:
+            q = accept.quality(encoding)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        state = {}
+
+        def intercept(status, headers, exc_info=None):
+            state['started'] = True
+            if status.startswith('304') and environ.get('HTTP_IF_NONE_MATCH', '').startswith('W/'):
+                # o 304 repete o ETag (fraco) do 200 comprimido que o cliente tem em cache
+                headers = [(k, _weak_etag(v) if k.lower() == 'etag' else v) for k, v in headers]
+            get = {k.lower(): v for k, v in headers}.get
+            mimetype = (get('content-type') or '').split(';')[0].strip()
+            if not mimetype.startswith(COMPRESSIBLE_MIMETYPES):
+                return start_response(status, headers, exc_info)
+            vary = get('vary')
+            if not vary or 'accept-encoding' not in vary.lower():
+                headers = [(k, v) for k, v in headers if k.lower() != 'vary']
+                headers.append(('Vary', f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'))
+            length = get('content-length')
+            if (encoding is None or environ['REQUEST_METHOD'] == 'HEAD' or not status.startswith('2')
+                    or status.startswith(('204', '206')) or get('content-range') or get('content-encoding')
+                    or 'no-transform' in (get('cache-control') or '')
+                    or (length is not None and int(length) < app.config['COMPRESS_MIN_BYTES'])):
+                return start_response(status, headers, exc_info)
+            # Range se refere aos bytes sem compressão: 206 passa direto e o comprimido não anuncia ranges
+            headers = [(k, v) for k, v in headers if k.lower() not in ('content-length', 'accept-ranges')]
+            headers.append(('Content-Encoding', encoding))
+            # outro conteúdo em bytes: ETag fraco (If-None-Match usa comparação fraca, o 304 continua valendo)
+            headers = [(k, _weak_etag(v) if k.lower() == 'etag' else v) for k, v in headers]
+            state['compressor'] = _Compressor(encoding, app.config['COMPRESS_LEVELS'][encoding])
+            state['streamed'] = length is None
+            if state['streamed']:
+                return start_response(status, headers, exc_info)
+            # tamanho conhecido: adia o start_response até ter o corpo comprimido
+            state['pending'] = (status, headers, exc_info)
+            state['written'] = []
+            return state['written'].append
+
+        app_iter = self.wsgi_app(environ, intercept)
+        chunks = app_iter
+        if 'started' not in state:
+            # app preguiçoso (gerador): start_response só acontece na primeira iteração
+            chunks = iter(app_iter)
+            chunks = itertools.chain([next(chunks, b'')], chunks)
+        compressor = state.get('compressor')
+        if compressor is None:
+            return app_iter if chunks is app_iter else self._stream(app_iter, chunks, None)
+        if state['streamed']:
+            return self._stream(app_iter, chunks, compressor)
+        try:
+            body = compressor.process(b''.join(state['written'] + list(chunks))) + compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        status, headers, exc_info = state['pending']
+        start_response(status, headers + [('Content-Length', str(len(body)))], exc_info)
+        return [body]
+
+    def _stream(self, app_iter, chunks, compressor):
+        try:
+            for chunk in chunks:
+                if compressor is None:
+                    yield chunk
+                elif chunk:
+                    yield compressor.process(chunk, flush=True)
+            if compressor is not None:
+                yield compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+
+# ------------------ GET CONDICIONAL ------------------
+
+# proxy reverso pode servir a mesma página por esse tempo (absorve picos);
+# o navegador sempre revalida, o que custa só um 304
+app.config['STOREFRONT_SHARED_MAX_AGE'] = int(os.getenv('SOSCOZINHAS_SHARED_MAX_AGE', '10') or 0)
+_build_id = None
+
+
+def storefront_build_id():
+    # muda a cada deploy (código ou templates): a mesma versão do catálogo com outro
+    # HTML não pode reaproveitar o ETag antigo. Por mtime, igual em todos os workers
+    global _build_id
+    if _build_id is None:
+        digest = hashlib.sha1()
+        paths = [__file__, app.config['STATIC_MANIFEST']] + glob.glob(os.path.join(app.root_path, 'templates', '*.html'))
+        for path in sorted(p for p in paths if os.path.exists(p)):
+            digest.update(f'{os.path.basename(path)}:{os.path.getmtime(path)};'.encode())
+        _build_id = digest.hexdigest()[:10]
+    return _build_id
+
+
+def conditional_catalog_page(view):
+    """ETag forte (build + catalog_version) e Last-Modified nas páginas públicas.
+    If-None-Match/If-Modified-Since que ainda valem viram 304 antes de qualquer
+    SQL ou template."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        version, updated_at = catalog_state()
+        etag = g.catalog_etag = f'{storefront_build_id()}-{version}'
+        last_modified = datetime.fromtimestamp(updated_at, timezone.utc) if updated_at else None
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            resp = app.response_class(status=304)
+        else:
+            resp = app.make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+        resp.set_etag(etag)
+        resp.last_modified = last_modified
+        resp.cache_control.public = True
+        resp.cache_control.max_age = 0
+        resp.cache_control.s_maxage = app.config['STOREFRONT_SHARED_MAX_AGE']
+        return resp
+    return wrapper
+
+
+# ------------------ CACHE DE PÁGINAS ------------------
+
+# HTML pronto das páginas públicas para visitantes anônimos; 0 desliga
+app.config['PAGE_CACHE_MAX_MB'] = int(os.getenv('SOSCOZINHAS_PAGE_CACHE_MAX_MB', '32') or 0)
+# opcional: diretório compartilhado entre os workers (uma página renderizada por um serve os outros)
+app.config['PAGE_CACHE_DIR'] = os.getenv('SOSCOZINHAS_PAGE_CACHE_DIR') or None
+
+
+class PageCache:
+    """LRU em memória (limitado em bytes) de respostas HTML, com uma camada
+    opcional em disco. Toda entrada pertence a um ETag (build + catalog_version):
+    quando o admin grava algo a versão muda e o cache inteiro é descartado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._etag = None
+        self.hits = self.disk_hits = self.misses = self.bypass = 0
+
+    def _switch(self, etag):
+        # chamado com o lock: versão nova, entradas antigas não servem mais. Só troca a
+        # geração; o disco é limpo numa thread, fora do lock (o rmtree de um cache grande
+        # seguraria todas as requests que esperam por ele)
+        self._entries.clear()
+        self._bytes = 0
+        self._etag = etag
+        cache_dir = app.config['PAGE_CACHE_DIR']
+        if cache_dir:
+            threading.Thread(target=self._remove_old_generations, args=(cache_dir, etag), daemon=True).start()
+
+    @staticmethod
+    def _remove_old_generations(cache_dir, etag):
+        # diretórios de versões antigas (com folga para um worker que ainda não viu a nova)
+        for path in glob.glob(os.path.join(cache_dir, '*')):
+            try:
+                if os.path.basename(path) != etag and time.time() - os.path.getmtime(path) > 60:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass  # outro worker apagou primeiro
+
+    def _disk_path(self, etag, key):
+        return os.path.join(app.config['PAGE_CACHE_DIR'], etag, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key, etag):
+        with self._lock:
+            if etag != self._etag:
+                self._switch(etag)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        if app.config['PAGE_CACHE_DIR']:
+            try:
+                with open(self._disk_path(etag, key), 'rb') as f:
+                    mimetype, _, body = f.read().partition(b'\n')
+            except FileNotFoundError:
+                pass
+            else:
+                entry = (body, mimetype.decode())
+                self._remember(key, etag, entry)
+                with self._lock:
+                    self.disk_hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, etag, body, mimetype):
+        entry = (body, mimetype)
+        self._remember(key, etag, entry)
+        if app.config['PAGE_CACHE_DIR']:
+            path = self._disk_path(etag, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(mimetype.encode() + b'\n' + body)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key, etag, entry):
+        max_bytes = app.config['PAGE_CACHE_MAX_MB'] * 1024 * 1024
+        size = len(entry[0]) + len(key)
+        with self._lock:
+            if etag != self._etag or size > max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0]) + len(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > max_bytes:
+                old_key, old = self._entries.popitem(last=False)
+                self._bytes -= len(old[0]) + len(old_key)
+
+    def note_bypass(self):
+        with self._lock:
+            self.bypass += 1
+
+    def clear(self):
+        with self._lock:
+            self._switch(None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'bypass': self.bypass,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+
+page_cache = PageCache()
+
+
+def _tee_into_cache(chunks, key, etag, mimetype):
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    # só chega aqui se o stream foi até o fim (cliente não desconectou, sem erro)
+    page_cache.put(key, etag, b''.join(parts), mimetype)
+
+
+def cached_page(*params):
+    """Cache de página inteira para visitantes anônimos (use abaixo de
+    conditional_catalog_page). A chave é a rota + os `params` da query string
+    que a view usa, em ordem fixa; qualquer outro parâmetro (utm_*, fbclid...)
+    é ignorado e cai na mesma entrada. Host e esquema também entram: a página
+    tem URLs absolutas (links do WhatsApp com o link do produto)."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # quem tem cookie de sessão (admin) sempre vê a página renderizada na hora;
+            # olha o cookie e não a session para não acrescentar Vary: Cookie nas páginas públicas
+            if (not app.config['PAGE_CACHE_MAX_MB'] or request.method not in ('GET', 'HEAD')
+                    or app.config['SESSION_COOKIE_NAME'] in request.cookies):
+                page_cache.note_bypass()
+                return view(*args, **kwargs)
+            query = urlencode([(p, v) for p in params for v in request.args.getlist(p) if v])
+            key = f"{request.scheme}://{request.host}|{request.endpoint}|{sorted(kwargs.items())}|{query}"
+            etag = getattr(g, 'catalog_etag', None) or f'{storefront_build_id()}-{catalog_state()[0]}'
+            entry = page_cache.get(key, etag)
+            if entry is not None:
+                resp = app.response_class(entry[0], mimetype=entry[1])
+                resp.headers['X-Cache'] = 'HIT'
+                return resp
+            resp = app.make_response(view(*args, **kwargs))
+            if resp.status_code == 200 and resp.is_streamed:
+                # página em streaming: guarda uma cópia enquanto os pedaços saem
+                resp.response = _tee_into_cache(resp.response, key, etag, resp.mimetype)
+            elif resp.status_code == 200:
+                page_cache.put(key, etag, resp.get_data(), resp.mimetype)
+            resp.headers['X-Cache'] = 'MISS'
+            return resp
+        return wrapper
+    return decorator
+
+
+# ------------------ CACHE DE FRAGMENTOS ------------------
+
+# blocos {% cache %} dos templates (carrossel, filtro de classes, rodapé); 0 desliga
+app.config['FRAGMENT_CACHE'] = os.getenv('SOSCOZINHAS_FRAGMENT_CACHE', '1') != '0'
+# o filtro de classes varia com class_id/sort da URL: limita quantas variações ficam
+app.config['FRAGMENT_CACHE_MAX_ENTRIES'] = 256
+
+
+class FragmentCache:
+    """HTML de blocos que só dependem de uma tabela pequena e raramente editada
+    (hero_banners, classes, contato), reaproveitado entre todas as páginas e
+    ordenações. Cada entrada guarda o dado do snapshot de onde saiu e só vale
+    enquanto o snapshot atual tiver o mesmo dado (edição feita por outro worker
+    também invalida); as rotas do admin descartam as da tabela na hora."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def render(self, key, source, render):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is source or entry[0] == source):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        html = render()
+        with self._lock:
+            self._entries[key] = (source, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > app.config['FRAGMENT_CACHE_MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+        return html
+
+    def invalidate(self, *tables):
+        # sem argumentos: tudo (ex.: tema, que aparece em todos os blocos)
+        with self._lock:
+            for key in [k for k in self._entries if not tables or k[1] in tables]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 'classes', class_id, sort %}...{% endcache %}
+
+    O primeiro argumento é a tabela de que o bloco depende, que também é o nome
+    da variável do template com os dados dela (hero_banners, classes, contato);
+    os demais entram na chave (variações do mesmo bloco)."""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        table = parser.parse_expression()
+        vary = []
+        while parser.stream.skip_if('comma'):
+            vary.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        block = nodes.Const(f'{parser.name}:{lineno}')
+        call = self.call_method('_render', [block, table, nodes.List(vary), nodes.ContextReference()])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, block, table, vary, context, caller):
+        if not app.config['FRAGMENT_CACHE']:
+            return caller()
+        return fragment_cache.render((block, table, tuple(vary)), context.get(table), caller)
+
+
+# nome fixo: com o padrão (módulo.classe) o bytecode/pré-compilado gerado com
+# "import app2" não serviria para "python app2.py" (__main__)
+FragmentCacheExtension.identifier = 'soscozinhas.fragment_cache'
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+
+# ------------------ STREAMING ------------------
+
+# a vitrine sai em partes: o <head> (tema, preload do banner) vai assim que
+# renderiza e o grid de produtos vai sendo enviado enquanto é gerado
+app.config['STREAM_INDEX'] = os.getenv('SOSCOZINHAS_STREAM_INDEX', '1') != '0'
+# o Jinja produz um pedaço por expressão; junta até esse tamanho antes de enviar
+app.config['STREAM_CHUNK_BYTES'] = 8192
+
+
+def buffered_stream(pieces):
+    """Agrupa os pedaços de um stream_template em blocos de STREAM_CHUNK_BYTES,
+    mandando na hora o bloco que fecha o </head>."""
+    limit = app.config['STREAM_CHUNK_BYTES']
+    buf, size = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= limit or '</head>' in piece:
+            yield ''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
+# ------------------ TEMPLATES ------------------
+
+# bytecode dos templates compilados, reaproveitado entre restarts/processos
+# (a chave inclui o checksum do fonte: template editado recompila sozinho); '' desliga
+app.config['JINJA_CACHE_DIR'] = os.getenv('SOSCOZINHAS_JINJA_CACHE_DIR', os.path.join(app.root_path, '.jinja_cache'))
+# gerado por compile_templates.py no deploy: módulos Python prontos, sem compilar nada no boot
+app.config['PRECOMPILED_TEMPLATES'] = os.getenv('SOSCOZINHAS_PRECOMPILED_TEMPLATES',
+                                                os.path.join(app.root_path, 'templates_compiled'))
+# compila todos os templates ao subir, em vez de na primeira request que usa cada um.
+# Desligado por padrão: roda no import, e scripts/workers de imagem que importam o app
+# pagariam por templates que nunca usam (o pré-compilado já tira a compilação do boot)
+app.config['TEMPLATE_WARMUP'] = os.getenv('SOSCOZINHAS_TEMPLATE_WARMUP', '0') == '1'
+PRECOMPILED_STAMP = 'build.json'
+# loader dos fontes (templates/): a lista de templates e o fallback do pré-compilado
+_source_loader = app.jinja_env.loader
+
+
+def templates_digest():
+    """Hash do conteúdo de templates/ (+ versão e extensões do Jinja): o
+    pré-compilado só vale para exatamente esses fontes."""
+    digest = hashlib.sha1(package_version('Jinja2').encode())
+    digest.update(' '.join(sorted(app.jinja_env.extensions)).encode())
+    for name in sorted(_source_loader.list_templates()):
+        source = _source_loader.get_source(app.jinja_env, name)[0]
+        digest.update(f'{name}\0{source}\0'.encode())
+    return digest.hexdigest()
+
+
+def configure_templates():
+    """Liga o bytecode cache e, se o pré-compilado bater com os fontes, carrega
+    os templates dele; senão continua compilando de templates/."""
+    cache_dir = app.config['JINJA_CACHE_DIR']
+    app.jinja_env.bytecode_cache = None
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if not os.access(cache_dir, os.W_OK):
+                raise PermissionError(cache_dir)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError:
+            logging.warning('cache de bytecode dos templates desligado: %s não é gravável', cache_dir)
+    app.jinja_env.loader = _source_loader
+    compiled = app.config['PRECOMPILED_TEMPLATES']
+    if compiled and os.path.exists(compiled):
+        try:
+            with open(os.path.join(compiled, PRECOMPILED_STAMP), encoding='utf-8') as f:
+                stamp = json.load(f).get('templates')
+        except (OSError, ValueError):
+            stamp = None
+        if stamp == templates_digest():
+            app.jinja_env.loader = ChoiceLoader([ModuleLoader(compiled), _source_loader])
+        else:
+            logging.warning('%s não corresponde a templates/ (rode compile_templates.py); compilando dos fontes', compiled)
+    # o Environment guarda os Template já carregados: descarta os do loader anterior
+    if app.jinja_env.cache is not None:
+        app.jinja_env.cache.clear()
+
+
+def warm_templates():
+    """Carrega (compila ou lê do cache) todos os templates; retorna quantos."""
+    names = _source_loader.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+configure_templates()
+
+
+# ------------------ ROTAS SITE ------------------
+
+@app.route('/')
+@conditional_catalog_page
+@cached_page('cursor', 'page', 'per_page', 'class_id', 'sort')
+def index():
+    # parâmetros: cursor, por_pagina, classe, sort (page é só o número exibido)
+    per_page, class_filter, sort, cursor = catalog_listing_args(app.config['CATALOG_MAX_PER_PAGE'])
+    class_id = request.args.get('class_id')
+    page = max(1, request.args.get('page', 1, type=int) or 1) if cursor else 1
+    catalog = get_catalog()
+    produtos = catalog_listing(catalog, class_filter, sort, cursor, per_page)
+    total = catalog.count(class_filter)
+    total_pages = max(page, (total + per_page - 1) // per_page)
+    context = dict(produtos=produtos, hero_banners=catalog.hero_banners, contato=catalog.contato,
+                   classes=catalog.classes, page=page, per_page=per_page, total=total, total_pages=total_pages,
+                   class_id=class_id, sort=sort)
+    if app.config['STREAM_INDEX']:
+        return app.response_class(buffered_stream(stream_template('index.html', **context)), mimetype='text/html')
+    return render_template('index.html', **context)
+
+# nova rota: detalhe do produto
+@app.route('/produto/<int:id>')
+@conditional_catalog_page
+@cached_page()
+def product_detail(id):
+    catalog = get_catalog()
+    if catalog.produtos is not None:
+        prod = catalog.produtos.get(id)
+    else:
+        row = get_db().execute('SELECT * FROM produtos WHERE id=?', (id,)).fetchone()
+        prod = catalog_product(row) if row else None
+    if prod is None:
+        abort(404)
+    produto = dict(prod, imagem=prod['imagem_grande'])
+    return render_template('produto.html', produto=produto, contato=catalog.contato)
+
+@app.route('/busca')
+@conditional_catalog_page
+def busca():
+    q = request.args.get('q', '').strip()
+    per_page = request.args.get('per_page', 12, type=int) or 12
+    per_page = max(1, min(per_page, app.config['CATALOG_MAX_PER_PAGE']))
+    page = max(1, min(request.args.get('page', 1, type=int) or 1, SEARCH_MAX_PAGES))
+    catalog = get_catalog()
+    produtos, total = [], 0
+    if q:
+        rows, total = search_produtos(get_db(), q, ['p.ativo=1'], limit=per_page, offset=(page - 1) * per_page)
+        produtos = [catalog_product(r) for r in rows]
+    total_pages = min(SEARCH_MAX_PAGES, (total + per_page - 1) // per_page)
+    return render_template('busca.html', q=q, produtos=produtos, contato=catalog.contato,
+                           page=page, per_page=per_page, total=total, total_pages=total_pages)
+
+def negotiate_image_format(formats, accept_mimetypes):
+    """Primeiro formato de `formats` (ordem de preferência do perfil) que o cliente
+    anuncia explicitamente no Accept; senão o de fallback. */* não conta: todo
+    navegador manda, inclusive os que não decodificam AVIF."""
+    accepted = {mime for mime, q in accept_mimetypes if q > 0}
+    for fmt in formats:
+        if IMAGE_FORMATS[fmt][2] in accepted:
+            return fmt
+    return fallback_format(formats)
+
+
+@app.route('/imagem/<image_hash>/<int:width>')
+def imagem(image_hash, width):
+    # variante de uma imagem do store no melhor formato que o cliente aceita
+    # (para onde não dá para usar <picture>: og:image, e-mail, apps)
+    profile = request.args.get('perfil', 'produto')
+    if profile not in VARIANT_PROFILES:
+        abort(404)
+    row = get_db().execute('SELECT path, variants FROM images WHERE hash=?', (image_hash,)).fetchone()
+    if row is None:
+        abort(404)
+    by_format = variants_by_format(json.loads(row['variants'] or '{}').get(profile))
+    if by_format:
+        fmt = negotiate_image_format(by_format, request.accept_mimetypes)
+        sizes = sorted(by_format[fmt].items(), key=lambda kv: int(kv[0]))
+        # menor variante que cobre a largura pedida (ou a maior que existir)
+        path = next((p for w, p in sizes if int(w) >= width), sizes[-1][1])
+    else:
+        path = row['path']  # variantes ainda na fila
+    resp = send_from_directory('static', path, max_age=86400)
+    resp.vary.add('Accept')
+    return resp
+
+
+@app.route('/img/<image_hash>/<int:width>x<int:height>.<ext>')
+def img(image_hash, width, height, ext):
+    # miniatura recortada no tamanho exato, gerada na primeira request e servida do cache
+    fmt = IMAGE_EXTENSIONS.get(ext)
+    if fmt is None or (width, height) not in IMAGE_RESIZE_SIZES or not _encoder_available(fmt):
+        abort(404)
+    row = get_db().execute('SELECT path FROM images WHERE hash=?', (image_hash,)).fetchone()
+    if row is None:
+        abort(404)
+    try:
+        path = resize_cache.get(image_hash, os.path.join('static', row['path']), width, height, fmt)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # DecompressionBombError: original gigante (acima do MAX_IMAGE_PIXELS do Pillow)
+        logging.warning('miniatura %s %sx%s.%s falhou: %s', image_hash, width, height, ext, e)
+        abort(404)
+    # o hash é do conteúdo: a URL nunca muda de significado
+    resp = send_from_directory('static', path, max_age=31536000)
+    resp.cache_control.immutable = True
+    return resp
+
+# ------------------ API JSON ------------------
+
+# integrações puxam o catálogo em páginas bem maiores que as da vitrine
+app.config['API_MAX_PER_PAGE'] = int(os.getenv('SOSCOZINHAS_API_MAX_PER_PAGE', '500') or 500)
+API_DEFAULT_PER_PAGE = 48
+
+
+def api_dumps(obj):
+    # orjson quando instalado (várias vezes mais rápido); senão json compacto
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def api_response(obj, status=200):
+    return app.response_class(api_dumps(obj), status=status, mimetype='application/json')
+
+
+@functools.lru_cache(maxsize=8192)
+def _static_path(script_root, filename):
+    # o manifest é fixo no processo: a mesma imagem sempre dá a mesma URL
+    return url_for('static', filename=filename)
+
 
+def api_urls():
+    """(static_url, produto_url): URLs absolutas com host e prefixos resolvidos
+    uma vez por request (url_for a cada produto pesa numa página de 500)."""
+    base, root = request.host_url[:-1], request.script_root
+    produto = base + url_for('product_detail', id=0)[:-1]
+    return (lambda path: base + _static_path(root, path)), (lambda id: f'{produto}{id}')
 
-def format_price(value):
+
+def _api_preco(preco):
+    # preço salvo como texto ('10,50') sai como número; lixo sai como null
+    if preco is None or isinstance(preco, (int, float)):
+        return preco
     try:
-        v = float(value)
-        # format with two decimals and comma as decimal separator
-        return f"{v:,.2f}".replace(',','X').replace('.',',').replace('X','.')
-    except Exception:
-        return value
+        return float(str(preco).replace(',', '.'))
+    except ValueError:
+        return None
 
 
-def build_whatsapp_url(phone, product_name, product_id):
-    if not phone:
-        return '#'
-    phone_digits = ''.join(c for c in str(phone) if c.isdigit())
+def api_image(d, static_url):
+    """Imagem de um produto/banner: URL principal, dimensões/cor (quando há
+    imagem_meta) e URLs absolutas das variantes {formato: {largura: url}}."""
+    if not d.get('imagem'):
+        return None
+    out = {'url': static_url(d['imagem'])}
+    info = d.get('imagem_info')
+    if info:
+        out.update(largura=info['w'], altura=info['h'], cor=info['cor'])
     try:
-        product_url = url_for('product_detail', id=product_id, _external=True)
-    except Exception:
-        product_url = url_for('index', _external=True) + f"#product-{product_id}"
-    msg = f"Olá, vim do site e gostaria de saber mais sobre o produto {product_name}. Link: {product_url}"
-    return f"https://api.whatsapp.com/send?phone={phone_digits}&text={quote_plus(msg)}"
+        by_format = variants_by_format(json.loads(d.get('imagem_variants') or '{}'))
+    except ValueError:
+        by_format = {}
+    if by_format:
+        out['variantes'] = {fmt: {w: static_url(path) for w, path in sizes.items()}
+                            for fmt, sizes in by_format.items()}
+    return out
 
-@app.context_processor
-def inject_helpers():
-    # format_price deve existir no seu código; mantém a função disponível nos templates
-    return dict(format_price=format_price, whatsapp_link=build_whatsapp_url)
 
-UPLOAD_FOLDER_HERO = 'static/uploads/hero'
-UPLOAD_FOLDER_PROD = 'static/uploads/produtos'
+def api_produto(p, urls):
+    static_url, produto_url = urls
+    return {'id': p['id'], 'nome': p['nome'], 'descricao': p['descricao'], 'preco': _api_preco(p['preco']),
+            'ativo': p['ativo'] == 1, 'class_id': p['class_id'],
+            'url': produto_url(p['id']), 'imagem': api_image(p, static_url)}
 
-app.config['UPLOAD_FOLDER_HERO'] = UPLOAD_FOLDER_HERO
-app.config['UPLOAD_FOLDER_PROD'] = UPLOAD_FOLDER_PROD
 
-def get_db():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def _api_listing(page, extra):
+    """Corpo de /api/v1/produtos em pedaços de ~STREAM_CHUNK_BYTES, serializando
+    produto a produto. Os cursores só existem depois de percorrer a página (modo
+    SQL): vão no fim do objeto."""
+    limit = app.config['STREAM_CHUNK_BYTES']
+    urls = api_urls()
+    buf, size = [b'{"produtos":['], 0
+    for n, p in enumerate(page):
+        item = api_dumps(api_produto(p, urls))
+        buf.append(b',' + item if n else item)
+        size += len(item)
+        if size >= limit:
+            yield b''.join(buf)
+            buf, size = [], 0
+    tail = api_dumps(dict(extra, next_cursor=page.next_cursor, prev_cursor=page.prev_cursor))
+    buf.append(b'],' + tail[1:])
+    yield b''.join(buf)
 
-def init_db():
-    conn = get_db()
-    cursor = conn.cursor()
-    # Admin
-    cursor.execute('''CREATE TABLE IF NOT EXISTS admin (id INTEGER PRIMARY KEY, username TEXT, password TEXT)''')
-    # Produtos
-    cursor.execute('''CREATE TABLE IF NOT EXISTS produtos (id INTEGER PRIMARY KEY, nome TEXT, descricao TEXT, preco REAL, imagem TEXT, ativo INTEGER DEFAULT 1)''')
-    # Hero banners
-    cursor.execute('''CREATE TABLE IF NOT EXISTS hero_banners (
-                        id INTEGER PRIMARY KEY, titulo TEXT, descricao1 TEXT, descricao2 TEXT, imagem TEXT)''')
-    # Contato (ensure schema includes instagram and endereco)
-    cursor.execute('''CREATE TABLE IF NOT EXISTS contato (id INTEGER PRIMARY KEY, whatsapp TEXT)''')
-    # ensure contato has instagram and endereco columns (idempotent)
-    cols = [r[1] for r in cursor.execute("PRAGMA table_info(contato)").fetchall()]
-    if 'instagram' not in cols:
-        try:
-            cursor.execute("ALTER TABLE contato ADD COLUMN instagram TEXT")
-        except Exception:
-            pass
-    if 'endereco' not in cols:
-        try:
-            cursor.execute("ALTER TABLE contato ADD COLUMN endereco TEXT")
-        except Exception:
-            pass
-    # Default admin (store hashed password). If an admin exists in plaintext, migrate it.
-    admin_row = cursor.execute("SELECT * FROM admin").fetchone()
-    if not admin_row:
-        hashed = generate_password_hash('admin123')  # trocar senha inicial em produção
-        cursor.execute("INSERT INTO admin (username, password) VALUES (?, ?)", ('admin', hashed))
-    else:
-        # migrate plaintext password to hashed (idempotent): detect likely-plain by absence of hashing prefix
-        pwd = admin_row['password'] or ''
-        if pwd and not (pwd.startswith('pbkdf2:') or pwd.startswith('$2b$') or pwd.startswith('$argon2')):
-            new_hashed = generate_password_hash(pwd)
-            try:
-                cursor.execute("UPDATE admin SET password=? WHERE id=?", (new_hashed, admin_row['id']))
-            except Exception:
-                pass
-    # Default contato (insert a record if table empty)
-    if not cursor.execute("SELECT * FROM contato").fetchone():
-        cursor.execute("INSERT INTO contato (whatsapp, instagram, endereco) VALUES (?,?,?)", ('5511999999999','',''))
-    # Classes (categorias)
-    cursor.execute('''CREATE TABLE IF NOT EXISTS classes (id INTEGER PRIMARY KEY, nome TEXT)''')
-    # Ensure produtos has class_id column
-    try:
-        cursor.execute('ALTER TABLE produtos ADD COLUMN class_id INTEGER')
-    except Exception:
-        pass
-    # Ensure produtos and hero_banners have imagem_variants column to store JSON of variants
-    try:
-        cursor.execute('ALTER TABLE produtos ADD COLUMN imagem_variants TEXT')
-    except Exception:
-        pass
-    try:
-        cursor.execute('ALTER TABLE hero_banners ADD COLUMN imagem_variants TEXT')
-    except Exception:
-        pass
-    try:
-        cursor.execute('ALTER TABLE hero_banners ADD COLUMN show_overlay INTEGER DEFAULT 1')
-    except Exception:
-        pass
-    try:
-        cursor.execute('ALTER TABLE hero_banners ADD COLUMN show_button INTEGER DEFAULT 1')
-    except Exception:
-        pass
-    # FAQ table
-    cursor.execute('''CREATE TABLE IF NOT EXISTS faq (id INTEGER PRIMARY KEY, pergunta TEXT, resposta TEXT)''')
-    conn.commit()
-    conn.close()
 
+@app.route('/api/v1/produtos')
+@conditional_catalog_page
+def api_produtos():
+    # mesmos parâmetros da vitrine: cursor, per_page, class_id, sort
+    per_page, class_filter, sort, cursor = catalog_listing_args(app.config['API_MAX_PER_PAGE'], API_DEFAULT_PER_PAGE)
+    catalog = get_catalog()
+    page = catalog_listing(catalog, class_filter, sort, cursor, per_page)
+    body = _api_listing(page, {'total': catalog.count(class_filter), 'per_page': per_page, 'sort': sort})
+    if per_page <= API_DEFAULT_PER_PAGE:
+        return app.response_class(b''.join(body), mimetype='application/json')
+    # páginas grandes saem em streaming: nada de lista inteira nem JSON inteiro em memória
+    return app.response_class(stream_with_context(body), mimetype='application/json')
 
-def generate_image_variants(src_path, dest_dir, base_name):
-    """
-    Generate image variants (webp) at widths [480,768,1024,1440,1920].
-    Returns dict {width: relative_path}
-    dest_dir: absolute path to folder under static (e.g., static/uploads/produtos)
-    base_name: name without extension (e.g., 'copos')
-    """
-    if Image is None:
-        raise RuntimeError('Pillow is required to generate image variants. Install with pip install Pillow')
-    sizes = [480, 768, 1024, 1440, 1920, 2560]
-    variants = {}
-    os.makedirs(dest_dir, exist_ok=True)
-    try:
-        im = Image.open(src_path).convert('RGB')
-    except Exception as e:
-        raise
-    for w in sizes:
-        # avoid upscaling: if desired width > original width, use original width
-        target_w = min(w, im.width)
-        ratio = im.height / im.width
-        h = int(target_w * ratio)
-        if target_w == im.width:
-            im_out = im
-        else:
-            im_out = im.resize((target_w, h), Image.LANCZOS)
-        out_name = f"{base_name}-{target_w}.webp"
-        out_path = os.path.join(dest_dir, out_name)
-        # save webp with slightly higher quality to preserve hero visuals
-        im_out.save(out_path, 'WEBP', quality=85, method=6)
-        # store relative path from static/
-        rel = os.path.join(os.path.relpath(dest_dir, 'static'), out_name).replace('\\', '/')
-        variants[str(target_w)] = rel
-    return variants
 
+@app.route('/api/v1/produtos/<int:id>')
+@conditional_catalog_page
+def api_produto_detail(id):
+    catalog = get_catalog()
+    if catalog.produtos is not None:
+        prod = catalog.produtos.get(id)
+    else:
+        row = get_db().execute('SELECT * FROM produtos WHERE id=?', (id,)).fetchone()
+        prod = catalog_product(row) if row else None
+    if prod is None:
+        return api_response({'erro': 'produto não encontrado'}, 404)
+    urls = api_urls()
+    item = api_produto(prod, urls)
+    if item['imagem'] and prod.get('imagem_grande'):
+        item['imagem']['url_grande'] = urls[0](prod['imagem_grande'])
+    return api_response(item)
 
-def build_srcset_from_variants(variants):
-    # variants: dict width->relative_path
-    items = []
-    for w in sorted([int(k) for k in variants.keys()]):
-        items.append(f"{ url_for('static', filename=variants[str(w)]) } {w}w")
-    return ', '.join(items)
 
-# ------------------ ROTAS SITE ------------------
+@app.route('/api/v1/classes')
+@conditional_catalog_page
+def api_classes():
+    catalog = get_catalog()
+    return api_response({'classes': [{'id': c['id'], 'nome': c['nome'], 'produtos': catalog.count(c['id'])}
+                                     for c in catalog.classes]})
 
-@app.route('/')
-def index():
-    # parâmetros: pagina, por_pagina, classe, sort
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 12))
-    class_id = request.args.get('class_id')
-    sort = request.args.get('sort', 'newest')  # newest, price_asc, price_desc
-    conn = get_db()
-    params = []
-    where = ['ativo=1']
-    if class_id:
-        where.append('class_id=?')
-        params.append(class_id)
-    order = 'id DESC'
-    if sort == 'price_asc':
-        order = 'preco ASC'
-    elif sort == 'price_desc':
-        order = 'preco DESC'
-    sql = 'SELECT * FROM produtos WHERE ' + ' AND '.join(where) + f' ORDER BY {order} '
-    # pagination
-    offset = (page-1)*per_page
-    sql_pag = sql + ' LIMIT ? OFFSET ?'
-    params_pag = params + [per_page, offset]
-    produtos_rows = conn.execute(sql_pag, params_pag).fetchall()
-    # convert rows to dicts and build srcset/default image when imagem_variants present
-    produtos = []
-    for r in produtos_rows:
-        rd = dict(r)
-        if rd.get('imagem_variants'):
-            try:
-                variants = json.loads(rd['imagem_variants'])
-                rd['imagem_srcset'] = build_srcset_from_variants(variants)
-                rd['imagem'] = variants.get('768') or list(variants.values())[0]
-            except Exception:
-                pass
-        produtos.append(rd)
-    total = conn.execute('SELECT COUNT(*) FROM produtos WHERE ' + ' AND '.join(where), params).fetchone()[0]
-    hero_rows = conn.execute('SELECT * FROM hero_banners ORDER BY id DESC').fetchall()
-    hero_banners = []
-    for h in hero_rows:
-        hd = dict(h)
-        if hd.get('imagem_variants'):
-            try:
-                variants = json.loads(hd['imagem_variants'])
-                hd['imagem_srcset'] = build_srcset_from_variants(variants)
-                # pick a large default for hero (prefer 2560,1920,1440...)
-                for prefer in ['2560','1920','1440','1024','768','480']:
-                    if variants.get(prefer):
-                        hd['imagem'] = variants.get(prefer)
-                        break
-                else:
-                    hd['imagem'] = list(variants.values())[0]
-            except Exception:
-                pass
-        hero_banners.append(hd)
-    contato_row = conn.execute('SELECT * FROM contato ORDER BY id DESC LIMIT 1').fetchone()
-    contato = dict(contato_row) if contato_row else None
-    classes = conn.execute('SELECT * FROM classes ORDER BY nome').fetchall()
-    conn.close()
-    total_pages = (total + per_page - 1) // per_page
-    return render_template('index.html', produtos=produtos, hero_banners=hero_banners, contato=contato, classes=classes,
-                           page=page, per_page=per_page, total=total, total_pages=total_pages, class_id=class_id, sort=sort)
 
-# nova rota: detalhe do produto
-@app.route('/produto/<int:id>')
-def product_detail(id):
-    conn = get_db()
-    prod_row = conn.execute('SELECT * FROM produtos WHERE id=?',(id,)).fetchone()
-    if not prod_row:
-        conn.close()
-        abort(404)
-    produto = dict(prod_row)
-    # processar variantes se houver
-    if produto.get('imagem_variants'):
-        try:
-            variants = json.loads(produto['imagem_variants'])
-            produto['imagem_srcset'] = build_srcset_from_variants(variants)
-            produto['imagem'] = variants.get('1024') or variants.get('768') or list(variants.values())[0]
-        except Exception:
-            pass
-    contato_row = conn.execute('SELECT * FROM contato ORDER BY id DESC LIMIT 1').fetchone()
-    contato = dict(contato_row) if contato_row else None
-    conn.close()
-    return render_template('produto.html', produto=produto, contato=contato)
+@app.route('/api/v1/hero')
+@conditional_catalog_page
+def api_hero():
+    static_url = api_urls()[0]
+    return api_response({'hero': [{'id': h['id'], 'titulo': h['titulo'], 'descricao1': h['descricao1'],
+                                   'descricao2': h['descricao2'], 'imagem': api_image(h, static_url)}
+                                  for h in get_catalog().hero_banners]})
+
 
 # ------------------ ROTAS ADMIN ------------------
 
@@ -299,7 +2964,6 @@ def admin_login():
         password = request.form['password']
         conn = get_db()
         admin = conn.execute('SELECT * FROM admin WHERE username=?',(username,)).fetchone()
-        conn.close()
         if admin and admin['password'] and check_password_hash(admin['password'], password):
             session['admin'] = True
             return redirect(url_for('admin_dashboard'))
@@ -316,37 +2980,79 @@ def admin_dashboard():
     total_produtos_ativos = conn.execute('SELECT COUNT(*) FROM produtos WHERE ativo=1').fetchone()[0]
     total_banners = conn.execute('SELECT COUNT(*) FROM hero_banners').fetchone()[0]
     contato = conn.execute('SELECT * FROM contato ORDER BY id DESC LIMIT 1').fetchone()
-    ult_rows = conn.execute('SELECT id,nome,preco,imagem,imagem_variants FROM produtos ORDER BY id DESC LIMIT 4').fetchall()
-    ultimos_produtos = []
-    for r in ult_rows:
-        rd = dict(r)
-        if rd.get('imagem_variants'):
-            try:
-                variants = json.loads(rd['imagem_variants'])
-                rd['imagem_srcset'] = build_srcset_from_variants(variants)
-                rd['imagem'] = variants.get('768') or list(variants.values())[0]
-            except Exception:
-                pass
-        ultimos_produtos.append(rd)
-    ult_brows = conn.execute('SELECT id,titulo,imagem,imagem_variants FROM hero_banners ORDER BY id DESC LIMIT 3').fetchall()
-    ultimos_banners = []
-    for h in ult_brows:
-        hd = dict(h)
-        if hd.get('imagem_variants'):
-            try:
-                variants = json.loads(hd['imagem_variants'])
-                hd['imagem_srcset'] = build_srcset_from_variants(variants)
-                hd['imagem'] = variants.get('768') or list(variants.values())[0]
-            except Exception:
-                pass
-        ultimos_banners.append(hd)
-    conn.close()
+    ult_rows = conn.execute('SELECT id,nome,preco,imagem,imagem_variants,imagem_hash FROM produtos ORDER BY id DESC LIMIT 4').fetchall()
+    ultimos_produtos = [apply_image_variants(dict(r), ('768',)) for r in ult_rows]
+    ult_brows = conn.execute('SELECT id,titulo,imagem,imagem_variants,imagem_hash FROM hero_banners ORDER BY id DESC LIMIT 3').fetchall()
+    ultimos_banners = [apply_image_variants(dict(h), ('768',)) for h in ult_brows]
     return render_template('admin_dashboard.html', total_produtos=total_produtos, total_produtos_ativos=total_produtos_ativos,
                            total_banners=total_banners, contato=contato, ultimos_produtos=ultimos_produtos,
-                           ultimos_banners=ultimos_banners)
+                           ultimos_banners=ultimos_banners, image_jobs=image_jobs.counts(conn),
+                           page_cache=page_cache.stats(), fragment_cache=fragment_cache.stats())
+
+@app.route('/admin/perf')
+def admin_perf():
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    top_n = app.config['PROFILER_TOP_N']
+    rotas = sorted(metrics.summary('http_request_duration_seconds', ('endpoint', 'method')),
+                   key=lambda r: (r['p95'] is None, r['p95'] or 0, r['mean']), reverse=True)[:top_n]
+    sql = sorted(metrics.summary('sql_query_duration_seconds', ('op', 'table')),
+                 key=lambda r: r['total'], reverse=True)[:top_n]
+    return render_template('admin_perf.html', rotas=rotas, sql=sql, queries=profiler.top_queries(top_n),
+                           profiles=profiler.list())
+
+
+@app.route('/admin/perf/<int:profile_id>.<fmt>')
+@app.route('/admin/perf/todos.<fmt>', defaults={'profile_id': None})
+def admin_perf_export(fmt, profile_id):
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    if profile_id is not None and not any(p['id'] == profile_id for p in profiler.list()):
+        abort(404)  # saiu do buffer circular (ou nunca existiu)
+    name = f"perf-{profile_id or 'todos'}"
+    if fmt == 'txt':
+        resp = app.response_class(profiler.collapsed(profile_id), mimetype='text/plain')
+        name += '.collapsed.txt'
+    elif fmt == 'json':
+        resp = api_response(profiler.speedscope(profile_id))
+        name += '.speedscope.json'
+    else:
+        abort(404)
+    resp.headers['Content-Disposition'] = f'attachment; filename="{name}"'
+    return resp
+
 
 # ------------------ PRODUTOS ------------------
 
+# listagem do admin em páginas, só com as colunas do card (sem descricao)
+app.config['ADMIN_PER_PAGE'] = int(os.getenv('SOSCOZINHAS_ADMIN_PER_PAGE', '48') or 48)
+ADMIN_LIST_COLUMNS = 'p.id, p.nome, p.preco, p.ativo, p.class_id, p.imagem, p.imagem_variants, p.imagem_hash, p.imagem_status'
+ADMIN_STATUS_WHERE = {'ativos': 'p.ativo=1', 'inativos': 'p.ativo=0', 'todos': None}
+
+
+def admin_produtos_page(conn, where, cursor, per_page):
+    """Página da listagem do admin, mais novos primeiro, por keyset no id (índice
+    (ativo, id) ou o próprio rowid): (rows, next_cursor, prev_cursor)."""
+    backwards = cursor is not None and cursor[0] == 'p'
+    order = _SQL_ORDER['newest'][1 if backwards else 0]
+    [(clause, extra)] = _keyset_segments(backwards, cursor, False)
+    conds = [c for c in (where, clause) if c]
+    sql = f'SELECT {ADMIN_LIST_COLUMNS} FROM produtos p'
+    if conds:
+        sql += ' WHERE ' + ' AND '.join(conds)
+    rows = conn.execute(sql + f' ORDER BY {order} LIMIT ?', extra + [per_page + 1]).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = cursor is not None, more
+    next_cursor = encode_cursor('n', rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor('p', rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
 @app.route('/admin/produtos')
 def admin_produtos():
     if not session.get('admin'):
@@ -354,35 +3060,551 @@ def admin_produtos():
     # parâmetros de busca/filtro
     q = request.args.get('q', '').strip()
     status = request.args.get('status', 'ativos')  # 'ativos', 'inativos', 'todos'
+    if status not in ADMIN_STATUS_WHERE:
+        status = 'ativos'
+    where = ADMIN_STATUS_WHERE[status]
+    per_page = app.config['ADMIN_PER_PAGE']
     conn = get_db()
-    sql = 'SELECT * FROM produtos'
-    params = []
-    where = []
-    if status == 'ativos':
-        where.append('ativo=1')
-    elif status == 'inativos':
-        where.append('ativo=0')
+    prev_url = next_url = None
     if q:
-        where.append('(nome LIKE ? OR descricao LIKE ?)')
-        params.extend([f'%{q}%', f'%{q}%'])
-    if where:
-        sql += ' WHERE ' + ' AND '.join(where)
-    sql += ' ORDER BY id DESC'
-    rows = conn.execute(sql, params).fetchall()
-    produtos = []
-    for r in rows:
-        rd = dict(r)
-        # if imagem_variants present, build srcset and choose default
-        if rd.get('imagem_variants'):
+        # busca: por relevância, então paginada por número (limitada como a /busca)
+        counts = search_counts_by_ativo(conn, q)
+        page = max(1, min(request.args.get('page', 1, type=int) or 1, SEARCH_MAX_PAGES))
+        rows, total = search_produtos(conn, q, [where] if where else [], limit=per_page,
+                                      offset=(page - 1) * per_page, columns=ADMIN_LIST_COLUMNS)
+        total_pages = min(SEARCH_MAX_PAGES, (total + per_page - 1) // per_page)
+        if page > 1:
+            prev_url = url_for('admin_produtos', q=q, status=status, page=page - 1)
+        if page < total_pages:
+            next_url = url_for('admin_produtos', q=q, status=status, page=page + 1)
+    else:
+        counts = dict(conn.execute('SELECT ativo, COUNT(*) FROM produtos GROUP BY ativo').fetchall())
+        cursor = decode_cursor(request.args.get('cursor'))
+        page = max(1, request.args.get('page', 1, type=int) or 1) if cursor else 1
+        rows, next_cursor, prev_cursor = admin_produtos_page(conn, where, cursor, per_page)
+        if prev_cursor:
+            prev_url = url_for('admin_produtos', status=status, cursor=prev_cursor, page=page - 1)
+        if next_cursor:
+            next_url = url_for('admin_produtos', status=status, cursor=next_cursor, page=page + 1)
+    tabs = {'ativos': counts.get(1, 0), 'inativos': counts.get(0, 0), 'todos': sum(counts.values())}
+    if not q:
+        total_pages = max(page, (tabs[status] + per_page - 1) // per_page)
+    # variantes/srcset só das linhas da página
+    produtos = [apply_image_variants(dict(r), ('768',)) for r in rows]
+    return render_template('admin_produtos.html', produtos=produtos, q=q, status=status, tabs=tabs,
+                           page=page, total_pages=total_pages, prev_url=prev_url, next_url=next_url)
+
+
+# ------------------ IMPORTAÇÃO E EXPORTAÇÃO ------------------
+
+# planilhas e zips enviados pelo admin ficam aqui até a importação terminar (para retomar)
+app.config['IMPORT_DIR'] = os.getenv('SOSCOZINHAS_IMPORT_DIR', 'imports')
+# linhas por transação (e por checkpoint de progresso)
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('SOSCOZINHAS_IMPORT_BATCH_SIZE', '500') or 500)
+# erros por linha guardados no job (os demais só contam em error_count)
+app.config['IMPORT_MAX_ERRORS'] = 1000
+# 'running' sem progresso há mais que isso: o processo caiu, pode ser retomada
+app.config['IMPORT_STALE_SECONDS'] = 300
+IMPORT_COLUMNS = ('id', 'sku', 'nome', 'descricao', 'preco', 'ativo', 'classe', 'imagem')
+IMPORT_HEADER_ALIASES = {'codigo': 'sku', 'categoria': 'classe', 'foto': 'imagem'}
+_ATIVO_VALUES = {'1': 1, '0': 0, 'sim': 1, 'nao': 0, 's': 1, 'n': 0, 'true': 1, 'false': 0, 'ativo': 1, 'inativo': 0}
+
+
+def _ascii_lower(value):
+    return unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode().strip().lower()
+
+
+def _cell_text(value):
+    # XLSX devolve números: 123.0 vira "123" (sku, id)
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_preco(value):
+    """Preço da planilha: número ou texto (1234.5, "1.234,50", "R$ 12,90")."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        preco = float(value)
+    else:
+        text = _cell_text(value).replace('R$', '').replace(' ', '')
+        if ',' in text:
+            text = text.replace('.', '').replace(',', '.')
+        preco = float(text)
+    if not preco >= 0:
+        raise ValueError
+    return round(preco, 2)
+
+
+def read_table(path):
+    """Linhas de uma planilha CSV ou XLSX, em streaming; a primeira é o cabeçalho."""
+    if path.lower().endswith('.xlsx'):
+        if openpyxl is None:
+            raise RuntimeError('openpyxl não está instalado: envie a planilha em CSV')
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            wb.close()
+        return
+    with open(path, 'rb') as f:
+        sample = f.read(64 * 1024)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1252'  # CSV salvo pelo Excel em português
+    with open(path, newline='', encoding=encoding) as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.read(64 * 1024), delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        yield from csv.reader(f, dialect)
+
+
+class ImportImages:
+    """Imagens de uma importação: um .zip ou uma pasta. Acha o arquivo pelo caminho
+    da planilha ou, se não houver, só pelo nome (zips com subpastas)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = None
+        self._members = {}
+        if path and zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            for info in self._zip.infolist():
+                if not info.is_dir():
+                    self._members.setdefault(info.filename, info)
+                    self._members.setdefault(posixpath.basename(info.filename), info)
+
+    def open(self, name):
+        name = name.replace('\\', '/')
+        if self._zip is not None:
+            info = self._members.get(name) or self._members.get(posixpath.basename(name))
+            return self._zip.open(info) if info else None
+        if self.path and os.path.isdir(self.path):
+            root = os.path.realpath(self.path)
+            full = os.path.realpath(os.path.join(root, name))
+            if full.startswith(root + os.sep) and os.path.isfile(full):
+                return open(full, 'rb')
+        return None
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+class ProductImporter:
+    """Grava as linhas de uma importação em lotes. Cada lote é uma transação:
+    upserts em executemany (por sku, por id ou inserção), classes novas, imagens
+    no store com os jobs de variantes e o progresso do import_jobs. Erros de uma
+    linha (valor inválido, imagem que não existe...) só pulam a linha."""
+
+    def __init__(self, conn, job, header):
+        self.conn = conn
+        self.job = job
+        self.columns = [IMPORT_HEADER_ALIASES.get(c, c) for c in (_ascii_lower(h or '') for h in header)]
+        known = [c for c in self.columns if c in IMPORT_COLUMNS]
+        if not {'id', 'sku', 'nome'} & set(known):
+            raise ValueError('a planilha precisa de uma coluna nome, sku ou id')
+        if len(set(known)) != len(known):
+            raise ValueError('coluna repetida no cabeçalho')
+        self.images = ImportImages(job['images_path'])
+        self.classes = {_ascii_lower(r['nome']): r['id'] for r in conn.execute('SELECT id, nome FROM classes')}
+        self.errors = json.loads(job['errors'] or '[]')
+        self.new_classes = False
+        ignored = [h for h, c in zip(header, self.columns) if h and c not in IMPORT_COLUMNS]
+        if ignored and not job['rows_done']:
+            self.errors.append([1, 'colunas ignoradas: ' + ', '.join(map(str, ignored))])
+
+    def _record(self, values):
+        # linha da planilha -> {coluna: valor já convertido}; célula em branco não altera nada
+        rec = {}
+        for column, value in zip(self.columns, values):
+            text = _cell_text(value)
+            if column not in IMPORT_COLUMNS or not text:
+                continue
+            if column == 'id':
+                try:
+                    rec['id'] = int(text)
+                except ValueError:
+                    raise ValueError(f'id inválido: {text}')
+            elif column == 'preco':
+                try:
+                    rec['preco'] = parse_preco(value)
+                except ValueError:
+                    raise ValueError(f'preço inválido: {text}')
+            elif column == 'ativo':
+                if _ascii_lower(text) not in _ATIVO_VALUES:
+                    raise ValueError(f'ativo inválido: {text} (use 1/0 ou sim/não)')
+                rec['ativo'] = _ATIVO_VALUES[_ascii_lower(text)]
+            else:
+                rec[column] = text
+        return rec
+
+    def _class_id(self, nome):
+        key = _ascii_lower(nome)
+        if key not in self.classes:
+            self.classes[key] = self.conn.execute('INSERT INTO classes (nome) VALUES (?)', (nome,)).lastrowid
+            self.new_classes = True
+        return self.classes[key]
+
+    def _image(self, name):
+        stream = self.images.open(name)
+        if stream is not None:
+            with stream:
+                return store_image(self.conn, stream, name)
+        # caminho do store (planilha exportada daqui): nada a reprocessar
+        row = self.conn.execute('SELECT * FROM images WHERE path=?', (name,)).fetchone()
+        if row is not None:
+            return dict(row)
+        # arquivo antigo em static/ (fora do store): é adotado pelo store
+        full = os.path.normpath(os.path.join('static', name))
+        if full.startswith('static' + os.sep) and os.path.isfile(full):
+            with open(full, 'rb') as f:
+                return store_image(self.conn, f, name)
+        raise ValueError(f'imagem não encontrada: {name}')
+
+    def _lookup(self, column, keys):
+        # {sku ou id: (id, imagem como a exportação escreve)} dos produtos que já existem
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            sql = (f"SELECT p.{column}, p.id, COALESCE(i.path, p.imagem) FROM produtos p "
+                   f"LEFT JOIN images i ON i.hash = p.imagem_hash WHERE p.{column} IN ({','.join('?' * len(chunk))})")
+            found.update((key, (id, imagem)) for key, id, imagem in self.conn.execute(sql, chunk))
+        return found
+
+    def write(self, batch):
+        """Grava um lote [(linha, valores)] e faz o commit. Retorna os jobs de imagem criados."""
+        records = []
+        errors = []
+        for line, values in batch:
+            if not values:
+                continue  # linha em branco: conta no progresso, mas não vira produto
             try:
-                variants = json.loads(rd['imagem_variants'])
-                rd['imagem_srcset'] = build_srcset_from_variants(variants)
-                rd['imagem'] = variants.get('768') or list(variants.values())[0]
-            except Exception:
-                pass
-        produtos.append(rd)
-    conn.close()
-    return render_template('admin_produtos.html', produtos=produtos, q=q, status=status)
+                records.append((line, self._record(values)))
+            except ValueError as e:
+                errors.append([line, str(e)])
+        by_sku = self._lookup('sku', {r['sku'] for _, r in records if r.get('sku')})
+        by_id = self._lookup('id', {r['id'] for _, r in records if r.get('id') and not r.get('sku')})
+        self.new_classes = False
+        updates, inserts, jobs = {}, {}, 0
+        inserted = updated = 0
+        # produtos (id ou sku) com escrita ainda agrupada: se reaparecem no lote, grava antes
+        # o que está pendente, para as linhas valerem na ordem da planilha (a última vence)
+        touched = set()
+
+        def run(sql, rows):
+            # o grupo inteiro num executemany; se alguma linha viola uma restrição (ex.: sku que
+            # já é de outro produto), desfaz o grupo e refaz linha a linha para apontar qual.
+            # Retorna quantas falharam
+            self.conn.execute('SAVEPOINT import_group')
+            failed = 0
+            try:
+                self.conn.executemany(sql, [params for _, params in rows])
+            except sqlite3.IntegrityError:
+                self.conn.execute('ROLLBACK TO import_group')
+                for line, params in rows:
+                    try:
+                        self.conn.execute(sql, params)
+                    except sqlite3.IntegrityError as e:
+                        errors.append([line, f'restrição violada: {e}'])
+                        failed += 1
+            self.conn.execute('RELEASE import_group')
+            return failed
+
+        def flush():
+            nonlocal inserted, updated
+            for columns, rows in updates.items():
+                updated -= run(f"UPDATE produtos SET {', '.join(c + '=?' for c in columns)} WHERE id=?", rows)
+            new_skus = [params[columns.index('sku')] for columns, rows in inserts.items() if 'sku' in columns
+                        for _, params in rows]
+            for columns, rows in inserts.items():
+                inserted -= run(self._insert_sql(columns), rows)
+            by_sku.update(self._lookup('sku', new_skus))
+            updates.clear()
+            inserts.clear()
+            touched.clear()
+
+        for line, rec in records:
+            try:
+                sku = rec.get('sku')
+                if ('sku', sku) in touched:
+                    flush()
+                target, current_image = (by_sku.get(sku) if sku else by_id.get(rec.get('id'))) or (None, None)
+                if target is not None and ('id', target) in touched:
+                    flush()
+                if not sku and rec.get('id') and target is None:
+                    raise ValueError(f"produto {rec['id']} não existe")
+                if target is None and not rec.get('nome'):
+                    raise ValueError('nome obrigatório para um produto novo')
+                fields = {k: v for k, v in rec.items() if k not in ('id', 'classe', 'imagem')}
+                if 'classe' in rec:
+                    fields['class_id'] = self._class_id(rec['classe'])
+                image = None
+                # a mesma imagem que já está no produto (planilha exportada daqui): nada a fazer
+                if rec.get('imagem') and rec['imagem'] != current_image:
+                    image = self._image(rec['imagem'])
+                    (fields['imagem'], fields['imagem_variants'], fields['imagem_meta'],
+                     fields['imagem_status']) = produto_image_fields(image)
+                    fields['imagem_hash'] = image['hash']
+                pending = image is not None and fields['imagem_status'] == 'pending'
+                columns = tuple(fields)
+                if target is not None:
+                    updates.setdefault(columns, []).append((line, [fields[c] for c in columns] + [target]))
+                    touched.add(('id', target))
+                    updated += 1
+                    if pending:
+                        enqueue_image_job(self.conn, 'produto', target, image)
+                        jobs += 1
+                elif pending:
+                    # precisa do id para o job de variantes: este vai sozinho (mesma transação)
+                    target = self.conn.execute(self._insert_sql(columns) + ' RETURNING id',
+                                               [fields[c] for c in columns]).fetchone()[0]
+                    enqueue_image_job(self.conn, 'produto', target, image)
+                    jobs += 1
+                    inserted += 1
+                else:
+                    inserts.setdefault(columns, []).append((line, [fields[c] for c in columns]))
+                    inserted += 1
+                    if sku:
+                        touched.add(('sku', sku))
+                if sku and target is not None:
+                    by_sku[sku] = (target, current_image if image is None else image['path'])
+            except (ValueError, OSError) as e:
+                errors.append([line, str(e)])
+            except sqlite3.IntegrityError as e:
+                errors.append([line, f'restrição violada: {e}'])
+        flush()
+        self.errors.extend(sorted(errors))
+        del self.errors[app.config['IMPORT_MAX_ERRORS']:]
+        self.conn.execute('UPDATE import_jobs SET rows_done=rows_done+?, inserted=inserted+?, updated=updated+?, '
+                          'error_count=error_count+?, errors=?, updated_at=? WHERE id=?',
+                          (len(batch), inserted, updated, len(errors), json.dumps(self.errors, ensure_ascii=False),
+                           time.time(), self.job['id']))
+        self.conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id=1')
+        self.conn.commit()
+        if self.new_classes:
+            fragment_cache.invalidate('classes')
+        return jobs
+
+    @staticmethod
+    def _insert_sql(columns):
+        return f"INSERT INTO produtos ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_import_job(conn, src_path, images_path=None, filename=None, resume=True):
+    """Registra a importação de `src_path` e retorna o id. Com resume, devolve a
+    importação inacabada do mesmo arquivo (mesmo conteúdo), que continua de onde parou."""
+    file_hash = _file_hash(src_path)
+    if resume:
+        row = conn.execute("SELECT id FROM import_jobs WHERE file_hash=? AND status != 'done' ORDER BY id DESC LIMIT 1",
+                           (file_hash,)).fetchone()
+        if row is not None:
+            if images_path:
+                conn.execute('UPDATE import_jobs SET images_path=? WHERE id=?', (os.path.abspath(images_path), row['id']))
+                conn.commit()
+            return row['id']
+    now = time.time()
+    cur = conn.execute('INSERT INTO import_jobs (filename, file_hash, src_path, images_path, created_at, updated_at) '
+                       'VALUES (?,?,?,?,?,?)',
+                       (filename or os.path.basename(src_path), file_hash, os.path.abspath(src_path),
+                        images_path and os.path.abspath(images_path), now, now))
+    conn.commit()
+    return cur.lastrowid
+
+
+def import_job_resumable(job):
+    return job['status'] in ('pending', 'failed') or (
+        job['status'] == 'running' and job['updated_at'] < time.time() - app.config['IMPORT_STALE_SECONDS'])
+
+
+def run_import_job(job_id, db_path=None, on_batch=None):
+    """Executa a importação job_id, ou a retoma pulando as linhas já gravadas.
+    Reivindica o job com um UPDATE atômico (outra thread/worker não roda o mesmo).
+    on_batch(job) é chamado após cada lote. Retorna True se terminou."""
+    conn = connect_db(db_path)
+    try:
+        stale = time.time() - app.config['IMPORT_STALE_SECONDS']
+        cur = conn.execute("UPDATE import_jobs SET status='running', message=NULL, updated_at=? WHERE id=? AND "
+                           "(status IN ('pending', 'failed') OR (status='running' AND updated_at < ?))",
+                           (time.time(), job_id, stale))
+        conn.commit()
+        if not cur.rowcount:
+            return False
+        job = conn.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone()
+        importer = None
+        try:
+            rows = read_table(job['src_path'])
+            header = next(rows, None)
+            if header is None:
+                raise ValueError('planilha vazia')
+            importer = ProductImporter(conn, job, header)
+            batch = []
+            # a linha 1 é o cabeçalho; rows_done conta as linhas de dados já gravadas
+            for line, values in enumerate(rows, start=2):
+                if line - 2 < job['rows_done']:
+                    continue
+                batch.append((line, values if any(_cell_text(v) for v in values) else ()))
+                if len(batch) >= app.config['IMPORT_BATCH_SIZE']:
+                    _write_import_batch(conn, importer, batch, job_id, on_batch)
+                    batch = []
+            if batch:
+                _write_import_batch(conn, importer, batch, job_id, on_batch)
+        except Exception as e:
+            conn.rollback()
+            logging.exception('importação %s falhou', job_id)
+            conn.execute("UPDATE import_jobs SET status='failed', message=?, updated_at=? WHERE id=?",
+                         (str(e), time.time(), job_id))
+            conn.commit()
+            return False
+        finally:
+            if importer is not None:
+                importer.images.close()
+        conn.execute("UPDATE import_jobs SET status='done', finished_at=?, updated_at=? WHERE id=?",
+                     (time.time(), time.time(), job_id))
+        conn.commit()
+        _remove_import_upload(job)
+        return True
+    finally:
+        conn.close()
+
+
+def _write_import_batch(conn, importer, batch, job_id, on_batch):
+    jobs = importer.write(batch)
+    drop_catalog_snapshot()
+    if jobs:
+        image_jobs.dispatch()
+    if on_batch is not None:
+        on_batch(conn.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone())
+
+
+def _remove_import_upload(job):
+    # só o que o admin enviou (IMPORT_DIR/<uuid>/); arquivos passados ao script ficam
+    upload_dir = os.path.dirname(job['src_path'])
+    import_dir = os.path.realpath(app.config['IMPORT_DIR'])
+    if os.path.dirname(os.path.realpath(upload_dir)) == import_dir:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+def start_import(job_id):
+    """Roda a importação numa thread: o request do admin volta na hora e a página acompanha o progresso."""
+    threading.Thread(target=run_import_job, args=(job_id, app.config['DATABASE']),
+                     name=f'soscozinhas-import-{job_id}', daemon=True).start()
+
+
+def export_produtos(conn, status='todos'):
+    """Cabeçalho + uma tupla por produto (mesmas colunas da importação), em ordem de
+    id, lidas do cursor sem materializar. `imagem` é o original no store."""
+    where = ADMIN_STATUS_WHERE.get(status)
+    yield IMPORT_COLUMNS
+    yield from conn.execute('SELECT p.id, p.sku, p.nome, p.descricao, p.preco, p.ativo, c.nome, COALESCE(i.path, p.imagem) '
+                            'FROM produtos p LEFT JOIN classes c ON c.id = p.class_id '
+                            'LEFT JOIN images i ON i.hash = p.imagem_hash' + (f' WHERE {where}' if where else '') +
+                            ' ORDER BY p.id')
+
+
+def export_csv(rows):
+    """CSV em pedaços (para streaming). Com BOM: o Excel reconhece o UTF-8."""
+    buf = io.StringIO()
+    buf.write('\ufeff')
+    writer = csv.writer(buf)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(tuple(row))
+        if n % 500 == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def export_xlsx(rows, fileobj):
+    """Grava as linhas num XLSX em modo write_only (memória constante)."""
+    if openpyxl is None:
+        raise RuntimeError('openpyxl não está instalado: exporte em CSV')
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('produtos')
+    for row in rows:
+        ws.append(tuple(row))
+    wb.save(fileobj)
+
+
+@app.route('/admin/produtos/importar', methods=['GET', 'POST'])
+def admin_produtos_importar():
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    conn = get_db()
+    if request.method == 'POST':
+        planilha = request.files.get('planilha')
+        imagens = request.files.get('imagens')
+        ext = os.path.splitext(secure_filename(planilha.filename if planilha else ''))[1].lower()
+        if ext not in ('.csv', '.xlsx'):
+            flash('Envie uma planilha .csv ou .xlsx')
+            return redirect(url_for('admin_produtos_importar'))
+        upload_dir = os.path.join(app.config['IMPORT_DIR'], uuid.uuid4().hex)
+        os.makedirs(upload_dir, exist_ok=True)
+        src_path = os.path.join(upload_dir, 'planilha' + ext)
+        planilha.save(src_path)
+        images_path = None
+        if imagens and imagens.filename:
+            images_path = os.path.join(upload_dir, 'imagens.zip')
+            imagens.save(images_path)
+            if not zipfile.is_zipfile(images_path):
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                flash('As imagens devem vir num arquivo .zip')
+                return redirect(url_for('admin_produtos_importar'))
+        job_id = create_import_job(conn, src_path, images_path, filename=planilha.filename, resume=False)
+        start_import(job_id)
+        return redirect(url_for('admin_produtos_importar'))
+    jobs = [dict(j, errors=json.loads(j['errors'] or '[]'), resumable=import_job_resumable(j))
+            for j in conn.execute('SELECT * FROM import_jobs ORDER BY id DESC LIMIT 20')]
+    return render_template('admin_importar.html', jobs=jobs, xlsx=openpyxl is not None,
+                           running=any(j['status'] in ('pending', 'running') for j in jobs))
+
+
+@app.route('/admin/produtos/importar/<int:id>/retomar')
+def admin_produtos_importar_retomar(id):
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    job = get_db().execute('SELECT * FROM import_jobs WHERE id=?', (id,)).fetchone()
+    if job and import_job_resumable(job):
+        start_import(id)
+    return redirect(url_for('admin_produtos_importar'))
+
+
+@app.route('/admin/produtos/exportar.<fmt>')
+def admin_produtos_exportar(fmt):
+    if not session.get('admin'):
+        return redirect(url_for('admin_login'))
+    status = request.args.get('status', 'todos')
+    name = f"produtos-{datetime.now():%Y%m%d-%H%M}.{fmt}"
+    if fmt == 'csv':
+        # o cursor fica aberto durante o streaming (a conexão do request só volta ao pool no fim)
+        resp = app.response_class(stream_with_context(export_csv(export_produtos(get_db(), status))),
+                                  mimetype='text/csv')
+        resp.headers['Content-Disposition'] = f'attachment; filename="{name}"'
+        return resp
+    if fmt == 'xlsx' and openpyxl is not None:
+        # o XLSX é um zip: só dá para enviar depois de pronto (em disco acima de 8 MB)
+        out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        export_xlsx(export_produtos(get_db(), status), out)
+        out.seek(0)
+        return send_file(out, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                         as_attachment=True, download_name=name)
+    abort(404)
 
 
 # ------------------ CLASSES (CATEGORIAS) ------------------
@@ -396,11 +3618,10 @@ def admin_classes():
         nome = request.form.get('nome')
         if nome:
             conn.execute('INSERT INTO classes (nome) VALUES (?)', (nome,))
-            conn.commit()
-            conn.close()
+            commit_catalog(conn)
+            fragment_cache.invalidate('classes')
             return redirect(url_for('admin_classes'))
     classes = conn.execute('SELECT * FROM classes ORDER BY nome').fetchall()
-    conn.close()
     return render_template('admin_classes.html', classes=classes)
 
 
@@ -410,8 +3631,8 @@ def admin_classes_excluir(id):
         return redirect(url_for('admin_login'))
     conn = get_db()
     conn.execute('DELETE FROM classes WHERE id=?', (id,))
-    conn.commit()
-    conn.close()
+    commit_catalog(conn)
+    fragment_cache.invalidate('classes')
     return redirect(url_for('admin_classes'))
 
 
@@ -436,6 +3657,9 @@ def admin_theme():
                 json.dump(current,f,ensure_ascii=False,indent=2)
             # update in-memory THEME
             THEME.update(current)
+            # tema aparece em todas as páginas públicas: invalida ETags e snapshot
+            commit_catalog(get_db())
+            fragment_cache.invalidate()
             flash('Tema atualizado com sucesso')
         except Exception as e:
             flash('Erro ao salvar o tema: ' + str(e))
@@ -453,11 +3677,9 @@ def admin_faq():
         resposta = request.form.get('resposta')
         if pergunta and resposta:
             conn.execute('INSERT INTO faq (pergunta,resposta) VALUES (?,?)', (pergunta,resposta))
-            conn.commit()
-        conn.close()
+            commit_catalog(conn)
         return redirect(url_for('admin_faq'))
     faqs = conn.execute('SELECT * FROM faq ORDER BY id DESC').fetchall()
-    conn.close()
     return render_template('admin_faq.html', faqs=faqs)
 
 
@@ -467,18 +3689,15 @@ def admin_faq_excluir(id):
         return redirect(url_for('admin_login'))
     conn = get_db()
     conn.execute('DELETE FROM faq WHERE id=?', (id,))
-    conn.commit()
-    conn.close()
+    commit_catalog(conn)
     return redirect(url_for('admin_faq'))
 
 
 @app.route('/duvidas')
+@conditional_catalog_page
+@cached_page()
 def duvidas():
-    conn = get_db()
-    faqs = conn.execute('SELECT * FROM faq ORDER BY id DESC').fetchall()
-    faqs = [dict(f) for f in faqs]
-    conn.close()
-    return render_template('duvidas.html', faqs=faqs)
+    return render_template('duvidas.html', faqs=get_catalog().faqs)
 
 
 @app.route('/admin/produtos/toggle/<int:id>')
@@ -490,8 +3709,7 @@ def admin_produto_toggle(id):
     if prod:
         novo = 0 if prod['ativo'] == 1 else 1
         conn.execute('UPDATE produtos SET ativo=? WHERE id=?', (novo, id))
-        conn.commit()
-    conn.close()
+        commit_catalog(conn)
     return redirect(url_for('admin_produtos'))
 
 @app.route('/admin/produtos/novo', methods=['GET','POST'])
@@ -501,36 +3719,21 @@ def admin_produto_novo():
     # obter classes para select
     conn = get_db()
     classes = conn.execute('SELECT * FROM classes ORDER BY nome').fetchall()
-    conn.close()
     if request.method=='POST':
         nome = request.form['nome']
         descricao = request.form['descricao']
         preco = request.form['preco']
         class_id = request.form.get('class_id') or None
         imagem_file = request.files.get('imagem')
-        imagem_path = None
-        if imagem_file:
-            filename = secure_filename(imagem_file.filename)
-            # caminho completo onde o arquivo será salvo no sistema
-            full_path = os.path.join(app.config['UPLOAD_FOLDER_PROD'], filename)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            imagem_file.save(full_path)
-            # generate variants and save JSON
-            dest_dir = os.path.join('static', 'uploads', 'produtos')
-            base_name = os.path.splitext(filename)[0]
-            try:
-                variants = generate_image_variants(full_path, dest_dir, base_name)
-                imagem_variants_json = json.dumps(variants)
-                # choose a sensible default image (768)
-                imagem_path = variants.get('768') or list(variants.values())[0]
-            except Exception as e:
-                imagem_variants_json = None
-                imagem_path = os.path.join('uploads', 'produtos', filename).replace('\\', '/')
-        conn = get_db()
-        conn.execute('INSERT INTO produtos (nome,descricao,preco,imagem,class_id,imagem_variants) VALUES (?,?,?,?,?,?)',
-                     (nome,descricao,preco,imagem_path,class_id,imagem_variants_json))
-        conn.commit()
-        conn.close()
+        image = store_upload(conn, imagem_file) if imagem_file else None
+        imagem_path, imagem_variants_json, imagem_meta_json, imagem_status = produto_image_fields(image)
+        cur = conn.execute('INSERT INTO produtos (nome,descricao,preco,imagem,class_id,imagem_variants,imagem_meta,imagem_status,imagem_hash) VALUES (?,?,?,?,?,?,?,?,?)',
+                           (nome,descricao,preco,imagem_path,class_id,imagem_variants_json,imagem_meta_json,imagem_status,image and image['hash']))
+        if imagem_status == 'pending':
+            enqueue_image_job(conn, 'produto', cur.lastrowid, image)
+        commit_catalog(conn)
+        if imagem_status == 'pending':
+            image_jobs.dispatch()
         return redirect(url_for('admin_produtos'))
     return render_template('admin_produto_form.html', produto=None, classes=classes)
 
@@ -541,7 +3744,6 @@ def admin_produto_editar(id):
     conn = get_db()
     produto = conn.execute('SELECT * FROM produtos WHERE id=?',(id,)).fetchone()
     classes = conn.execute('SELECT * FROM classes ORDER BY nome').fetchall()
-    conn.close()
     if request.method=='POST':
         nome = request.form['nome']
         descricao = request.form['descricao']
@@ -551,26 +3753,20 @@ def admin_produto_editar(id):
         # produto['imagem'] armazena o caminho relativo no DB (ex: uploads/produtos/ficheiro.jpg)
         imagem_path = produto['imagem'] if produto else None
         imagem_variants_json = produto['imagem_variants'] if produto and 'imagem_variants' in produto.keys() else None
+        imagem_meta_json = produto['imagem_meta'] if produto else None
+        imagem_status = produto['imagem_status'] if produto else None
+        imagem_hash = produto['imagem_hash'] if produto else None
         if imagem_file:
-            filename = secure_filename(imagem_file.filename)
-            full_path = os.path.join(app.config['UPLOAD_FOLDER_PROD'], filename)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            imagem_file.save(full_path)
-            # generate variants
-            dest_dir = os.path.join('static', 'uploads', 'produtos')
-            base_name = os.path.splitext(filename)[0]
-            try:
-                variants = generate_image_variants(full_path, dest_dir, base_name)
-                imagem_variants_json = json.dumps(variants)
-                imagem_path = variants.get('768') or list(variants.values())[0]
-            except Exception:
-                imagem_path = os.path.join('uploads', 'produtos', filename).replace('\\', '/')
-                imagem_variants_json = imagem_variants_json
-        conn = get_db()
-        conn.execute('UPDATE produtos SET nome=?, descricao=?, preco=?, imagem=?, class_id=?, imagem_variants=? WHERE id=?',
-                     (nome, descricao, preco, imagem_path, class_id, imagem_variants_json, id))
-        conn.commit()
-        conn.close()
+            image = store_upload(conn, imagem_file)
+            imagem_hash = image['hash']
+            imagem_path, imagem_variants_json, imagem_meta_json, imagem_status = produto_image_fields(image)
+            if imagem_status == 'pending':
+                enqueue_image_job(conn, 'produto', id, image)
+        conn.execute('UPDATE produtos SET nome=?, descricao=?, preco=?, imagem=?, class_id=?, imagem_variants=?, imagem_meta=?, imagem_status=?, imagem_hash=? WHERE id=?',
+                     (nome, descricao, preco, imagem_path, class_id, imagem_variants_json, imagem_meta_json, imagem_status, imagem_hash, id))
+        commit_catalog(conn)
+        if imagem_file and imagem_status == 'pending':
+            image_jobs.dispatch()
         return redirect(url_for('admin_produtos'))
     return render_template('admin_produto_form.html', produto=produto, classes=classes)
 
@@ -580,8 +3776,7 @@ def admin_produto_excluir(id):
         return redirect(url_for('admin_login'))
     conn = get_db()
     conn.execute('DELETE FROM produtos WHERE id=?',(id,))
-    conn.commit()
-    conn.close()
+    commit_catalog(conn)
     return redirect(url_for('admin_produtos'))
 
 # ------------------ HERO BANNERS ------------------
@@ -601,23 +3796,19 @@ def admin_hero():
         show_overlay = 1 if request.form.get('show_overlay')=='on' else 0
         show_button = 1 if request.form.get('show_button')=='on' else 0
         imagem_file = request.files.get('imagem')
-        imagem_path = None
-        if imagem_file:
-            filename = secure_filename(imagem_file.filename)
-            # Save original image and preserve original quality (no conversion)
-            full_path = os.path.join(app.config['UPLOAD_FOLDER_HERO'], filename)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            imagem_file.save(full_path)
-            imagem_variants_json = None
-            # store relative path under static/
-            imagem_path = os.path.join('uploads', 'hero', filename).replace('\\', '/')
-        conn = get_db()
-        conn.execute('INSERT INTO hero_banners (titulo,descricao1,descricao2,imagem,imagem_variants,show_overlay,show_button) VALUES (?,?,?,?,?,?,?)',
-                     (titulo, descricao1, descricao2, imagem_path, imagem_variants_json, show_overlay, show_button))
-        conn.commit()
-        conn.close()
+        # original fica guardado no store; a fila gera as variantes AVIF/WebP do banner
+        image = store_upload(conn, imagem_file) if imagem_file else None
+        imagem_path, imagem_variants_json, imagem_meta_json, imagem_status = hero_image_fields(image)
+        cur = conn.execute('INSERT INTO hero_banners (titulo,descricao1,descricao2,imagem,imagem_variants,imagem_meta,show_overlay,show_button,imagem_hash,imagem_status) VALUES (?,?,?,?,?,?,?,?,?,?)',
+                           (titulo, descricao1, descricao2, imagem_path, imagem_variants_json, imagem_meta_json, show_overlay, show_button,
+                            image and image['hash'], imagem_status))
+        if imagem_status == 'pending':
+            enqueue_image_job(conn, 'hero', cur.lastrowid, image)
+        commit_catalog(conn)
+        fragment_cache.invalidate('hero_banners')
+        if imagem_status == 'pending':
+            image_jobs.dispatch()
         return redirect(url_for('admin_hero'))
-    conn.close()
     return render_template('admin_hero.html', hero_banners=hero_banners)
 
 @app.route('/admin/hero/excluir/<int:id>')
@@ -626,8 +3817,8 @@ def admin_hero_excluir(id):
         return redirect(url_for('admin_login'))
     conn = get_db()
     conn.execute('DELETE FROM hero_banners WHERE id=?',(id,))
-    conn.commit()
-    conn.close()
+    commit_catalog(conn)
+    fragment_cache.invalidate('hero_banners')
     return redirect(url_for('admin_hero'))
 
 # ------------------ CONTATO ------------------
@@ -646,10 +3837,9 @@ def admin_contato():
             conn.execute('UPDATE contato SET whatsapp=?, instagram=?, endereco=? WHERE id=?',(whatsapp,instagram,endereco,contato['id']))
         else:
             conn.execute('INSERT INTO contato (whatsapp, instagram, endereco) VALUES (?,?,?)', (whatsapp,instagram,endereco))
-        conn.commit()
-        conn.close()
+        commit_catalog(conn)
+        fragment_cache.invalidate('contato')
         return redirect(url_for('admin_contato'))
-    conn.close()
     return render_template('admin_contato.html', contato=contato)
 
 @app.route('/admin/change_password', methods=['GET','POST'])
@@ -666,13 +3856,11 @@ def admin_change_password():
         conn = get_db()
         admin = conn.execute('SELECT * FROM admin ORDER BY id LIMIT 1').fetchone()
         if not admin or not admin['password'] or not check_password_hash(admin['password'], current):
-            conn.close()
             flash('Senha atual incorreta')
             return redirect(url_for('admin_change_password'))
         new_hashed = generate_password_hash(new)
         conn.execute('UPDATE admin SET password=? WHERE id=?', (new_hashed, admin['id']))
         conn.commit()
-        conn.close()
         flash('Senha alterada com sucesso')
         return redirect(url_for('admin_dashboard'))
     return render_template('admin_change_password.html')
@@ -693,8 +3881,7 @@ def admin_setup_password():
     if not pwd:
         return "Provide ?pwd=NOVASENHA", 400
 
-    db_path = os.path.join(os.path.dirname(__file__), 'database.db')
-    conn = sqlite3.connect(db_path)
+    conn = get_db()
     cur = conn.cursor()
     # garante que exista admin; atualiza se existir, insere se não existir
     cur.execute("SELECT id FROM admin WHERE username=?", ('admin',))
@@ -705,9 +3892,12 @@ def admin_setup_password():
     else:
         cur.execute("INSERT INTO admin (username, password) VALUES (?, ?)", ('admin', hashed))
     conn.commit()
-    conn.close()
     return "Senha do admin atualizada", 200
 
+# processos filhos do pool de imagens (spawn) também importam o app: lá não há templates
+if app.config['TEMPLATE_WARMUP'] and multiprocessing.parent_process() is None:
+    warm_templates()
+
 # garantir fallback seguro se PORT estiver vazia ou inválida
 port_env = os.getenv('PORT')
 try:
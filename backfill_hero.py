@@ -0,0 +1,46 @@
+import sys
+from app2 import app, connect_db, init_db, store_image, hero_image_fields, enqueue_image_job, image_jobs
+
+# Gera as variantes AVIF/WebP responsivas dos banners já cadastrados (os antigos
+# guardavam só o original). Processa a fila aqui mesmo, um banner por vez.
+if '-h' in sys.argv or '--help' in sys.argv:
+    print("Uso: python backfill_hero.py")
+    sys.exit(0)
+
+app.config['IMAGE_WORKERS'] = 0
+
+init_db()
+conn = connect_db()
+rows = conn.execute('SELECT * FROM hero_banners WHERE imagem_variants IS NULL ORDER BY id').fetchall()
+pendentes = 0
+for row in rows:
+    if not row['imagem']:
+        continue
+    src_path = row['imagem']
+    if row['imagem_hash']:
+        stored = conn.execute('SELECT path FROM images WHERE hash=?', (row['imagem_hash'],)).fetchone()
+        if stored:
+            src_path = stored['path']
+    # banners antigos apontam para static/uploads/hero/<nome>: o arquivo é adotado pelo store
+    try:
+        with open(f'static/{src_path}', 'rb') as f:
+            image = store_image(conn, f, src_path)
+    except OSError as e:
+        print(f"banner {row['id']}: não foi possível ler {src_path}: {e}")
+        continue
+    imagem, variants_json, meta_json, status = hero_image_fields(image)
+    conn.execute('UPDATE hero_banners SET imagem=?, imagem_variants=?, imagem_meta=?, imagem_status=?, imagem_hash=? WHERE id=?',
+                 (imagem, variants_json, meta_json, status, image['hash'], row['id']))
+    if status == 'pending':
+        enqueue_image_job(conn, 'hero', row['id'], image)
+        pendentes += 1
+    conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id=1')
+    conn.commit()
+conn.close()
+
+print(f"{pendentes} banner(s) na fila; gerando variantes...")
+image_jobs.dispatch()
+conn = connect_db()
+for row in conn.execute('SELECT id, imagem, imagem_status FROM hero_banners ORDER BY id'):
+    print(f"banner {row['id']}: {row['imagem_status'] or 'ok'}  {row['imagem']}")
+conn.close()
@@ -0,0 +1,36 @@
+import sys
+import json
+from app2 import connect_db, init_db, compute_image_meta
+
+# Preenche imagem_meta (dimensões, LQIP e cor dominante) de produtos e banners
+# cadastrados antes disso. Usa o meta já calculado do store quando existe;
+# senão lê o original do store (ou o arquivo antigo em static/).
+if '-h' in sys.argv or '--help' in sys.argv:
+    print("Uso: python backfill_placeholders.py")
+    sys.exit(0)
+
+init_db()
+conn = connect_db()
+total = 0
+for table in ('produtos', 'hero_banners'):
+    rows = conn.execute(f'''SELECT t.id, t.imagem, t.imagem_hash, i.path AS store_path, i.meta
+                            FROM {table} t LEFT JOIN images i ON i.hash = t.imagem_hash
+                            WHERE t.imagem IS NOT NULL AND t.imagem != '' AND t.imagem_meta IS NULL''').fetchall()
+    for row in rows:
+        meta = row['meta']
+        if meta is None:
+            src_path = row['store_path'] or row['imagem']
+            try:
+                meta = json.dumps(compute_image_meta(f'static/{src_path}'))
+            except (OSError, ValueError) as e:
+                print(f"{table} {row['id']}: não foi possível ler {src_path}: {e}")
+                continue
+            if row['store_path']:
+                conn.execute('UPDATE images SET meta=? WHERE hash=?', (meta, row['imagem_hash']))
+        conn.execute(f'UPDATE {table} SET imagem_meta=? WHERE id=?', (meta, row['id']))
+        total += 1
+    conn.commit()
+conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id=1')
+conn.commit()
+conn.close()
+print(f"{total} imagem(ns) com placeholder")
@@ -0,0 +1,59 @@
+import sys
+import os
+import re
+import glob
+import json
+from app2 import app, connect_db, init_db, store_image, enqueue_image_job, image_jobs, variants_by_format, VARIANT_PROFILES
+
+# Gera os formatos que faltam (AVIF/JPEG) nas variantes dos produtos já cadastrados.
+# Produtos antigos, fora do store, têm o original adotado pelo store. As variantes
+# que já existem no disco são reaproveitadas. A fila é processada aqui mesmo.
+if '-h' in sys.argv or '--help' in sys.argv:
+    print("Uso: python backfill_produtos.py")
+    sys.exit(0)
+
+app.config['IMAGE_WORKERS'] = 0
+formatos = set(VARIANT_PROFILES['produto']['formats'])
+
+
+def original_legado(imagem):
+    # produtos antigos apontam para a variante (ex.: uploads/produtos/coador-768.webp);
+    # o upload original é o arquivo com o mesmo nome sem o sufixo de largura
+    m = re.match(r'(.*)-\d+\.webp$', imagem)
+    if m:
+        for path in sorted(glob.glob(glob.escape(f'static/{m.group(1)}') + '.*')):
+            if not path.endswith('.tmp'):
+                return os.path.relpath(path, 'static').replace('\\', '/')
+    return imagem
+
+
+init_db()
+conn = connect_db()
+rows = conn.execute('''SELECT p.id, p.imagem, p.imagem_hash, i.path AS store_path, i.variants
+                       FROM produtos p LEFT JOIN images i ON i.hash = p.imagem_hash
+                       WHERE p.imagem IS NOT NULL AND p.imagem != '' ORDER BY p.id''').fetchall()
+pendentes = 0
+for row in rows:
+    variants = variants_by_format(json.loads(row['variants'] or '{}').get('produto'))
+    if row['store_path'] and formatos <= set(variants):
+        continue
+    # sem hash: caminho antigo (static/uploads/produtos/...), adotado pelo store
+    src_path = row['store_path'] or original_legado(row['imagem'])
+    try:
+        with open(f'static/{src_path}', 'rb') as f:
+            image = store_image(conn, f, src_path)
+    except OSError as e:
+        print(f"produto {row['id']}: não foi possível ler {src_path}: {e}")
+        continue
+    conn.execute("UPDATE produtos SET imagem_hash=?, imagem_status='pending' WHERE id=?", (image['hash'], row['id']))
+    enqueue_image_job(conn, 'produto', row['id'], image)
+    conn.commit()
+    pendentes += 1
+conn.close()
+
+print(f"{pendentes} produto(s) na fila; gerando variantes...")
+image_jobs.dispatch()
+conn = connect_db()
+for row in conn.execute("SELECT id, imagem, imagem_status FROM produtos WHERE imagem_status IS NOT NULL ORDER BY id"):
+    print(f"produto {row['id']}: {row['imagem_status']}  {row['imagem']}")
+conn.close()
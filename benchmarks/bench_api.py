@@ -0,0 +1,56 @@
+"""API JSON (/api/v1/produtos) vs. renderizar o index.html, e orjson vs json.
+
+Mede por request (sem o cache de páginas, que esconderia o custo de gerar o
+HTML que os bots raspavam) e, à parte, só a serialização de uma página.
+
+Uso: python benchmarks/bench_api.py [N]   (padrão: 2000 produtos)
+"""
+import json
+import sys
+
+from common import app2, seed_catalog, temp_database, timeit
+
+
+def json_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    temp_database()
+    seed_catalog(n)
+    app2.app.config['PAGE_CACHE_MAX_MB'] = 0
+    client = app2.app.test_client()
+    encoders = [('json', json_dumps)] + ([('orjson', app2.orjson.dumps)] if app2.orjson else [])
+    original = app2.api_dumps
+
+    print(f'{n} produtos; por request (mediana / p95 ms, bytes sem compressão)')
+    print(f'{"request":<36}{"mediana":>9}{"p95":>9}{"bytes":>9}')
+    casos = [('HTML /?per_page=48', '/?per_page=48', None)]
+    for nome, fn in encoders:
+        casos += [(f'API per_page=48 ({nome})', '/api/v1/produtos?per_page=48', fn),
+                  (f'API per_page=500 stream ({nome})', '/api/v1/produtos?per_page=500', fn)]
+    try:
+        for rotulo, url, fn in casos:
+            if fn is not None:
+                app2.api_dumps = fn
+            size = len(client.get(url).get_data())
+            r = timeit(lambda: client.get(url).get_data(), repeat=30)
+            print(f'{rotulo:<36}{r["median_ms"]:>9.2f}{r["p95_ms"]:>9.2f}{size:>9}')
+    finally:
+        app2.api_dumps = original
+
+    # só a serialização: 500 produtos já convertidos para dict
+    with app2.app.test_request_context('/'):
+        catalog = app2.get_catalog()
+        page = app2.catalog_listing(catalog, None, 'newest', None, 500)
+        urls = app2.api_urls()
+        itens = [app2.api_produto(p, urls) for p in page]
+    print('\nserializar 500 produtos')
+    for nome, fn in encoders:
+        r = timeit(lambda: fn({'produtos': itens}), repeat=50)
+        print(f'{nome:<36}{r["median_ms"]:>9.2f}{r["p95_ms"]:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
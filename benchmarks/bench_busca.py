@@ -0,0 +1,36 @@
+"""Compara a busca FTS5 (BM25) com o LIKE '%q%' antigo.
+
+Uso: python benchmarks/bench_busca.py [N ...]   (padrão: 10000 100000)
+"""
+import sys
+
+from common import app2, seed_catalog, temp_database, timeit
+
+TERMOS = ['frigideira', 'cacarola', 'inox', 'ferro fundido', 'pan']
+
+
+def like_search(conn, q):
+    like = f'%{q}%'
+    return conn.execute('SELECT * FROM produtos WHERE (nome LIKE ? OR descricao LIKE ?) ORDER BY id DESC',
+                        (like, like)).fetchall()
+
+
+def main():
+    tamanhos = [int(a) for a in sys.argv[1:]] or [10000, 100000]
+    for n in tamanhos:
+        temp_database()
+        seed_catalog(n)
+        conn = app2.connect_db()
+        print(f'\n{n} produtos')
+        print(f'{"termo":<16}{"LIKE ms":>10}{"FTS5 ms":>10}{"LIKE hits":>11}{"FTS5 hits":>11}')
+        for termo in TERMOS:
+            like = timeit(lambda: like_search(conn, termo), repeat=10)
+            fts = timeit(lambda: app2.search_produtos(conn, termo, limit=24), repeat=10)
+            like_hits = len(like_search(conn, termo))
+            fts_hits = app2.search_produtos(conn, termo, limit=1)[1]
+            print(f'{termo:<16}{like["median_ms"]:>10.2f}{fts["median_ms"]:>10.2f}{like_hits:>11}{fts_hits:>11}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Latência da primeira request após o boot, com e sem o cache de templates.
+
+Cada medição é um processo novo (como uma instância recém-criada no host):
+tempo do import do app (inclui o warm-up, quando ligado) e da primeira request
+de cada página. Modos: sem cache nenhum (compila na primeira request), warm-up
+compilando dos fontes, bytecode cache já populado e templates pré-compilados.
+
+Uso: python benchmarks/bench_cold_start.py [processos por modo]   (padrão: 10)
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import ROOT, seed_catalog, temp_database
+
+URLS = ['/', '/produto/1', '/duvidas', '/admin/login']
+
+CHILD = '''
+import json, sys, time
+t = time.perf_counter()
+import app2
+boot = (time.perf_counter() - t) * 1000
+client = app2.app.test_client()
+out = {'boot': boot}
+for url in sys.argv[1:]:
+    t = time.perf_counter()
+    client.get(url).get_data()
+    out[url] = (time.perf_counter() - t) * 1000
+print(json.dumps(out))
+'''
+
+
+def run(env, n):
+    samples = []
+    for _ in range(n):
+        proc = subprocess.run([sys.executable, '-c', CHILD] + URLS, cwd=ROOT, env=env,
+                              capture_output=True, text=True, check=True)
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {k: statistics.median(s[k] for s in samples) for k in samples[0]}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    db = temp_database()
+    # catálogo pequeno: o snapshot do catálogo (montado na 1ª request) não mascara os templates
+    seed_catalog(100)
+    work = tempfile.mkdtemp(prefix='soscozinhas-cold-')
+    base = dict(os.environ, SOSCOZINHAS_DB=db, SOSCOZINHAS_IMAGE_WORKERS='0',
+                SOSCOZINHAS_JINJA_CACHE_DIR='', SOSCOZINHAS_PRECOMPILED_TEMPLATES='')
+    bytecode = dict(base, SOSCOZINHAS_JINJA_CACHE_DIR=os.path.join(work, 'jinja'))
+    compiled = dict(base, SOSCOZINHAS_PRECOMPILED_TEMPLATES=os.path.join(work, 'compiled'))
+    # popula o bytecode cache e gera o pré-compilado antes de medir
+    run(bytecode, 1)
+    subprocess.run([sys.executable, 'compile_templates.py'], cwd=ROOT, env=compiled, check=True, capture_output=True)
+    modos = [
+        ('sem cache', dict(base, SOSCOZINHAS_TEMPLATE_WARMUP='0')),
+        ('warm-up (fontes)', dict(base, SOSCOZINHAS_TEMPLATE_WARMUP='1')),
+        ('bytecode cache', bytecode),
+        ('pré-compilado', compiled),
+    ]
+    print(f'{"modo":<18}{"boot ms":>9}' + ''.join(f'{u:>14}' for u in URLS) + f'{"boot + 1ª /":>13}')
+    for nome, env in modos:
+        r = run(env, n)
+        print(f'{nome:<18}{r["boot"]:>9.1f}' + ''.join(f'{r[u]:>14.1f}' for u in URLS)
+              + f'{r["boot"] + r["/"]:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
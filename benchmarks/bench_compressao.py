@@ -0,0 +1,64 @@
+"""Bytes transferidos e CPU por request de cada codificação (CompressionMiddleware),
+nas páginas públicas do catálogo atual (database.db).
+
+Uso: python benchmarks/bench_compressao.py [repeticoes]   (padrão: 50)
+"""
+import sys
+import time
+
+from common import app2
+
+ENCODINGS = ['identity'] + app2.CompressionMiddleware(None).encodings
+
+
+def paginas(conn):
+    urls = ['/', '/?sort=price_asc', '/?per_page=48', '/duvidas', '/busca?q=panela']
+    row = conn.execute('SELECT id FROM produtos WHERE ativo=1 ORDER BY id LIMIT 1').fetchone()
+    if row:
+        urls.append(f'/produto/{row[0]}')
+    return urls
+
+
+def cpu_ms(fn, repeat):
+    fn()
+    t = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - t) * 1000 / repeat
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    conn = app2.connect_db()
+    urls = paginas(conn)
+    conn.close()
+    client = app2.app.test_client()
+    print(f'{"página":<20}{"codificação":>12}{"bytes":>9}{"% do html":>10}{"CPU ms":>9}{"request ms":>12}')
+    totais = dict.fromkeys(ENCODINGS, 0)
+    for url in urls:
+        html = client.get(url, headers={'Accept-Encoding': 'identity'}).get_data()
+        for enc in ENCODINGS:
+            headers = {'Accept-Encoding': enc}
+            # page cache já aquecido: a diferença entre as linhas é a compressão
+            resp = client.get(url, headers=headers)
+            size = len(resp.get_data())
+            totais[enc] += size
+            if enc == 'identity':
+                compress = 0.0
+            else:
+                level = app2.app.config['COMPRESS_LEVELS'][enc]
+
+                def run():
+                    c = app2._Compressor(enc, level)
+                    c.process(html)
+                    c.finish()
+                compress = cpu_ms(run, repeat)
+            request_ms = cpu_ms(lambda: client.get(url, headers=headers).get_data(), repeat)
+            print(f'{url:<20}{enc:>12}{size:>9}{size * 100 / len(html):>9.0f}%{compress:>9.2f}{request_ms:>12.2f}')
+    print()
+    for enc, total in totais.items():
+        print(f'total {enc:<10}{total:>10} bytes ({total * 100 / totais["identity"]:.0f}%)')
+
+
+if __name__ == '__main__':
+    main()
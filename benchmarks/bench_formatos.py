@@ -0,0 +1,54 @@
+"""Total de bytes que a grade do catálogo atual transfere em cada formato.
+
+Baixa, pela rota /imagem (negociação por Accept), a variante de cada produto
+ativo na largura da grade, como um navegador que aceita cada formato.
+Produtos sem as variantes no store não entram na conta: rode antes
+python backfill_produtos.py.
+
+Uso: python benchmarks/bench_formatos.py [largura]   (padrão: 768)
+"""
+import json
+import sys
+
+from common import app2
+
+ACCEPT = {
+    'avif': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+    'webp': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    'jpeg': 'image/png,image/*;q=0.8,*/*;q=0.5',
+}
+
+
+def main():
+    largura = int(sys.argv[1]) if len(sys.argv) > 1 else 768
+    conn = app2.connect_db()
+    rows = conn.execute('''SELECT p.id, i.hash, i.variants FROM produtos p JOIN images i ON i.hash = p.imagem_hash
+                           WHERE p.ativo = 1''').fetchall()
+    conn.close()
+    hashes, incompletos = [], 0
+    for row in rows:
+        variants = app2.variants_by_format(json.loads(row['variants'] or '{}').get('produto'))
+        if set(ACCEPT) <= set(variants):
+            hashes.append(row['hash'])
+        else:
+            incompletos += 1
+    totais = dict.fromkeys(ACCEPT, 0)
+    client = app2.app.test_client()
+    for image_hash in hashes:
+        for fmt, accept in ACCEPT.items():
+            resp = client.get(f'/imagem/{image_hash}/{largura}', headers={'Accept': accept})
+            expected = app2.IMAGE_FORMATS[fmt][2]
+            assert resp.status_code == 200 and resp.mimetype == expected, (image_hash, fmt, resp.status, resp.mimetype)
+            totais[fmt] += len(resp.get_data())
+            resp.close()
+    print(f'{len(hashes)} produtos ativos com variantes em {largura}px'
+          + (f' ({incompletos} sem todos os formatos ignorados)' if incompletos else ''))
+    print(f'{"formato":<10}{"KB total":>12}{"KB/produto":>12}{"vs JPEG":>10}')
+    for fmt, total in totais.items():
+        n = max(len(hashes), 1)
+        rel = f'{(total / totais["jpeg"] - 1) * 100:+.0f}%' if totais['jpeg'] else '-'
+        print(f'{fmt:<10}{total / 1024:>12.1f}{total / 1024 / n:>12.1f}{rel:>10}')
+
+
+if __name__ == '__main__':
+    main()
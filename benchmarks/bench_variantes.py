@@ -0,0 +1,109 @@
+"""Tempo e pico de memória (RSS) do generate_image_variants atual contra a versão
+antiga (decode completo + LANCZOS a partir do original para cada largura).
+
+Cada execução roda num processo novo para medir o pico de RSS isoladamente.
+Uso: python benchmarks/bench_variantes.py [--sintetica]
+  --sintetica  inclui uma foto JPEG sintética de 24 megapixels (6000x4000)
+"""
+import glob
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from queue import Empty
+
+import common  # noqa: F401  (ajusta sys.path)
+import app2
+from PIL import Image
+
+
+def legacy_generate_image_variants(src_path, dest_dir, base_name):
+    # cópia da implementação anterior, só para comparação
+    sizes = [480, 768, 1024, 1440, 1920, 2560]
+    variants = {}
+    os.makedirs(dest_dir, exist_ok=True)
+    im = Image.open(src_path).convert('RGB')
+    for w in sizes:
+        target_w = min(w, im.width)
+        h = int(target_w * im.height / im.width)
+        im_out = im if target_w == im.width else im.resize((target_w, h), Image.LANCZOS)
+        out_name = f"{base_name}-{target_w}.webp"
+        im_out.save(os.path.join(dest_dir, out_name), 'WEBP', quality=85, method=6)
+        variants[str(target_w)] = out_name
+    return variants
+
+
+def _run(impl, src, queue):
+    fn = legacy_generate_image_variants if impl == 'antiga' else app2.generate_image_variants
+    dest = tempfile.mkdtemp(prefix='bench-variantes-')
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    fn(src, dest, 'bench')
+    elapsed = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    shutil.rmtree(dest, ignore_errors=True)
+    # ru_maxrss é KiB no Linux
+    queue.put((elapsed, base_rss / 1024, peak / 1024))
+
+
+def measure(impl, src, timeout=600):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    p = ctx.Process(target=_run, args=(impl, src, queue))
+    p.start()
+    deadline = time.monotonic() + timeout
+    try:
+        # o filho pode morrer sem responder (OOM, erro de decode): não espera para sempre
+        while True:
+            try:
+                return queue.get(timeout=1)
+            except Empty:
+                if p.exitcode is not None:
+                    try:
+                        return queue.get(timeout=1)  # resultado enviado logo antes de sair
+                    except Empty:
+                        raise RuntimeError(f'processo de medição saiu com código {p.exitcode}') from None
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'sem resultado em {timeout}s')
+    finally:
+        if p.is_alive():
+            p.terminate()
+        p.join()
+
+
+def fontes(sintetica):
+    # só os originais enviados (ignora variantes já geradas: nome-480.webp etc.)
+    files = [f for f in glob.glob(os.path.join(common.ROOT, 'static', 'uploads', '**', '*'), recursive=True)
+             if os.path.isfile(f) and not re.search(r'-\d+\.webp$', f)]
+    if sintetica:
+        path = os.path.join(tempfile.mkdtemp(), 'sintetica-24mp.jpg')
+        Image.radial_gradient('L').resize((6000, 4000)).convert('RGB').save(path, quality=90)
+        files.append(path)
+    return files
+
+
+def main():
+    # MB = pico de RSS do processo; "base" é o RSS só com os imports (app2, Pillow)
+    print(f'{"imagem":<48}{"antiga s":>10}{"nova s":>9}{"base MB":>9}{"antiga MB":>11}{"nova MB":>9}')
+    total = {'antiga': 0.0, 'nova': 0.0}
+    for src in fontes('--sintetica' in sys.argv[1:]):
+        row = {}
+        for impl in ('antiga', 'nova'):
+            try:
+                row[impl] = measure(impl, src)
+            except Exception as e:  # noqa: BLE001
+                print(f'{os.path.basename(src)[:46]:<48}erro: {e}')
+                break
+            total[impl] += row[impl][0]
+        else:
+            (ta, base, ma), (tn, _, mn) = row['antiga'], row['nova']
+            print(f'{os.path.basename(src)[:46]:<48}{ta:>10.2f}{tn:>9.2f}{base:>9.0f}{ma:>11.0f}{mn:>9.0f}')
+    print(f'{"total":<48}{total["antiga"]:>10.2f}{total["nova"]:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Utilitários compartilhados pelos benchmarks (rodar a partir da raiz do projeto)."""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import app2  # noqa: E402
+
+NOMES = ['Frigideira', 'Caçarola', 'Panela', 'Assadeira', 'Coqueteleira', 'Jigger', 'Dosador', 'Coador',
+         'Colher', 'Garfo trinchante', 'Faca', 'Faca de churrasco', 'Liquidificador', 'Fritadeira', 'Chapa',
+         'Fogão', 'Wok', 'Copo long drink', 'Colher bailarina', 'Tábua']
+ADJETIVOS = ['inox', 'antiaderente', 'ferro fundido', 'cerâmica', 'alumínio', 'profissional', 'industrial',
+             'de vidro', 'de cristal', 'com tampa', 'grande', 'pequena', 'premium', 'econômica']
+
+
+def temp_database(name='bench.db'):
+    """Aponta o app para um banco novo (migrado) num diretório temporário."""
+    path = os.path.join(tempfile.mkdtemp(prefix='soscozinhas-bench-'), name)
+    app2.app.config['DATABASE'] = path
+    app2.init_db()
+    return path
+
+
+def seed_catalog(n_produtos, n_classes=20, n_heroes=3, n_faqs=0, seed=42):
+    """Popula o banco atual com um catálogo sintético (determinístico pelo seed)."""
+    rnd = random.Random(seed)
+    conn = app2.connect_db()
+    conn.executemany('INSERT INTO classes (nome) VALUES (?)', [(f'Classe {i:03d}',) for i in range(n_classes)])
+    class_ids = [r[0] for r in conn.execute('SELECT id FROM classes')]
+    variants = '{"480": "uploads/produtos/faca-225.webp", "768": "uploads/produtos/faca-225.webp"}'
+
+    def rows():
+        for i in range(n_produtos):
+            nome = f'{rnd.choice(NOMES)} {rnd.choice(ADJETIVOS)} {i}'
+            descricao = ' '.join(rnd.choice(ADJETIVOS) for _ in range(12))
+            yield (nome, descricao, round(rnd.uniform(5, 2000), 2), 'uploads/produtos/faca.jpg',
+                   1 if rnd.random() < 0.9 else 0, rnd.choice(class_ids), variants)
+
+    conn.executemany('INSERT INTO produtos (nome, descricao, preco, imagem, ativo, class_id, imagem_variants) '
+                     'VALUES (?,?,?,?,?,?,?)', rows())
+    conn.executemany('INSERT INTO hero_banners (titulo, imagem, show_overlay, show_button) VALUES (?,?,1,1)',
+                     [(f'Banner {i}', 'uploads/hero/copos.jfif') for i in range(n_heroes)])
+    conn.executemany('INSERT INTO faq (pergunta, resposta) VALUES (?,?)',
+                     [(f'Pergunta {i}?', ' '.join(rnd.choice(ADJETIVOS) for _ in range(40))) for i in range(n_faqs)])
+    conn.execute('UPDATE catalog_version SET version = version + 1')
+    conn.commit()
+    conn.close()
+
+
+def timeit(fn, repeat=20, warmup=2):
+    """Executa fn várias vezes; retorna dict com mediana/p95 em ms."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return {'median_ms': statistics.median(samples), 'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))]}
@@ -0,0 +1,416 @@
+"""Teste de carga reprodutível da vitrine e do admin.
+
+Para cada tamanho de catálogo (sintético, seed fixo: 60 classes, 5 banners, 20
+perguntas) roda os mesmos cenários de duas formas:
+  client  test client do Flask, sequencial, num processo novo (sem rede)
+  server  servidor WSGI de verdade com vários workers (gunicorn, se instalado;
+          senão o servidor do werkzeug em prefork) e --concorrencia threads
+Cenários: index nos três sorts (1ª página e páginas profundas via cursor),
+produto, dúvidas e revalidação do index (If-None-Match -> 304), como visitante
+anônimo (sem cookie, passando pelo cache de página); busca do /admin/produtos e
+upload de imagem no admin, com a sessão do admin.
+
+Mede throughput, p50/p95/p99 e pico de RSS (soma dos processos do servidor, ou
+do processo do test client) e grava tudo em JSON, junto com o commit e a
+configuração, para comparar entre commits com --comparar.
+
+O banco de cada tamanho é montado num diretório temporário (o database.db do
+projeto não é tocado); uploads também vão para lá. A configuração do app é a de
+sempre (variáveis SOSCOZINHAS_*), herdada pelos processos medidos.
+
+Uso: python benchmarks/loadtest.py [--produtos 1000,10000,100000] [--modos client,server]
+         [--requests 200] [--workers 4] [--concorrencia 8] [--saida loadtest.json]
+         [--comparar anterior.json]
+"""
+import http.client
+import http.cookies
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from importlib.util import find_spec
+from urllib.parse import urlencode
+
+from common import ADJETIVOS, NOMES, ROOT, app2, seed_catalog, temp_database
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN = {'username': 'admin', 'password': 'admin123'}  # criado pelo init_db
+# como um navegador: afeta compressão e negociação de formato de imagem
+HEADERS = {'Accept': 'text/html,application/xhtml+xml,image/avif,image/webp,*/*;q=0.8',
+           'Accept-Encoding': 'br, gzip'}
+DEEP_CURSORS = 20
+PER_PAGE = 12
+
+CLIENT = '''
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import loadtest
+print(json.dumps(loadtest.run_client(*sys.argv[2:])))
+'''
+
+# prefork como o gunicorn: o app é importado uma vez e cada worker herda o socket
+SERVER = '''
+import os, socket, sys
+from werkzeug.serving import WSGIRequestHandler, make_server
+import app2
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+port, workers = int(sys.argv[1]), int(sys.argv[2])
+sock = socket.create_server(('127.0.0.1', port), backlog=256)
+for _ in range(workers):
+    if os.fork() == 0:
+        make_server('127.0.0.1', port, app2.app, request_handler=QuietHandler, fd=sock.fileno()).serve_forever()
+        os._exit(0)
+while True:
+    os.wait()
+'''
+
+
+def option(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def percentile(samples, p):
+    # nearest-rank sobre a lista já ordenada
+    return samples[max(0, min(len(samples) - 1, -(-len(samples) * p // 100) - 1))]
+
+
+def multipart(fields, files):
+    boundary = 'soscozinhas-loadtest'
+    out = io.BytesIO()
+    for name, value in fields.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, mimetype) in files.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                  f'Content-Type: {mimetype}\r\n\r\n'.encode())
+        out.write(data + b'\r\n')
+    out.write(f'--{boundary}--\r\n'.encode())
+    return out.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+def upload_image(i):
+    # bytes diferentes a cada upload: o store deduplica por hash e pularia as variantes
+    from PIL import Image
+    im = Image.radial_gradient('L').resize((1200, 800)).convert('RGB')
+    im.putpixel((i % 1200, i // 1200 % 800), (255, 0, 0))
+    buf = io.BytesIO()
+    im.save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+
+def _repeat(reqs, n):
+    return [reqs[i % len(reqs)] for i in range(max(n, len(reqs)))]
+
+
+def plan(db_path, n_requests, seed=42):
+    """Cenários: [(nome, [(método, url, corpo, content-type)], status esperados, admin)].
+    Só os cenários com admin=True levam o cookie de sessão (com ele a vitrine não usa o
+    cache de página); esperar 304 quer dizer GET condicional: o runner busca o ETag da
+    URL antes e manda If-None-Match. Determinístico dado o banco e o seed; o upload vai
+    por último (muda o catálogo)."""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    ids = [r[0] for r in conn.execute('SELECT id FROM produtos WHERE ativo=1')]
+    scenarios = []
+    for sort in app2.CATALOG_SORTS:
+        scenarios.append((f'index {sort}', _repeat([('GET', f'/?sort={sort}', None, None)], n_requests), (200,), False))
+    for sort in app2.CATALOG_SORTS:
+        # páginas profundas: cursores na segunda metade do catálogo
+        order = app2._SQL_ORDER[sort][0]
+        urls = []
+        for offset in sorted(rnd.randrange(len(ids) // 2, len(ids) - PER_PAGE) for _ in range(DEEP_CURSORS)):
+            offset -= offset % PER_PAGE
+            row = conn.execute(f'SELECT id, preco FROM produtos WHERE ativo=1 ORDER BY {order} LIMIT 1 OFFSET ?',
+                               (offset - 1,)).fetchone()
+            cursor = app2.encode_cursor('n', {'id': row[0], 'preco': row[1]})
+            urls.append(('GET', f'/?{urlencode(dict(cursor=cursor, page=offset // PER_PAGE + 1, sort=sort))}', None, None))
+        scenarios.append((f'index {sort} profundo', _repeat(urls, n_requests), (200,), False))
+    conn.close()
+    scenarios.append(('produto', [('GET', f'/produto/{rnd.choice(ids)}', None, None) for _ in range(n_requests)],
+                      (200,), False))
+    scenarios.append(('duvidas', _repeat([('GET', '/duvidas', None, None)], n_requests), (200,), False))
+    # navegador revalidando a página que já tem em cache
+    scenarios.append(('index condicional', _repeat([('GET', '/', None, None)], n_requests), (304,), False))
+    termos = [rnd.choice(NOMES + ADJETIVOS).split()[0] for _ in range(50)]
+    scenarios.append(('admin busca', _repeat([('GET', f'/admin/produtos?{urlencode(dict(q=t))}', None, None)
+                                              for t in termos], n_requests), (200,), True))
+    uploads = []
+    for i in range(max(10, n_requests // 10)):
+        body, ctype = multipart({'nome': f'Upload {i}', 'descricao': 'teste de carga', 'preco': '99.90'},
+                                {'imagem': (f'upload-{i}.jpg', upload_image(i), 'image/jpeg')})
+        uploads.append(('POST', '/admin/produtos/novo', body, ctype))
+    scenarios.append(('admin upload', uploads, (302,), True))
+    return scenarios
+
+
+# ------------------ MEMÓRIA ------------------
+
+def _rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _group_pids(pgid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    # campos depois do "(comm)": estado, ppid, pgrp...
+                    if int(f.read().rsplit(')', 1)[1].split()[2]) == pgid:
+                        pids.append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+
+class RssSampler:
+    """Pico da soma do RSS de pids_fn() enquanto ativo (só Linux; fora dele, None)."""
+
+    def __init__(self, pids_fn, interval=0.05):
+        self.pids_fn = pids_fn
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak_kb = max(self.peak_kb, sum(_rss_kb(pid) for pid in self.pids_fn()))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_kb / 1024, 1) if os.path.isdir('/proc') else None
+
+
+def summarize(nome, samples, elapsed, errors, rss):
+    samples.sort()
+    return {'cenario': nome, 'requests': len(samples), 'erros': errors, 'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(samples, 50), 2), 'p95_ms': round(percentile(samples, 95), 2),
+            'p99_ms': round(percentile(samples, 99), 2), 'peak_rss_mb': rss.peak_mb}
+
+
+# ------------------ MODOS ------------------
+
+def run_client(db_path, n_requests):
+    """Executado no processo filho (SOSCOZINHAS_DB já aponta para o banco)."""
+    anonimo = app2.app.test_client()
+    admin = app2.app.test_client()
+    admin.post('/admin/login', data=ADMIN)
+    results = []
+    for nome, reqs, ok, is_admin in plan(db_path, int(n_requests)):
+        client = admin if is_admin else anonimo
+        headers = dict(HEADERS)
+        if 304 in ok:
+            headers['If-None-Match'] = client.get(reqs[0][1], headers=HEADERS).headers['ETag']
+        samples, errors = [], 0
+        with RssSampler(lambda: [os.getpid()]) as rss:
+            start = time.perf_counter()
+            for method, url, body, ctype in reqs:
+                t = time.perf_counter()
+                with client.open(url, method=method, data=body, content_type=ctype, headers=headers) as resp:
+                    resp.get_data()
+                samples.append((time.perf_counter() - t) * 1000)
+                errors += resp.status_code not in ok
+            elapsed = time.perf_counter() - start
+        results.append(summarize(nome, samples, elapsed, errors, rss))
+    return results
+
+
+def client_mode(db_path, work, n_requests, env):
+    proc = subprocess.run([sys.executable, '-c', CLIENT, BENCH_DIR, db_path, str(n_requests)],
+                          cwd=work, env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _request(port, method, url, body=None, ctype=None, cookie=None, extra=None):
+    headers = dict(HEADERS, **(extra or {}))
+    if ctype:
+        headers['Content-Type'] = ctype
+    if cookie:
+        headers['Cookie'] = cookie
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request(method, url, body=body, headers=headers)
+        resp = conn.getresponse()
+        resp.read()
+        return resp
+    finally:
+        conn.close()
+
+
+def server_mode(db_path, work, n_requests, workers, concurrency, env):
+    port = _free_port()
+    if find_spec('gunicorn'):
+        server = 'gunicorn'
+        cmd = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+               '--pythonpath', ROOT, 'app2:app']
+    else:
+        server = 'werkzeug-prefork'
+        cmd = [sys.executable, '-c', SERVER, str(port), str(workers)]
+    env = dict(env, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')])))
+    with open(os.path.join(work, 'server.log'), 'wb') as log:
+        proc = subprocess.Popen(cmd, cwd=work, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f'servidor não subiu, ver {work}/server.log')
+                time.sleep(0.1)
+        login = _request(port, 'POST', '/admin/login', urlencode(ADMIN), 'application/x-www-form-urlencoded')
+        cookie = http.cookies.SimpleCookie(login.getheader('Set-Cookie'))
+        admin_cookie = '; '.join(f'{k}={v.value}' for k, v in cookie.items())
+
+        def one(req, cookie=None, extra=None):
+            method, url, body, ctype = req
+            t = time.perf_counter()
+            status = _request(port, method, url, body, ctype, cookie, extra).status
+            return (time.perf_counter() - t) * 1000, status
+
+        results = []
+        with ThreadPoolExecutor(concurrency) as pool:
+            # aquece os workers (snapshot do catálogo, templates) fora da medição
+            list(pool.map(one, [('GET', '/', None, None)] * workers * 2))
+            for nome, reqs, ok, is_admin in plan(db_path, n_requests):
+                extra = {}
+                if 304 in ok:
+                    extra['If-None-Match'] = _request(port, 'GET', reqs[0][1]).getheader('ETag')
+                with RssSampler(lambda: _group_pids(proc.pid)) as rss:
+                    start = time.perf_counter()
+                    done = list(pool.map(lambda req: one(req, admin_cookie if is_admin else None, extra), reqs))
+                    elapsed = time.perf_counter() - start
+                results.append(summarize(nome, [ms for ms, _ in done], elapsed,
+                                         sum(status not in ok for _, status in done), rss))
+        return server, results
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+
+# ------------------ RELATÓRIO ------------------
+
+def git_commit():
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return sha + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(rows):
+    print(f'{"produtos":>9} {"modo":<7}{"cenário":<26}{"req/s":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"RSS MB":>9}{"erros":>7}')
+    for r in rows:
+        print(f'{r["produtos"]:>9} {r["modo"]:<7}{r["cenario"]:<26}{r["rps"]:>9.1f}{r["p50_ms"]:>9.2f}'
+              f'{r["p95_ms"]:>9.2f}{r["p99_ms"]:>9.2f}{r["peak_rss_mb"] or 0:>9.1f}{r["erros"]:>7}')
+
+
+def compare(old, new):
+    print(f'\ncomparado com {old.get("commit")} ({old.get("data")}): p95 e req/s, variação em %')
+    before = {(r['produtos'], r['modo'], r['cenario']): r for r in old['resultados']}
+    for r in new['resultados']:
+        o = before.get((r['produtos'], r['modo'], r['cenario']))
+        if o is None:
+            continue
+        dp95 = (r['p95_ms'] - o['p95_ms']) / o['p95_ms'] * 100 if o['p95_ms'] else 0
+        drps = (r['rps'] - o['rps']) / o['rps'] * 100 if o['rps'] else 0
+        flag = '  <-- regressão?' if dp95 > 20 or drps < -20 else ''
+        print(f'{r["produtos"]:>9} {r["modo"]:<7}{r["cenario"]:<26}{o["p95_ms"]:>9.2f} -> {r["p95_ms"]:<9.2f}'
+              f'{dp95:>+7.0f}%{drps:>+8.0f}% req/s{flag}')
+
+
+def main():
+    if '-h' in sys.argv or '--help' in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+    sizes = [int(n) for n in option('--produtos', '1000,10000').split(',')]
+    modos = option('--modos', 'client,server').split(',')
+    n_requests = int(option('--requests', '200'))
+    workers = int(option('--workers', '4'))
+    concurrency = int(option('--concorrencia', '8'))
+    saida = option('--saida', 'loadtest.json')
+    anterior = option('--comparar', None)
+
+    report = {'commit': git_commit(), 'data': datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'maquina': platform.platform(), 'cpus': os.cpu_count(),
+              'config': {'requests': n_requests, 'workers': workers, 'concorrencia': concurrency,
+                         'page_cache_max_mb': app2.app.config['PAGE_CACHE_MAX_MB'],
+                         'catalog_snapshot_max_products': app2.app.config['CATALOG_SNAPSHOT_MAX_PRODUCTS'],
+                         'image_workers': app2.app.config['IMAGE_WORKERS']},
+              'resultados': []}
+    for n in sizes:
+        t = time.perf_counter()
+        base = temp_database()
+        seed_catalog(n, n_classes=60, n_heroes=5, n_faqs=20)
+        print(f'{n} produtos semeados em {time.perf_counter() - t:.1f}s', file=sys.stderr)
+        for modo in modos:
+            # cada modo parte de uma cópia do banco (os uploads do anterior não contam)
+            work = tempfile.mkdtemp(prefix=f'soscozinhas-load-{modo}-')
+            db = os.path.join(work, 'database.db')
+            shutil.copy(base, db)
+            env = dict(os.environ, SOSCOZINHAS_DB=db)
+            if modo == 'client':
+                rows = client_mode(db, work, n_requests, env)
+            elif modo == 'server':
+                report['config']['servidor'], rows = server_mode(db, work, n_requests, workers, concurrency, env)
+            else:
+                raise SystemExit(f'modo desconhecido: {modo}')
+            report['resultados'] += [dict(r, produtos=n, modo=modo) for r in rows]
+            shutil.rmtree(work, ignore_errors=True)
+        # parcial a cada tamanho: o de 100k demora
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    print_results(report['resultados'])
+    print(f'\nresultados em {saida}')
+    if anterior:
+        with open(anterior, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
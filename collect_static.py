@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import gzip
+import hashlib
+from app2 import app, COMPRESSIBLE_EXTENSIONS, brotli
+
+# Passo de build: grava static/manifest.json com o nome "com hash" de cada arquivo
+# (url_for('static', ...) passa a gerar esse nome, servido com cache imutável) e
+# cria as versões .gz/.br dos arquivos comprimíveis. Rode a cada deploy.
+if '-h' in sys.argv or '--help' in sys.argv:
+    print("Uso: python collect_static.py")
+    sys.exit(0)
+
+static_dir = app.static_folder
+manifest_path = app.config['STATIC_MANIFEST']
+# já endereçados pelo conteúdo (e numerosos): ficam de fora do manifest
+# (caminhos do config são relativos à raiz do projeto, não ao diretório atual)
+skip_dirs = {os.path.abspath(os.path.join(app.root_path, app.config[k])) for k in ('IMAGE_STORE_DIR', 'IMAGE_CACHE_DIR')}
+MIN_COMPRESS_BYTES = 512
+
+
+def compress(path, data):
+    saved = []
+    outputs = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        outputs.append(('.br', brotli.compress(data, quality=11)))
+    for ext, out in outputs:
+        if len(out) < len(data):
+            with open(path + ext, 'wb') as f:
+                f.write(out)
+            saved.append(f'{ext} {len(out)}')
+        elif os.path.exists(path + ext):
+            os.remove(path + ext)
+    return saved
+
+
+manifest = {}
+comprimidos = 0
+for dirpath, dirnames, filenames in os.walk(static_dir):
+    dirnames[:] = [d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in skip_dirs]
+    for name in filenames:
+        full = os.path.join(dirpath, name)
+        if full == manifest_path or name.endswith(('.gz', '.br', '.tmp', '.upload')):
+            continue
+        with open(full, 'rb') as f:
+            data = f.read()
+        rel = os.path.relpath(full, static_dir).replace('\\', '/')
+        stem, ext = os.path.splitext(rel)
+        manifest[rel] = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        if ext.lower() in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_BYTES:
+            saved = compress(full, data)
+            if saved:
+                comprimidos += 1
+                print(f'{rel}: {len(data)} -> ' + ', '.join(saved))
+
+tmp_path = manifest_path + '.tmp'
+with open(tmp_path, 'w', encoding='utf-8') as f:
+    json.dump(manifest, f, ensure_ascii=False, indent=0, sort_keys=True)
+os.replace(tmp_path, manifest_path)
+print(f"{len(manifest)} arquivo(s) no manifest, {comprimidos} comprimido(s)"
+      + ('' if brotli is not None else ' (sem brotli instalado: só .gz)'))
@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import shutil
+from app2 import app, PRECOMPILED_STAMP, templates_digest, _source_loader
+
+# Passo de build: compila templates/ para módulos Python em templates_compiled/
+# (ou SOSCOZINHAS_PRECOMPILED_TEMPLATES). O app carrega deles no boot sem compilar
+# nada, enquanto o build.json bater com os fontes. Rode a cada deploy.
+if '-h' in sys.argv or '--help' in sys.argv:
+    print("Uso: python compile_templates.py [--remove]")
+    sys.exit(0)
+
+target = app.config['PRECOMPILED_TEMPLATES']
+if not target:
+    print("SOSCOZINHAS_PRECOMPILED_TEMPLATES vazio: nada a fazer")
+    sys.exit(1)
+if os.path.exists(target):
+    # só apaga o que este script gerou
+    if os.listdir(target) and not os.path.exists(os.path.join(target, PRECOMPILED_STAMP)):
+        print(f"{target} existe e não foi gerado por compile_templates.py: abortando")
+        sys.exit(1)
+    shutil.rmtree(target)
+if '--remove' in sys.argv:
+    print(f"{target} removido")
+    sys.exit(0)
+
+# compila com o mesmo Environment do app (autoescape, extensões), mas sempre dos fontes
+app.jinja_env.loader = _source_loader
+names = _source_loader.list_templates()
+app.jinja_env.compile_templates(target, zip=None, ignore_errors=False, log_function=None)
+with open(os.path.join(target, PRECOMPILED_STAMP), 'w', encoding='utf-8') as f:
+    json.dump({'templates': templates_digest()}, f)
+print(f"{len(names)} template(s) compilado(s) em {target}")
@@ -0,0 +1,34 @@
+import sys
+from app2 import connect_db, init_db, export_produtos, export_csv, export_xlsx
+
+# Exporta os produtos (mesmas colunas da importação) para CSV ou XLSX, lendo o
+# banco em streaming: serve de snapshot do estoque e pode ser reimportado.
+if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2:
+    print("Uso: python exportar_produtos.py SAIDA.csv|SAIDA.xlsx [--status ativos|inativos|todos]")
+    sys.exit(0)
+
+saida = sys.argv[1]
+status = sys.argv[sys.argv.index('--status') + 1] if '--status' in sys.argv else 'todos'
+
+init_db()
+conn = connect_db()
+exportados = -1  # o cabeçalho não conta
+
+
+def contar(rows):
+    global exportados
+    for row in rows:
+        exportados += 1
+        yield row
+
+
+rows = contar(export_produtos(conn, status))
+if saida.lower().endswith('.xlsx'):
+    with open(saida, 'wb') as f:
+        export_xlsx(rows, f)
+else:
+    with open(saida, 'w', encoding='utf-8', newline='') as f:
+        for chunk in export_csv(rows):
+            f.write(chunk)
+conn.close()
+print(f"{saida}: {exportados} produto(s) exportado(s) ({status})")
@@ -0,0 +1,21 @@
+import sys
+from app2 import connect_db, init_db, collect_unreferenced_images
+
+# Remove do store (static/uploads/img) as imagens que nenhum produto/banner usa mais.
+if '-h' in sys.argv or '--help' in sys.argv:
+    print("Uso: python gc_imagens.py [--dry-run] [--grace SEGUNDOS]")
+    sys.exit(0)
+
+dry_run = '--dry-run' in sys.argv
+grace = None
+if '--grace' in sys.argv:
+    grace = int(sys.argv[sys.argv.index('--grace') + 1])
+
+init_db()
+conn = connect_db()
+removed = collect_unreferenced_images(conn, grace_seconds=grace, dry_run=dry_run)
+conn.close()
+total = sum(freed for _, freed in removed)
+for image_hash, freed in removed:
+    print(f"{'(simulação) ' if dry_run else ''}{image_hash}  {freed / 1024:.0f} KiB")
+print(f"{len(removed)} imagens {'seriam removidas' if dry_run else 'removidas'}, {total / (1024 * 1024):.1f} MiB")
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+from app2 import app, connect_db, init_db, create_import_job, run_import_job, image_jobs
+
+# Importa produtos de uma planilha CSV/XLSX (colunas id, sku, nome, descricao, preco,
+# ativo, classe, imagem), com as imagens num .zip ou numa pasta. Grava em lotes de
+# --lote linhas; se cair no meio, rodar de novo com o mesmo arquivo retoma do último
+# lote gravado (--novo começa do zero). As variantes saem em --workers processos.
+
+
+def option(name, default=None):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+
+def progresso(job):
+    print(f"linhas {job['rows_done']}: {job['inserted']} novos, {job['updated']} atualizados, {job['error_count']} erros",
+          flush=True)
+
+
+def main():
+    if '-h' in sys.argv or '--help' in sys.argv or len(sys.argv) < 2:
+        print("Uso: python importar_produtos.py PLANILHA [--imagens ZIP_OU_PASTA] [--lote N] [--workers N] [--novo]")
+        sys.exit(0)
+    planilha = sys.argv[1]
+    imagens = option('--imagens')
+    app.config['IMPORT_BATCH_SIZE'] = int(option('--lote', app.config['IMPORT_BATCH_SIZE']))
+    app.config['IMAGE_WORKERS'] = int(option('--workers', os.cpu_count() or 2))
+
+    init_db()
+    conn = connect_db()
+    job_id = create_import_job(conn, planilha, imagens, resume='--novo' not in sys.argv)
+    job = conn.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone()
+    conn.close()
+    if job['rows_done']:
+        print(f"retomando a importação {job_id} a partir da linha {job['rows_done'] + 2}")
+
+    ok = run_import_job(job_id, on_batch=progresso)
+    conn = connect_db()
+    job = conn.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone()
+    for linha, msg in json.loads(job['errors'] or '[]')[:50]:
+        print(f"linha {linha}: {msg}")
+    if job['error_count'] > 50:
+        print(f"... e mais {job['error_count'] - 50} erro(s)")
+    if not ok:
+        print(f"importação {job_id} não terminou: {job['message'] or job['status']}. Rode de novo para retomar.")
+    print("gerando variantes das imagens...", flush=True)
+    image_jobs.wait()
+    pendentes = conn.execute("SELECT COUNT(*) FROM produtos WHERE imagem_status='pending'").fetchone()[0]
+    com_erro = conn.execute("SELECT COUNT(*) FROM produtos WHERE imagem_status='error'").fetchone()[0]
+    conn.close()
+    print(f"importação {job_id}: {job['inserted']} novos, {job['updated']} atualizados, {job['error_count']} linhas com erro; "
+          f"imagens pendentes {pendentes}, com erro {com_erro}")
+    sys.exit(0 if ok else 1)
+
+
+# main() protegido: o pool de variantes usa spawn, que reimporta este módulo nos filhos
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app2  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """Banco novo (migrado) num diretório temporário, apontado pelo app."""
+    monkeypatch.setitem(app2.app.config, 'DATABASE', str(tmp_path / 'test.db'))
+    app2.init_db()
+    conn = app2.connect_db()
+    yield conn
+    conn.close()
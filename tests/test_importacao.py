@@ -0,0 +1,34 @@
+"""Importação de produtos (ProductImporter): ordem das linhas e erros dentro de um lote."""
+import app2
+
+
+def importar(conn, tmp_path, csv):
+    src = tmp_path / 'produtos.csv'
+    src.write_text(csv, encoding='utf-8')
+    job_id = app2.create_import_job(conn, str(src))
+    assert app2.run_import_job(job_id)
+    return conn.execute('SELECT * FROM import_jobs WHERE id=?', (job_id,)).fetchone()
+
+
+def test_sku_repetido_no_lote_vale_a_ultima_linha(conn, tmp_path):
+    conn.execute("INSERT INTO produtos (nome, descricao, preco, sku) VALUES ('Antigo', '', 1, 'A1')")
+    conn.commit()
+    job = importar(conn, tmp_path, 'sku,preco,nome\nA1,5,\nA1,6,Novo\nA1,7,\nB1,1,Bx\nB1,2,\nB1,3,By\n')
+
+    assert job['errors'] == '[]'
+    assert (job['inserted'], job['updated']) == (1, 5)
+    produtos = {r['sku']: (r['nome'], r['preco']) for r in conn.execute('SELECT sku, nome, preco FROM produtos')}
+    assert produtos == {'A1': ('Novo', 7), 'B1': ('By', 3)}
+
+
+def test_linha_que_viola_restricao_nao_derruba_o_lote(conn, tmp_path):
+    # produto "Ruim" recusado pelo banco: só a linha dele vira erro, o resto do lote é gravado
+    conn.execute("CREATE TRIGGER recusa BEFORE INSERT ON produtos WHEN new.nome = 'Ruim' "
+                 "BEGIN SELECT RAISE(ABORT, 'nome proibido'); END")
+    conn.commit()
+    job = importar(conn, tmp_path, 'sku,nome,preco\nC1,Bom,1\nC2,Ruim,2\nC3,Outro,3\n')
+
+    assert job['status'] == 'done'
+    assert (job['rows_done'], job['inserted'], job['error_count']) == (3, 2, 1)
+    assert '[[3, "restrição violada' in job['errors']
+    assert [r[0] for r in conn.execute('SELECT sku FROM produtos ORDER BY sku')] == ['C1', 'C3']
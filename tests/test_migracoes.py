@@ -0,0 +1,72 @@
+"""Migrações (PRAGMA user_version) a partir do banco versionado no repositório."""
+import os
+import shutil
+
+import pytest
+
+import app2
+
+BASELINE = os.path.join(os.path.dirname(app2.__file__), 'database.db')
+
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    # cópia do database.db do repositório: schema de antes das migrações (user_version 0)
+    path = str(tmp_path / 'baseline.db')
+    shutil.copy(BASELINE, path)
+    monkeypatch.setitem(app2.app.config, 'DATABASE', path)
+    return path
+
+
+def schema(conn):
+    return conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY type, name').fetchall()
+
+
+def test_migra_o_banco_base_e_e_idempotente(baseline):
+    conn = app2.connect_db()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    produtos = conn.execute('SELECT id, nome, preco FROM produtos ORDER BY id').fetchall()
+    conn.close()
+
+    app2.init_db()
+    conn = app2.connect_db()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == app2.SCHEMA_VERSION == len(app2.MIGRATIONS)
+    # os dados sobrevivem às migrações
+    assert conn.execute('SELECT id, nome, preco FROM produtos ORDER BY id').fetchall() == produtos
+    names = {name for _, name, _ in schema(conn)}
+    assert {'images', 'image_jobs', 'import_jobs', 'catalog_version', 'produtos_fts'} <= names
+    assert {'images_ref_produtos_ai', 'produtos_fts_au', 'catalog_version_touch'} <= names
+    # o FTS foi reconstruído com os produtos que já existiam
+    assert conn.execute('SELECT COUNT(*) FROM produtos_fts').fetchone()[0] == len(produtos)
+    antes = schema(conn), conn.execute('SELECT version FROM catalog_version').fetchall()
+    conn.close()
+
+    # segunda execução: nada muda
+    app2.init_db()
+    conn = app2.connect_db()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == app2.SCHEMA_VERSION
+    assert (schema(conn), conn.execute('SELECT version FROM catalog_version').fetchall()) == antes
+    conn.close()
+
+
+def test_refcount_das_imagens_segue_as_referencias(baseline):
+    app2.init_db()
+    conn = app2.connect_db()
+    conn.execute("INSERT INTO images (hash, path, refcount) VALUES ('h1', 'uploads/img/h1.jpg', 0), "
+                 "('h2', 'uploads/img/h2.jpg', 0)")
+    pid = conn.execute("INSERT INTO produtos (nome, imagem_hash) VALUES ('a', 'h1')").lastrowid
+    conn.execute("INSERT INTO hero_banners (titulo, imagem_hash) VALUES ('b', 'h1')")
+
+    def refcount(h):
+        return conn.execute('SELECT refcount FROM images WHERE hash=?', (h,)).fetchone()[0]
+
+    assert (refcount('h1'), refcount('h2')) == (2, 0)
+    conn.execute("UPDATE produtos SET imagem_hash='h2' WHERE id=?", (pid,))
+    assert (refcount('h1'), refcount('h2')) == (1, 1)
+    conn.execute('DELETE FROM produtos WHERE id=?', (pid,))
+    assert (refcount('h1'), refcount('h2')) == (1, 0)
+    conn.close()
+
+
+def test_banco_vazio_chega_na_ultima_versao(conn):
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == app2.SCHEMA_VERSION
@@ -0,0 +1,81 @@
+"""Paginação keyset da vitrine: cursores no snapshot e direto no SQLite."""
+import random
+
+import pytest
+
+import app2
+
+PER_PAGE = 5
+
+
+@pytest.fixture
+def catalogo(conn):
+    # preços repetidos e NULL (o desempate é o id), produtos inativos e duas classes
+    rnd = random.Random(7)
+    conn.executemany('INSERT INTO classes (nome) VALUES (?)', [('Panelas',), ('Facas',)])
+    precos = [None, None, None, 10.0, 10.0, 10.0, 10.0, 25.5, 25.5, 99.9, 0.0] + [round(rnd.uniform(1, 50), 1) for _ in range(40)]
+    rnd.shuffle(precos)
+    conn.executemany('INSERT INTO produtos (nome, descricao, preco, ativo, class_id) VALUES (?,?,?,?,?)',
+                     [(f'Produto {i}', '', preco, 0 if i % 9 == 4 else 1, 1 + i % 2) for i, preco in enumerate(precos)])
+    conn.execute('UPDATE catalog_version SET version = version + 1')
+    conn.commit()
+    return conn
+
+
+def esperado(conn, class_id, sort):
+    where = 'ativo=1' + (' AND class_id=?' if class_id is not None else '')
+    params = [class_id] if class_id is not None else []
+    return [r[0] for r in conn.execute(f'SELECT id FROM produtos WHERE {where} ORDER BY {app2._SQL_ORDER[sort][0]}',
+                                       params)]
+
+
+def paginador(conn, modo):
+    if modo == 'snapshot':
+        snapshot = app2.build_catalog_snapshot(conn)
+        return lambda class_id, sort, cursor: app2.CatalogPage(*snapshot.page(class_id, sort, cursor, PER_PAGE))
+    return lambda class_id, sort, cursor: app2.sql_catalog_page(conn, class_id, sort, cursor, PER_PAGE)
+
+
+def ler(page):
+    # no modo SQL os cursores só ficam prontos depois de iterar a página
+    ids = [p['id'] for p in page]
+    return ids, app2.decode_cursor(page.next_cursor), app2.decode_cursor(page.prev_cursor)
+
+
+@pytest.mark.parametrize('modo', ['snapshot', 'sql'])
+@pytest.mark.parametrize('sort', app2.CATALOG_SORTS)
+@pytest.mark.parametrize('class_id', [None, 1])
+def test_ida_e_volta_sem_duplicados_nem_buracos(catalogo, modo, sort, class_id):
+    pagina = paginador(catalogo, modo)
+    ordem = esperado(catalogo, class_id, sort)
+    assert len(ordem) > 3 * PER_PAGE
+
+    paginas = []
+    ids, proximo, anterior = ler(pagina(class_id, sort, None))
+    assert anterior is None
+    paginas.append(ids)
+    while proximo is not None:
+        ids, proximo, anterior = ler(pagina(class_id, sort, proximo))
+        assert anterior is not None
+        paginas.append(ids)
+    assert [i for ids in paginas for i in ids] == ordem
+    assert all(len(ids) == PER_PAGE for ids in paginas[:-1])
+
+    # da última página até a primeira pelo cursor "anterior": as mesmas páginas, na ordem inversa
+    for esperada in reversed(paginas[:-1]):
+        ids, proximo, anterior = ler(pagina(class_id, sort, anterior))
+        assert ids == esperada
+        assert proximo is not None
+    assert anterior is None
+
+
+@pytest.mark.parametrize('cursor', ['', 'lixo', '!!!', 'W10', app2.encode_cursor('x', {'preco': 1, 'id': 2}),
+                                    'WyJuIiwxLCJhIl0'])
+def test_cursor_invalido_e_ignorado(cursor):
+    assert app2.decode_cursor(cursor) is None
+
+
+def test_cursor_invalido_mostra_a_primeira_pagina(catalogo):
+    client = app2.app.test_client()
+    primeira = client.get('/?sort=price_asc').get_data()
+    assert client.get('/?sort=price_asc&cursor=lixo').get_data() == primeira